@@ -0,0 +1,540 @@
+"""Build benchmarks for spherex-sphinx configurations.
+
+This script generates synthetic SPHEREx documentation projects and measures
+their cold, incremental, and no-op build times and peak memory with
+``spherexsphinx.conf.base`` and ``spherexsphinx.conf.technote``, in serial
+and parallel (``-j``) modes. The projects are built fully offline.
+
+Generate and build the default projects, writing a results file::
+
+    python benchmarks/benchmark.py run --pages 2000 --jobs 4
+
+Compare two results files::
+
+    python benchmarks/benchmark.py compare before.json after.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import textwrap
+import time
+from datetime import datetime, timezone
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+CONFIGS = ("base", "technote")
+"""Names of the spherex-sphinx configurations that can be benchmarked."""
+
+SCENARIOS = ("cold", "incremental", "noop")
+"""Build scenarios, run in order for each configuration and mode."""
+
+SPHEREX_TOML = """\
+[project]
+title = "Synthetic benchmark project"
+copyright = "2024 California Institute of Technology"
+base_url = "https://spherex-docs.ipac.caltech.edu/benchmark/"
+
+# No intersphinx projects, so the build is offline.
+[sphinx.intersphinx]
+"""
+
+TECHNOTE_TOML = """\
+[technote]
+id = "BENCH-000"
+series_id = "BENCH"
+canonical_url = "https://spherex-docs.ipac.caltech.edu/bench-000/"
+github_url = "https://github.com/SPHEREx/bench-000"
+date_created = 2024-01-01
+
+[[technote.authors]]
+name.given = "Synthetic"
+name.family = "Author"
+"""
+
+BIBFILE_CACHE = ".technote/bibfiles/SPHEREx/spherex-tex/main/texmf/bibtex/bib"
+"""Path of the spherex-tex bibfile cache used by conf.technote, which is
+seeded with a synthetic bibliography so that builds don't download it.
+"""
+
+
+def generate_epilog(n_substitutions: int) -> str:
+    """Generate an ``_rst_epilog.rst`` file with substitutions and links."""
+    lines = [".. _SPHEREx: https://spherex.caltech.edu", ""]
+    for i in range(n_substitutions):
+        lines.append(f".. |sub{i}| replace:: Substitution number {i}")
+        lines.append(f".. _link{i}: https://example.org/link/{i}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_rst_page(
+    i: int, n_pages: int, *, n_substitutions: int = 0, crossref: bool = True
+) -> str:
+    """Generate a reStructuredText page.
+
+    Parameters
+    ----------
+    i
+        Page number.
+    n_pages
+        Total number of pages, for cross references between pages.
+    n_substitutions
+        Number of substitutions and links defined in the epilog, or 0 if
+        there's no epilog.
+    crossref
+        Use ``spherexdoc`` references (from spherexsphinx.conf.base). If
+        `False`, the page has citations for sphinxcontrib-bibtex instead.
+    """
+    title = f"Page {i}"
+    parts = [f"{'#' * len(title)}\n{title}\n{'#' * len(title)}\n"]
+    for section in range(5):
+        heading = f"Section {i}.{section}"
+        if crossref:
+            refs = " ".join(
+                f":spherexdoc:`SSDC-MS-{(i + section + k) % 500:03d}`"
+                for k in range(4)
+            )
+            refs += f" and :spherexdoc:`pipeline <SSDC-PP-{i % 50:03d}>`"
+        else:
+            refs = f":cite:`bench{(i + section) % 500}`"
+        if n_substitutions:
+            sub = (i * 5 + section) % n_substitutions
+            epilog_refs = f"|sub{sub}| links to link{sub}_ and SPHEREx_."
+        else:
+            epilog_refs = ""
+        parts.append(
+            f"{heading}\n{'=' * len(heading)}\n\n"
+            f"See {refs} for details. {epilog_refs}\n\n"
+            "SPHEREx is an all-sky near-infrared spectral survey. "
+            "This paragraph is filler text that exercises the parser with "
+            "*emphasis*, **strong text**, ``literals``, and a "
+            f":doc:`cross reference <page{(i + 1) % n_pages}>`.\n\n"
+            ".. code-block:: python\n\n"
+            f"   def function_{section}(x):\n"
+            "       return x + 1\n"
+        )
+    if i % 10 == 0:
+        parts.append(
+            ".. mermaid::\n\n"
+            "   graph LR\n"
+            f"     A{i} --> B{i}\n"
+            f"     B{i} --> C{i}\n"
+        )
+    return "\n".join(parts)
+
+
+def generate_md_page(i: int, n_pages: int, *, crossref: bool = True) -> str:
+    """Generate a MyST Markdown page."""
+    parts = [f"# Markdown page {i}\n"]
+    for section in range(5):
+        if crossref:
+            ref = f"{{spherexdoc}}`SSDC-MS-{(i + section) % 500:03d}`"
+        else:
+            ref = f"{{cite:p}}`bench{(i + section) % 500}`"
+        parts.append(
+            f"## Section {i}.{section}\n\n"
+            f"See {ref} and {{doc}}`page{(i + 1) % n_pages}`.\n\n"
+            ":::{note}\nA colon-fenced admonition.\n:::\n\n"
+            "```python\nprint('hello')\n```\n"
+        )
+    if i % 10 == 0:
+        parts.append("```{mermaid}\ngraph TD\n  X --> Y\n```\n")
+    return "\n".join(parts)
+
+
+def generate_api_module(i: int, n_members: int) -> str:
+    """Generate a Python module for automodapi, with numpydoc
+    docstrings and type annotations.
+    """
+    parts = [
+        f'"""Synthetic module {i}."""\n',
+        "from __future__ import annotations\n",
+    ]
+    names = []
+    for j in range(n_members):
+        names.extend([f"function{j}", f"Class{j}"])
+        parts.append(
+            textwrap.dedent(
+                f'''
+                def function{j}(x: int, y: float = 1.0) -> float:
+                    """Compute something for member {j}.
+
+                    Parameters
+                    ----------
+                    x
+                        The first value.
+                    y
+                        The second value.
+
+                    Returns
+                    -------
+                    float
+                        The result.
+                    """
+                    return x * y
+
+
+                class Class{j}:
+                    """A synthetic class {j}.
+
+                    Parameters
+                    ----------
+                    value
+                        The initial value.
+                    """
+
+                    def __init__(self, value: int) -> None:
+                        self.value = value
+
+                    def method(self, other: int) -> int:
+                        """Add a value to this value."""
+                        return self.value + other
+                '''
+            )
+        )
+    parts.insert(2, f"__all__ = {names!r}\n")
+    return "\n".join(parts)
+
+
+def generate_project(
+    path: Path,
+    *,
+    config: str,
+    n_pages: int,
+    n_api_modules: int,
+    n_substitutions: int = 200,
+) -> None:
+    """Generate a synthetic documentation project.
+
+    Parameters
+    ----------
+    path
+        Directory for the project, which is replaced if it exists.
+    config
+        The spherex-sphinx configuration: ``"base"`` or ``"technote"``.
+    n_pages
+        Number of content pages. A quarter of them are MyST Markdown.
+    n_api_modules
+        Number of Python modules documented with automodapi.
+    n_substitutions
+        Number of substitutions and links in ``_rst_epilog.rst``.
+    """
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True)
+
+    crossref = config == "base"
+    if not crossref:
+        n_substitutions = 0
+    n_md = n_pages // 4
+    pagenames = [f"page{i}" for i in range(n_pages)]
+    for i in range(n_pages):
+        if i < n_md:
+            path.joinpath(f"page{i}.md").write_text(
+                generate_md_page(i, n_pages, crossref=crossref)
+            )
+        else:
+            path.joinpath(f"page{i}.rst").write_text(
+                generate_rst_page(
+                    i,
+                    n_pages,
+                    n_substitutions=n_substitutions,
+                    crossref=crossref,
+                )
+            )
+
+    if config == "base":
+        path.joinpath("spherex.toml").write_text(SPHEREX_TOML)
+        path.joinpath("_rst_epilog.rst").write_text(
+            generate_epilog(n_substitutions)
+        )
+        path.joinpath("conf.py").write_text(
+            "import sys\n"
+            "from pathlib import Path\n\n"
+            "sys.path.insert(0, str(Path(__file__).parent))\n\n"
+            "from spherexsphinx.conf.base import *  # noqa: F401 F403\n"
+        )
+        package_dir = path / "synthpkg"
+        package_dir.mkdir()
+        package_dir.joinpath("__init__.py").write_text(
+            '"""Synthetic package."""\n'
+        )
+        api_pages = []
+        for i in range(n_api_modules):
+            package_dir.joinpath(f"mod{i}.py").write_text(
+                generate_api_module(i, 10)
+            )
+            path.joinpath(f"api-mod{i}.rst").write_text(
+                f"{'#' * 20}\nModule {i}\n{'#' * 20}\n\n"
+                f".. automodapi:: synthpkg.mod{i}\n"
+            )
+            api_pages.append(f"api-mod{i}")
+        pagenames.extend(api_pages)
+        index_title = "Synthetic benchmark project"
+    else:
+        path.joinpath("technote.toml").write_text(TECHNOTE_TOML)
+        path.joinpath("conf.py").write_text(
+            "from spherexsphinx.conf.technote import *  # noqa: F401 F403\n"
+        )
+        bib_dir = path / BIBFILE_CACHE
+        bib_dir.mkdir(parents=True)
+        bib_dir.joinpath("spherex.bib").write_text(
+            "".join(
+                f"@article{{bench{i},\n"
+                f"  author = {{Author, A. and Author, B.}},\n"
+                f"  title = {{Synthetic article {i}}},\n"
+                f"  journal = {{ApJ}},\n  year = {{2020}},\n}}\n\n"
+                for i in range(500)
+            )
+        )
+        index_title = "Synthetic technote"
+
+    toctree = "\n".join(f"   {name}" for name in pagenames)
+    index = (
+        f"{'#' * len(index_title)}\n{index_title}\n"
+        f"{'#' * len(index_title)}\n\n"
+        f".. toctree::\n   :maxdepth: 1\n\n{toctree}\n"
+    )
+    if not crossref:
+        index += "\nReferences\n==========\n\n.. bibliography::\n"
+    path.joinpath("index.rst").write_text(index)
+
+
+def touch_pages(path: Path, n_changed: int) -> None:
+    """Edit the content of the first ``n_changed`` reStructuredText pages,
+    for an incremental build.
+    """
+    pages = sorted(path.glob("page*.rst"), key=lambda p: int(p.stem[4:]))
+    stamp = time.time()
+    for page in pages[:n_changed]:
+        with page.open("a") as f:
+            f.write(f"\nEdited at {stamp}.\n")
+
+
+def build(path: Path, jobs: int) -> Tuple[float, Optional[int], int]:
+    """Build a project's HTML site in a subprocess.
+
+    Returns
+    -------
+    tuple
+        The wall time in seconds, the peak memory (RSS) of the main
+        sphinx-build process in KiB (`None` if not available), and the
+        process's return code.
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "sphinx",
+        "-b",
+        "html",
+        "-q",
+        "-d",
+        str(path / "_build" / "doctrees"),
+        str(path),
+        str(path / "_build" / "html"),
+    ]
+    if jobs > 1:
+        command.extend(["-j", str(jobs)])
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=path)
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - start
+        returncode = os.waitstatus_to_exitcode(status)
+        maxrss: Optional[int] = rusage.ru_maxrss
+        if sys.platform == "darwin":
+            maxrss = rusage.ru_maxrss // 1024
+    else:
+        returncode = process.wait()
+        elapsed = time.perf_counter() - start
+        maxrss = None
+    return elapsed, maxrss, returncode
+
+
+def get_metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    """Get metadata about the benchmark environment."""
+    packages = {}
+    for package in (
+        "spherex-sphinx",
+        "sphinx",
+        "docutils",
+        "myst-parser",
+        "myst-nb",
+    ):
+        try:
+            packages[package] = version(package)
+        except PackageNotFoundError:
+            packages[package] = None
+    commit = None
+    try:
+        from spherexsphinx.conf._utils import GitRepository
+
+        commit = GitRepository(Path(__file__).parent).head_commit
+    except Exception:
+        pass
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": packages,
+        "parameters": {
+            "pages": args.pages,
+            "api_modules": args.api_modules,
+            "changed_pages": args.changed_pages,
+            "jobs": args.jobs,
+        },
+    }
+
+
+def iter_modes(jobs: int) -> Iterator[Tuple[str, int]]:
+    """Iterate over the build modes (name and number of processes)."""
+    yield "serial", 1
+    if jobs > 1:
+        yield f"parallel-{jobs}", jobs
+
+
+def run(args: argparse.Namespace) -> int:
+    """Run the benchmarks and write a results file."""
+    work_dir = Path(args.work_dir).resolve()
+    configs: List[str] = args.configs
+    if "technote" in configs:
+        try:
+            import technote  # noqa: F401
+        except ImportError:
+            print("Skipping technote: install spherex-sphinx[technote]")
+            configs = [c for c in configs if c != "technote"]
+
+    results: List[Dict[str, Any]] = []
+    failed = False
+    for config in configs:
+        project_dir = work_dir / config
+        for mode, jobs in iter_modes(args.jobs):
+            generate_project(
+                project_dir,
+                config=config,
+                n_pages=args.pages,
+                n_api_modules=args.api_modules if config == "base" else 0,
+            )
+            for scenario in SCENARIOS:
+                if scenario == "incremental":
+                    touch_pages(project_dir, args.changed_pages)
+                seconds, maxrss, returncode = build(project_dir, jobs)
+                failed = failed or returncode != 0
+                result = {
+                    "config": config,
+                    "mode": mode,
+                    "jobs": jobs,
+                    "scenario": scenario,
+                    "seconds": seconds,
+                    "maxrss_kb": maxrss,
+                    "returncode": returncode,
+                }
+                results.append(result)
+                print(
+                    f"{config:9} {mode:12} {scenario:12} "
+                    f"{seconds:8.2f}s {maxrss or 0:>10} KiB"
+                    + ("" if returncode == 0 else f"  (exit {returncode})")
+                )
+
+    output = (
+        Path(args.output)
+        if args.output
+        else (
+            Path(__file__).parent
+            / "results"
+            / f"{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+        )
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(
+        json.dumps(
+            {"metadata": get_metadata(args), "results": results}, indent=2
+        )
+    )
+    print(f"Wrote {output}")
+    return 1 if failed else 0
+
+
+def compare(args: argparse.Namespace) -> int:
+    """Compare the results of two benchmark runs."""
+    before = json.loads(Path(args.before).read_text())["results"]
+    after = json.loads(Path(args.after).read_text())["results"]
+
+    def key(result: Dict[str, Any]) -> Tuple[str, str, str]:
+        return (result["config"], result["mode"], result["scenario"])
+
+    before_by_key = {key(r): r for r in before}
+    print(
+        f"{'config':9} {'mode':12} {'scenario':12} "
+        f"{'before':>9} {'after':>9} {'change':>8}"
+    )
+    for result in after:
+        previous = before_by_key.get(key(result))
+        if previous is None:
+            continue
+        change = (result["seconds"] - previous["seconds"]) / previous[
+            "seconds"
+        ]
+        print(
+            f"{result['config']:9} {result['mode']:12} "
+            f"{result['scenario']:12} {previous['seconds']:8.2f}s "
+            f"{result['seconds']:8.2f}s {change:+8.1%}"
+        )
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmark command-line interface."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument("--pages", type=int, default=2000)
+    run_parser.add_argument("--api-modules", type=int, default=20)
+    run_parser.add_argument(
+        "--changed-pages",
+        type=int,
+        default=10,
+        help="Number of pages edited before the incremental build.",
+    )
+    run_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes for parallel builds (1 to skip them).",
+    )
+    run_parser.add_argument(
+        "--configs", nargs="+", choices=CONFIGS, default=list(CONFIGS)
+    )
+    run_parser.add_argument(
+        "--work-dir",
+        default=str(Path(__file__).parent / "_work"),
+        help="Directory for the generated projects.",
+    )
+    run_parser.add_argument(
+        "--output", help="Path of the results file (JSON)."
+    )
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two results files."
+    )
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+/* Loads the shards of a spherex-sphinx sharded search index on demand.
+ *
+ * This script is prepended to searchindex.js, which is loaded after
+ * Sphinx's searchtools.js. The base index has no terms: the terms of each
+ * shard (grouped by the first characters of the terms) are loaded from
+ * _static/searchindex/ when a query needs them.
+ *
+ * Sphinx also matches query terms of three or more characters anywhere in
+ * the indexed terms ("index" finds "reindex"). The n-gram shards in
+ * _static/searchindex/ngrams/ map each 3-character sequence (n-gram) of
+ * the terms to the shards that have it, so a query first loads the n-gram
+ * shards of its terms, then the shards that have all the n-grams of a
+ * term.
+ *
+ * Before each query, the index gets the terms of the query's shards only,
+ * so the results don't depend on the shards of earlier queries.
+ */
+(() => {
+  const base = document.currentScript.src.replace(/searchindex\.js(\?.*)?$/, "");
+  const pending = {};
+  const loaded = {};
+  const ngramTables = {};
+  let shardInfo = null;
+  let shardKeys = [];
+
+  const shardKey = (term) =>
+    Array.from(
+      new TextEncoder().encode(Array.from(term).slice(0, shardInfo.prefix).join("")),
+      (byte) => byte.toString(16).padStart(2, "0"),
+    ).join("");
+
+  const getNgrams = (term) => {
+    const chars = Array.from(term);
+    const ngrams = [];
+    for (let i = 0; i + shardInfo.ngram <= chars.length; i += 1) {
+      ngrams.push(chars.slice(i, i + shardInfo.ngram).join(""));
+    }
+    return ngrams;
+  };
+
+  // Keys of the shards with terms that contain a term (for Sphinx's
+  // partial matches), once the n-gram shards of the term are loaded.
+  const partialKeys = (term) => {
+    let indexes = null;
+    for (const ngram of getNgrams(term)) {
+      const found = (ngramTables[shardKey(ngram)] || {})[ngram] || [];
+      indexes = indexes === null ? found : indexes.filter((index) => found.includes(index));
+      if (indexes.length === 0) return [];
+    }
+    return (indexes || []).map((index) => shardKeys[index]);
+  };
+
+  const loadScript = (path, digest) => {
+    if (!(path in pending)) {
+      pending[path] = new Promise((resolve) => {
+        const script = document.createElement("script");
+        script.src = `${base}_static/searchindex/${path}.js?v=${digest}`;
+        script.onload = resolve;
+        script.onerror = resolve;
+        document.head.appendChild(script);
+      });
+    }
+    return pending[path];
+  };
+
+  const loadShards = (keys, dir, digests) =>
+    Promise.all(
+      [...new Set(keys)]
+        .filter((key) => key in digests)
+        .map((key) => loadScript(`${dir}${key}`, digests[key])),
+    );
+
+  Search.addShard = (key, shard) => {
+    loaded[key] = shard;
+  };
+
+  Search.addNgramShard = (key, table) => {
+    ngramTables[key] = table;
+  };
+
+  const setIndex = Search.setIndex;
+  Search.setIndex = (index) => {
+    shardInfo = index.shards || null;
+    // The n-gram shards refer to the shards by their index in sorted order.
+    shardKeys = shardInfo ? Object.keys(shardInfo.shards).sort() : [];
+    setIndex(index);
+  };
+
+  const query = Search.query;
+  Search.query = (q) => {
+    if (shardInfo === null) return query(q);
+    let exactKeys;
+    let partialTerms = [];
+    if (typeof Search._parseQuery === "function") {
+      const [, searchTerms, excludedTerms] = Search._parseQuery(q);
+      exactKeys = [...searchTerms, ...excludedTerms].map(shardKey);
+      partialTerms = [...searchTerms].filter((term) => getNgrams(term).length > 0);
+    } else {
+      exactKeys = shardKeys;
+    }
+    let keys;
+    return loadShards(
+      partialTerms.flatMap(getNgrams).map(shardKey),
+      "ngrams/",
+      shardInfo.ngrams || {},
+    )
+      .then(() => {
+        keys = [...new Set([...exactKeys, ...partialTerms.flatMap(partialKeys)])];
+        return loadShards(keys, "", shardInfo.shards);
+      })
+      .then(() => {
+        const terms = {};
+        const titleterms = {};
+        keys.forEach((key) => {
+          if (!(key in loaded)) return;
+          Object.assign(terms, loaded[key].terms);
+          Object.assign(titleterms, loaded[key].titleterms);
+        });
+        Search._index.terms = terms;
+        Search._index.titleterms = titleterms;
+        return query(q);
+      });
+  };
+})();
@@ -0,0 +1,348 @@
+"""Concurrent builds of several SPHEREx documentation projects that share
+the spherex-sphinx caches.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .conf._intersphinx import InventoryCache, get_inventory_url
+from .conf._utils import TECHNOTE_BIBFILE_REPOS
+
+if sys.version_info < (3, 11):
+    import tomli as tomllib
+else:
+    import tomllib
+
+__all__ = [
+    "Project",
+    "BuildResult",
+    "discover_projects",
+    "order_projects",
+    "build_projects",
+    "prefetch_bibfiles",
+]
+
+SKIP_DIRS = {"_build", "node_modules", "__pycache__"}
+"""Names of directories that aren't searched for projects, in addition to
+hidden directories.
+"""
+
+
+@dataclass
+class Project:
+    """A documentation project with a :file:`spherex.toml` or
+    :file:`technote.toml` file.
+    """
+
+    name: str
+    """Name of the project, which is its path relative to the root
+    directory.
+    """
+
+    path: Path
+    """The project directory, which contains :file:`conf.py`."""
+
+    kind: str
+    """Kind of project: ``spherex`` or ``technote``."""
+
+    base_url: Optional[str] = None
+    """Root URL of the published project (``project.base_url`` or
+    ``technote.canonical_url``).
+    """
+
+    intersphinx_urls: List[str] = field(default_factory=list)
+    """URLs of the intersphinx projects of the project."""
+
+    dependencies: List[str] = field(default_factory=list)
+    """Names of the projects whose inventories this project uses."""
+
+    @classmethod
+    def load(cls, path: Path, root: Path) -> Project:
+        """Load a project from its directory."""
+        name = path.relative_to(root).as_posix()
+        if name == ".":
+            name = path.resolve().name
+        toml_path = path / "spherex.toml"
+        if toml_path.is_file():
+            data = tomllib.loads(toml_path.read_text())
+            return cls(
+                name=name,
+                path=path,
+                kind="spherex",
+                base_url=data.get("project", {}).get("base_url"),
+                intersphinx_urls=list(
+                    data.get("sphinx", {})
+                    .get("intersphinx", {})
+                    .get("projects", {})
+                    .values()
+                ),
+            )
+        data = tomllib.loads((path / "technote.toml").read_text())
+        technote = data.get("technote", {})
+        return cls(
+            name=name,
+            path=path,
+            kind="technote",
+            base_url=technote.get("canonical_url"),
+            intersphinx_urls=list(
+                technote.get("sphinx", {})
+                .get("intersphinx", {})
+                .get("projects", {})
+                .values()
+            ),
+        )
+
+
+@dataclass
+class BuildResult:
+    """The outcome of building a project."""
+
+    project: Project
+    """The project."""
+
+    returncode: int
+    """Exit code of sphinx-build."""
+
+    seconds: float
+    """Duration of the build."""
+
+    log_path: Path
+    """Path of the build's console output."""
+
+    @property
+    def succeeded(self) -> bool:
+        """Whether the build succeeded."""
+        return self.returncode == 0
+
+
+def _normalize_url(url: str) -> str:
+    return url.rstrip("/") + "/"
+
+
+def discover_projects(root: Path) -> List[Project]:
+    """Find the documentation projects in a directory tree.
+
+    A project is a directory with a :file:`conf.py` file and either a
+    :file:`spherex.toml` or :file:`technote.toml` file. Hidden directories
+    and build directories aren't searched.
+
+    The `Project.dependencies` of each project are the other projects whose
+    ``base_url`` is the root of one of its intersphinx URLs.
+    """
+    projects: List[Project] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            name
+            for name in dirnames
+            if not name.startswith(".") and name not in SKIP_DIRS
+        )
+        if "conf.py" in filenames and (
+            "spherex.toml" in filenames or "technote.toml" in filenames
+        ):
+            projects.append(Project.load(Path(dirpath), root))
+
+    for project in projects:
+        for other in projects:
+            if other is project or other.base_url is None:
+                continue
+            base_url = _normalize_url(other.base_url)
+            if any(
+                _normalize_url(url).startswith(base_url)
+                for url in project.intersphinx_urls
+            ):
+                project.dependencies.append(other.name)
+    return projects
+
+
+def order_projects(projects: List[Project]) -> Tuple[List[Project], List[str]]:
+    """Sort projects so that each project comes after its dependencies.
+
+    Returns
+    -------
+    tuple
+        The sorted projects, and the names of projects that are in a
+        dependency cycle. Dependencies within a cycle are removed from the
+        projects' `Project.dependencies`, so they're built in name order.
+    """
+    remaining = {project.name: project for project in projects}
+    ordered: List[Project] = []
+    cyclic: List[str] = []
+    while remaining:
+        ready = [
+            project
+            for project in remaining.values()
+            if not any(dep in remaining for dep in project.dependencies)
+        ]
+        if not ready:
+            # Break a cycle by dropping the dependencies of the first
+            # remaining project on the other remaining projects.
+            project = remaining[min(remaining)]
+            cyclic.append(project.name)
+            project.dependencies = [
+                dep for dep in project.dependencies if dep not in remaining
+            ]
+            ready = [project]
+        for project in sorted(ready, key=lambda p: p.name):
+            ordered.append(project)
+            del remaining[project.name]
+    return ordered, cyclic
+
+
+def prefetch_bibfiles(cache_dir: Path) -> None:
+    """Download the technotes' shared BibTeX files into the bibfile cache,
+    so that concurrent technote builds don't download them at the same
+    time.
+
+    This requires documenteer, from the ``technote`` extra.
+    """
+    from documenteer.ext.githubbibcache import BibRepo
+
+    for repo in BibRepo.parse_config(TECHNOTE_BIBFILE_REPOS):
+        repo.load_bibfiles(cache_dir / "bibfiles")
+
+
+def build_project(
+    project: Project,
+    *,
+    builder: str,
+    cache_dir: Path,
+    sphinx_args: Sequence[str] = (),
+) -> BuildResult:
+    """Build a project with sphinx-build in a subprocess.
+
+    The build uses the shared cache directory, with intersphinx inventory
+    prefetching, and its console output is written to
+    :file:`_build/build-all.log` in the project directory.
+    """
+    build_dir = project.path / "_build"
+    build_dir.mkdir(parents=True, exist_ok=True)
+    log_path = build_dir / "build-all.log"
+    env = dict(os.environ)
+    env["SPHEREX_SPHINX_CACHE_DIR"] = str(cache_dir)
+    env["SPHEREX_SPHINX_INTERSPHINX_PREFETCH"] = "1"
+    command = [
+        sys.executable,
+        "-m",
+        "sphinx",
+        "-b",
+        builder,
+        "-d",
+        str(build_dir / "doctrees"),
+        *sphinx_args,
+        ".",
+        str(build_dir / builder),
+    ]
+    start = time.perf_counter()
+    with log_path.open("w") as log:
+        process = subprocess.run(
+            command,
+            cwd=project.path,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return BuildResult(
+        project=project,
+        returncode=process.returncode,
+        seconds=time.perf_counter() - start,
+        log_path=log_path,
+    )
+
+
+def _seed_inventory(
+    result: BuildResult, builder: str, cache_dir: Path
+) -> None:
+    """Store the inventory of a successful build in the intersphinx cache,
+    so that the projects that depend on it use the fresh inventory.
+    """
+    project = result.project
+    inventory_path = project.path / "_build" / builder / "objects.inv"
+    if not result.succeeded or not project.base_url:
+        return
+    if not inventory_path.is_file():
+        return
+    InventoryCache(cache_dir / "intersphinx").store(
+        get_inventory_url(project.base_url), inventory_path.read_bytes()
+    )
+
+
+def build_projects(
+    projects: List[Project],
+    *,
+    jobs: int,
+    cache_dir: Path,
+    builder: str = "html",
+    sphinx_args: Sequence[str] = (),
+    on_start: Optional[Callable[[Project], None]] = None,
+    on_finish: Optional[Callable[[BuildResult], None]] = None,
+) -> List[BuildResult]:
+    """Build projects concurrently, each after its dependencies.
+
+    Parameters
+    ----------
+    projects
+        The projects, sorted with `order_projects`.
+    jobs
+        Maximum number of concurrent builds.
+    cache_dir
+        The shared spherex-sphinx cache directory.
+    builder
+        The Sphinx builder.
+    sphinx_args
+        Additional sphinx-build arguments.
+    on_start
+        Called when a project's build starts.
+    on_finish
+        Called when a project's build finishes.
+
+    Returns
+    -------
+    list
+        The build results, in the order the builds finished. A project is
+        built even if one of its dependencies failed, in which case it uses
+        the inventory of the dependency in the cache (if any).
+    """
+    pending = list(projects)
+    finished: Dict[str, BuildResult] = {}
+    running: Dict[Future[BuildResult], Project] = {}
+    results: List[BuildResult] = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for project in list(pending):
+                if len(running) >= jobs:
+                    break
+                if all(dep in finished for dep in project.dependencies):
+                    pending.remove(project)
+                    if on_start is not None:
+                        on_start(project)
+                    future = executor.submit(
+                        build_project,
+                        project,
+                        builder=builder,
+                        cache_dir=cache_dir,
+                        sphinx_args=sphinx_args,
+                    )
+                    running[future] = project
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                project = running.pop(future)
+                result = future.result()
+                _seed_inventory(result, builder, cache_dir)
+                finished[project.name] = result
+                results.append(result)
+                if on_finish is not None:
+                    on_finish(result)
+    return results
@@ -0,0 +1,476 @@
+"""The spherex-sphinx command-line interface."""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+import click
+
+from . import __version__
+from .buildall import (
+    BuildResult,
+    Project,
+    build_projects,
+    discover_projects,
+    order_projects,
+    prefetch_bibfiles,
+)
+from .conf._utils import get_cache_dir
+from .ext.deploymanifest import (
+    MANIFEST_NAME,
+    DeployManifestError,
+    diff_manifests,
+    load_manifest,
+)
+from .serve import WarmBuilder, make_server, watch
+from .warmcache import (
+    WarmCacheError,
+    compute_fingerprint,
+    restore_cache,
+    save_cache,
+)
+
+__all__ = ["main", "deploy_diff", "build_all", "serve", "cache"]
+
+
+@click.group(context_settings={"help_option_names": ["-h", "--help"]})
+@click.version_option(version=__version__, prog_name="spherex-sphinx")
+def main() -> None:
+    """Tools for SPHEREx Sphinx documentation projects."""
+
+
+@main.command("deploy-diff")
+@click.argument("previous")
+@click.argument(
+    "current",
+    default="_build/html",
+    type=click.Path(exists=True, path_type=Path),
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Output format.",
+)
+@click.option(
+    "--allow-missing",
+    is_flag=True,
+    help=(
+        "Treat a missing previous manifest as empty (all files are added), "
+        "such as for the first deploy."
+    ),
+)
+@click.option(
+    "--upload-list",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help=(
+        "Write the paths of the files to upload (including the manifest) "
+        "to this file, one per line."
+    ),
+)
+@click.option(
+    "--delete-list",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Write the paths of the files to delete to this file, one per line.",
+)
+def deploy_diff(
+    previous: str,
+    current: Path,
+    output_format: str,
+    allow_missing: bool,
+    upload_list: Optional[Path],
+    delete_list: Optional[Path],
+) -> None:
+    """Compare the deploy manifest of a build with the previously deployed
+    one, and list the added (A), changed (M), and removed (D) files.
+
+    PREVIOUS is the path or URL of the deployed deploy-manifest.json file,
+    or of the site or directory that contains it. A URL is a manifest only
+    if its path ends with .json, otherwise it's the site's URL (with or
+    without a trailing slash). CURRENT is the HTML output directory (or its
+    manifest) of the new build.
+    """
+    try:
+        current_files = load_manifest(str(current))
+    except FileNotFoundError:
+        raise click.ClickException(
+            f"Cannot find {MANIFEST_NAME} in {current}. Enable the deploy "
+            f"manifest with [sphinx.deploy] in spherex.toml."
+        )
+    except DeployManifestError as e:
+        raise click.ClickException(str(e))
+
+    try:
+        previous_files = load_manifest(previous)
+    except FileNotFoundError:
+        if not allow_missing:
+            raise click.ClickException(
+                f"Cannot find the previous manifest at {previous}."
+            )
+        previous_files = {}
+    except DeployManifestError as e:
+        raise click.ClickException(str(e))
+
+    diff = diff_manifests(previous_files, current_files)
+
+    if output_format == "json":
+        data = {
+            "added": diff.added,
+            "changed": diff.changed,
+            "removed": diff.removed,
+            "unchanged": diff.unchanged,
+        }
+        click.echo(json.dumps(data, indent=2))
+    else:
+        for status, paths in (
+            ("A", diff.added),
+            ("M", diff.changed),
+            ("D", diff.removed),
+        ):
+            for path in paths:
+                click.echo(f"{status}\t{path}")
+        click.echo(
+            f"{len(diff.added)} added, {len(diff.changed)} changed, "
+            f"{len(diff.removed)} removed, {diff.unchanged} unchanged",
+            err=True,
+        )
+
+    if upload_list is not None:
+        # The new manifest is always uploaded so that the next deploy is
+        # compared with it.
+        paths = [*diff.upload, MANIFEST_NAME]
+        upload_list.write_text("".join(f"{path}\n" for path in paths))
+    if delete_list is not None:
+        delete_list.write_text("".join(f"{path}\n" for path in diff.removed))
+
+
+@main.command("build-all")
+@click.argument(
+    "root",
+    default=".",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.argument("sphinx_args", nargs=-1, type=click.UNPROCESSED)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of concurrent builds. Default is the number of CPUs.",
+)
+@click.option(
+    "-b",
+    "--builder",
+    default="html",
+    show_default=True,
+    help="The Sphinx builder.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help=(
+        "The shared cache directory. Default is SPHEREX_SPHINX_CACHE_DIR "
+        "or _build/.spherex-cache in ROOT."
+    ),
+)
+def build_all(
+    root: Path,
+    sphinx_args: Tuple[str, ...],
+    jobs: Optional[int],
+    builder: str,
+    cache_dir: Optional[Path],
+) -> None:
+    """Build all the documentation projects (directories with conf.py and
+    spherex.toml or technote.toml files) under ROOT concurrently.
+
+    The builds share a cache directory for intersphinx inventories,
+    bibliographies and notebooks. Projects are built after the projects
+    whose intersphinx inventories they use, and read the freshly built
+    inventories. Each project is built into its _build directory, and
+    its console output is written to _build/build-all.log.
+
+    Arguments after "--" are passed to sphinx-build.
+    """
+    start = time.perf_counter()
+    root = root.resolve()
+    cache_dir = (cache_dir or get_cache_dir(root)).resolve()
+    projects, cyclic = order_projects(discover_projects(root))
+    if not projects:
+        raise click.ClickException(f"No documentation projects in {root}.")
+    for name in cyclic:
+        click.echo(
+            f"warning: {name} is in an intersphinx dependency cycle", err=True
+        )
+    jobs = min(jobs or os.cpu_count() or 1, len(projects))
+    click.echo(
+        f"Building {len(projects)} project(s) with {jobs} job(s), "
+        f"using the cache in {cache_dir}"
+    )
+
+    if any(project.kind == "technote" for project in projects):
+        try:
+            prefetch_bibfiles(cache_dir)
+        except Exception as e:
+            click.echo(f"warning: cannot prefetch bibfiles: {e}", err=True)
+
+    def on_start(project: Project) -> None:
+        click.echo(f"started {project.name}")
+
+    def on_finish(result: BuildResult) -> None:
+        status = "finished" if result.succeeded else "FAILED"
+        click.echo(f"{status} {result.project.name} in {result.seconds:.1f}s")
+
+    results = build_projects(
+        projects,
+        jobs=jobs,
+        cache_dir=cache_dir,
+        builder=builder,
+        sphinx_args=sphinx_args,
+        on_start=on_start,
+        on_finish=on_finish,
+    )
+
+    click.echo("")
+    click.echo(format_results(results, root))
+    n_failed = sum(not result.succeeded for result in results)
+    click.echo(
+        f"\n{len(results) - n_failed} succeeded, {n_failed} failed in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+    if n_failed:
+        raise SystemExit(1)
+
+
+def format_results(results: List[BuildResult], root: Path) -> str:
+    """Format build results as a table, in the order of the projects."""
+    rows = [("Project", "Status", "Time", "Log")]
+    for result in sorted(results, key=lambda r: r.project.name):
+        rows.append(
+            (
+                result.project.name,
+                "ok" if result.succeeded else f"failed ({result.returncode})",
+                f"{result.seconds:.1f}s",
+                str(result.log_path.relative_to(root)),
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+    for i, row in enumerate(rows):
+        lines.append(
+            "  ".join(
+                cell.rjust(width) if j == 2 else cell.ljust(width)
+                for j, (cell, width) in enumerate(zip(row, widths))
+            ).rstrip()
+        )
+        if i == 0:
+            lines.append("  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+@main.command("serve")
+@click.argument(
+    "sourcedir",
+    default=".",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+@click.option(
+    "-b",
+    "--builder",
+    default="html",
+    show_default=True,
+    help="The Sphinx builder.",
+)
+@click.option(
+    "--host", default="127.0.0.1", show_default=True, help="Server host."
+)
+@click.option("--port", default=8000, show_default=True, help="Server port.")
+@click.option(
+    "--no-server",
+    is_flag=True,
+    help="Only watch and rebuild, without serving the output.",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.05),
+    default=0.2,
+    show_default=True,
+    help="Seconds between checks for changed files.",
+)
+@click.option(
+    "-q", "--quiet", is_flag=True, help="Hide Sphinx's status messages."
+)
+def serve(
+    sourcedir: Path,
+    builder: str,
+    host: str,
+    port: int,
+    no_server: bool,
+    interval: float,
+    quiet: bool,
+) -> None:
+    """Build the project in SOURCEDIR, rebuild it incrementally when files
+    change, and serve the output with automatic page reloads.
+
+    The Sphinx application stays loaded between builds, so each rebuild
+    only reads the changed documents. Changes to conf.py, spherex.toml,
+    technote.toml or _rst_epilog.rst (unless [sphinx.epilog] is enabled)
+    reload the configuration. The output
+    is written to SOURCEDIR/_build, like a sphinx-build in make mode.
+    """
+    sourcedir = sourcedir.resolve()
+    build_dir = sourcedir / "_build"
+    warm_builder = WarmBuilder(
+        sourcedir,
+        build_dir / builder,
+        build_dir / "doctrees",
+        builder=builder,
+        status=None if quiet else sys.stdout,
+        warning=sys.stderr,
+    )
+
+    if not no_server:
+        server = make_server(warm_builder, host, port)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        click.echo(f"Serving {warm_builder.outdir} at http://{host}:{port}/")
+
+    def on_build(changed: Set[str], seconds: float, succeeded: bool) -> None:
+        status = "rebuilt" if succeeded else "rebuilt with errors"
+        if changed:
+            names = ", ".join(sorted(changed)[:3])
+            if len(changed) > 3:
+                names += f" and {len(changed) - 3} more"
+            click.echo(f"{status} in {seconds:.2f}s after changes to {names}")
+        else:
+            click.echo(f"{status} in {seconds:.2f}s")
+
+    try:
+        watch(warm_builder, interval=interval, on_build=on_build)
+    except KeyboardInterrupt:
+        pass
+
+
+@main.group("cache")
+def cache() -> None:
+    """Save and restore the build state of a project, so that CI builds
+    start from a previous build and only read the changed documents.
+
+    The state is the doctree directory (with the pickled environment), the
+    spherex-sphinx cache directory (with the intersphinx inventories), and
+    the bibliography caches of technotes. Archives are keyed by a
+    fingerprint of the project's configuration.
+    """
+
+
+_sourcedir_argument = click.argument(
+    "sourcedir",
+    default=".",
+    type=click.Path(exists=True, file_okay=False, path_type=Path),
+)
+_build_dir_option = click.option(
+    "--build-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="The build directory. Default is SOURCEDIR/_build.",
+)
+
+
+@cache.command("key")
+@_sourcedir_argument
+@click.option(
+    "--prefix",
+    is_flag=True,
+    help=(
+        "Only print the prefix of the keys with the same configuration, "
+        "for matching the caches of previous commits."
+    ),
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["text", "json"]),
+    default="text",
+    show_default=True,
+    help="Output format. JSON includes the fingerprint's components.",
+)
+def cache_key(sourcedir: Path, prefix: bool, output_format: str) -> None:
+    """Print the cache key of the project in SOURCEDIR, which combines the
+    configuration fingerprint and the Git commit.
+    """
+    fingerprint = compute_fingerprint(sourcedir)
+    if output_format == "json":
+        data = {
+            "key": fingerprint.key,
+            "prefix": fingerprint.prefix,
+            "fingerprint": fingerprint.digest,
+            "commit": fingerprint.commit,
+            "components": fingerprint.components,
+        }
+        click.echo(json.dumps(data, indent=2))
+    else:
+        click.echo(fingerprint.prefix if prefix else fingerprint.key)
+
+
+@cache.command("save")
+@click.argument(
+    "archive", type=click.Path(dir_okay=False, writable=True, path_type=Path)
+)
+@_sourcedir_argument
+@_build_dir_option
+def cache_save(
+    archive: Path, sourcedir: Path, build_dir: Optional[Path]
+) -> None:
+    """Save the build state of the project in SOURCEDIR to ARCHIVE (a
+    .tar.gz file).
+    """
+    try:
+        fingerprint = save_cache(sourcedir, archive, build_dir=build_dir)
+    except WarmCacheError as e:
+        raise click.ClickException(str(e))
+    size = archive.stat().st_size / 1e6
+    click.echo(f"Saved {archive} ({size:.1f} MB) for {fingerprint.key}")
+
+
+@cache.command("restore")
+@click.argument("archive", type=click.Path(dir_okay=False, path_type=Path))
+@_sourcedir_argument
+@_build_dir_option
+@click.option(
+    "--strict",
+    is_flag=True,
+    help="Exit with an error if the archive isn't restored.",
+)
+def cache_restore(
+    archive: Path, sourcedir: Path, build_dir: Optional[Path], strict: bool
+) -> None:
+    """Restore the build state of the project in SOURCEDIR from ARCHIVE.
+
+    The archive is only restored if its configuration fingerprint matches
+    the project's. Otherwise nothing is changed, and the next build is a
+    clean build. The modification times of the files that are unchanged
+    since the archived build are restored, so Sphinx only reads the
+    documents that changed.
+    """
+    result = restore_cache(sourcedir, archive, build_dir=build_dir)
+    if not result.restored:
+        message = f"Not restoring the build cache: {result.reason}"
+        if strict:
+            raise click.ClickException(message)
+        click.echo(message, err=True)
+        return
+    commit = f" of commit {result.commit[:12]}" if result.commit else ""
+    click.echo(
+        f"Restored the build state{commit}: {result.unchanged} unchanged "
+        f"file(s), {len(result.changed)} changed"
+    )
+    for path in result.changed:
+        click.echo(f"M\t{path}")
@@ -0,0 +1,316 @@
+"""Selection of the optional Sphinx extensions that a project's sources
+use.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sphinx.util import logging
+
+from .. import __version__
+from ._utils import get_cache_dir, get_project_key
+
+__all__ = [
+    "ExtensionRule",
+    "EXTENSION_RULES",
+    "SourceScan",
+    "scan_sources",
+    "select_extensions",
+]
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ExtensionRule:
+    """The conditions under which an optional extension is needed."""
+
+    suffixes: Tuple[str, ...] = ()
+    """Source file suffixes that the extension parses."""
+
+    names: Tuple[str, ...] = ()
+    """Glob patterns of the directive and role names that the extension
+    provides.
+    """
+
+    requires: Tuple[str, ...] = ()
+    """Extensions that need this extension when they're enabled."""
+
+
+_AUTODOC = ("auto*",)
+"""Directive names of autodoc, whose docstrings use napoleon and typehints.
+"""
+
+EXTENSION_RULES: Dict[str, ExtensionRule] = {
+    "myst_parser": ExtensionRule(suffixes=(".md", ".txt")),
+    "myst_nb": ExtensionRule(suffixes=(".md", ".txt", ".ipynb")),
+    "spherexsphinx.ext.nbexec": ExtensionRule(suffixes=(".ipynb",)),
+    "spherexsphinx.ext.nbimages": ExtensionRule(
+        suffixes=(".md", ".txt", ".ipynb")
+    ),
+    "sphinx_click": ExtensionRule(names=("click",)),
+    "sphinxcontrib.mermaid": ExtensionRule(names=("mermaid", "autoclasstree")),
+    "sphinx_automodapi.automodapi": ExtensionRule(
+        names=("automodapi", "automodsumm", "automod-diagram")
+    ),
+    "sphinx_automodapi.smart_resolver": ExtensionRule(
+        requires=("sphinx_automodapi.automodapi",)
+    ),
+    "sphinx.ext.napoleon": ExtensionRule(
+        names=_AUTODOC, requires=("sphinx_automodapi.automodapi",)
+    ),
+    "sphinx_autodoc_typehints": ExtensionRule(
+        names=_AUTODOC, requires=("sphinx_automodapi.automodapi",)
+    ),
+    "sphinx.ext.doctest": ExtensionRule(
+        # Docstrings included by automodapi can have doctests.
+        names=("doctest", "test*"),
+        requires=("sphinx_automodapi.automodapi",),
+    ),
+    "sphinx_design": ExtensionRule(
+        names=(
+            "grid*",
+            "card*",
+            "tab-*",
+            "dropdown",
+            "button-*",
+            "bdg*",
+            "octicon",
+            "article-info",
+        )
+    ),
+    "sphinx_prompt": ExtensionRule(names=("prompt",)),
+    "sphinxcontrib.bibtex": ExtensionRule(
+        names=("bibliography", "footbibliography", "cite*", "footcite*")
+    ),
+    "documenteer.ext.githubbibcache": ExtensionRule(
+        requires=("sphinxcontrib.bibtex",)
+    ),
+    "spherexsphinx.ext.bibcache": ExtensionRule(
+        requires=("sphinxcontrib.bibtex",)
+    ),
+}
+"""Rules for the optional extensions of the spherex-sphinx configurations.
+
+Extensions that aren't listed here are always enabled.
+"""
+
+SCAN_SUFFIXES = {".rst", ".md", ".txt", ".ipynb", ".inc"}
+"""Suffixes of the files that are scanned for directive and role names."""
+
+SKIP_DIRS = {"_build", "node_modules", "__pycache__", "venv"}
+"""Names of directories that aren't scanned, in addition to hidden
+directories.
+"""
+
+CACHE_DIR_NAME = "extensions"
+"""Name of the directory of the scan caches (one per source directory) in
+the spherex-sphinx cache directory.
+"""
+
+_NAME_PATTERN = re.compile(
+    # reStructuredText directives (".. name::") and roles (":name:`"),
+    # and MyST directives and roles ("{name}").
+    r"\.\.[ \t]+([\w:.+-]+)::"
+    r"|(?<![\w`]):([\w:.+-]+):`"
+    r"|\{([\w:.+-]+)\}"
+)
+
+
+@dataclass
+class SourceScan:
+    """The suffixes and markup names found in a source tree."""
+
+    suffixes: Set[str]
+    """Suffixes of the scanned files."""
+
+    names: Set[str]
+    """Directive and role names used in the scanned files. Names may
+    include false positives, which only cause extensions to be enabled.
+    """
+
+    scanned: int = 0
+    """Number of files that were read, rather than taken from the cache."""
+
+
+def _find_names(text: str) -> Set[str]:
+    names = set()
+    for match in _NAME_PATTERN.finditer(text):
+        name = match.group(1) or match.group(2) or match.group(3)
+        names.add(name.lower())
+    return names
+
+
+def scan_sources(
+    srcdir: Path, cache_path: Optional[Path] = None
+) -> SourceScan:
+    """Find the source file suffixes and the directive and role names used
+    in a source tree.
+
+    Parameters
+    ----------
+    srcdir
+        The source directory.
+    cache_path
+        Path of a JSON cache of the names found in each file, keyed by the
+        file's path, size and modification time. Only new and modified
+        files are read again. The cache is best-effort.
+
+    Returns
+    -------
+    SourceScan
+        The suffixes and names.
+    """
+    cache: Dict[str, List] = {}
+    if cache_path is not None:
+        try:
+            data = json.loads(cache_path.read_text())
+            if data.get("version") == __version__:
+                cache = data["files"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    files: Dict[str, List] = {}
+    suffixes: Set[str] = set()
+    names: Set[str] = set()
+    scanned = 0
+    for dirpath, dirnames, filenames in os.walk(srcdir):
+        dirnames[:] = [
+            name
+            for name in dirnames
+            if not name.startswith(".") and name not in SKIP_DIRS
+        ]
+        for filename in filenames:
+            suffix = os.path.splitext(filename)[1].lower()
+            if suffix not in SCAN_SUFFIXES:
+                continue
+            path = os.path.join(dirpath, filename)
+            relpath = Path(path).relative_to(srcdir).as_posix()
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            suffixes.add(suffix)
+            cached = cache.get(relpath)
+            if cached is not None and cached[:2] == [
+                stat.st_size,
+                stat.st_mtime_ns,
+            ]:
+                entry = cached
+            else:
+                try:
+                    with open(path, encoding="utf-8", errors="replace") as f:
+                        text = f.read()
+                except OSError:
+                    continue
+                entry = [
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    sorted(_find_names(text)),
+                ]
+                scanned += 1
+            files[relpath] = entry
+            names.update(entry[2])
+
+    if cache_path is not None and (scanned or files.keys() != cache.keys()):
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically because parallel builds may share the cache.
+            tmp_path = cache_path.with_name(
+                f"{cache_path.name}.{os.getpid()}.tmp"
+            )
+            tmp_path.write_text(
+                json.dumps({"version": __version__, "files": files})
+            )
+            tmp_path.replace(cache_path)
+        except OSError:
+            pass
+    return SourceScan(suffixes=suffixes, names=names, scanned=scanned)
+
+
+def _is_needed(rule: ExtensionRule, scan: SourceScan) -> bool:
+    if scan.suffixes.intersection(rule.suffixes):
+        return True
+    return any(
+        fnmatch(name, pattern) for pattern in rule.names for name in scan.names
+    )
+
+
+def select_extensions(
+    extensions: List[str],
+    srcdir: Optional[Path] = None,
+    *,
+    keep: Iterable[str] = (),
+    rules: Optional[Dict[str, ExtensionRule]] = None,
+) -> List[str]:
+    """Select the extensions that the sources of a project need.
+
+    Extensions with a rule in `EXTENSION_RULES` are only kept if the
+    project has sources with the suffixes they parse, uses their directives
+    or roles, or if an enabled extension requires them. Other extensions
+    are always kept.
+
+    Parameters
+    ----------
+    extensions
+        The configured extensions.
+    srcdir
+        The source directory. Default is the current working directory,
+        which is the documentation directory while Sphinx executes conf.py.
+    keep
+        Extensions to keep regardless of the sources, such as the ones that
+        the project adds explicitly.
+    rules
+        The rules of the optional extensions. Default is `EXTENSION_RULES`.
+
+    Returns
+    -------
+    list
+        The selected extensions, in their original order.
+    """
+    if srcdir is None:
+        srcdir = Path.cwd()
+    if rules is None:
+        rules = EXTENSION_RULES
+    # Projects can share the cache directory, so each source directory has
+    # its own scan cache.
+    scan = scan_sources(
+        srcdir,
+        get_cache_dir(srcdir)
+        / CACHE_DIR_NAME
+        / f"{get_project_key(srcdir)}.json",
+    )
+
+    keep = set(keep)
+    enabled = {
+        name
+        for name in extensions
+        if name not in rules or name in keep or _is_needed(rules[name], scan)
+    }
+    # Add the extensions that enabled extensions require, until no more are
+    # added.
+    added = True
+    while added:
+        added = False
+        for name in extensions:
+            if name not in enabled and any(
+                required in enabled for required in rules[name].requires
+            ):
+                enabled.add(name)
+                added = True
+
+    selected = [name for name in extensions if name in enabled]
+    skipped = [name for name in extensions if name not in enabled]
+    if skipped:
+        logger.info(
+            "skipping extensions that the sources don't use: %s",
+            ", ".join(skipped),
+        )
+    return selected
@@ -0,0 +1,323 @@
+"""Prefetching and caching of intersphinx inventories."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.error import HTTPError
+
+from sphinx.util import logging
+
+from .. import __version__
+
+__all__ = [
+    "CachedInventory",
+    "InventoryCache",
+    "get_inventory_url",
+    "is_offline",
+    "is_prefetch_forced",
+]
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_HEADER = b"# Sphinx inventory version"
+"""The first bytes of a valid Sphinx inventory file."""
+
+
+def is_offline() -> bool:
+    """Check if network access is disabled with the
+    ``SPHEREX_SPHINX_OFFLINE`` environment variable.
+    """
+    value = os.environ.get("SPHEREX_SPHINX_OFFLINE", "")
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def is_prefetch_forced() -> bool:
+    """Check if inventory prefetching is enabled for all projects with the
+    ``SPHEREX_SPHINX_INTERSPHINX_PREFETCH`` environment variable, which is
+    set by ``spherex-sphinx build-all``.
+    """
+    value = os.environ.get("SPHEREX_SPHINX_INTERSPHINX_PREFETCH", "")
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def get_inventory_url(url: str) -> str:
+    """Get the URL of the ``objects.inv`` inventory of a project, given the
+    project's root URL.
+    """
+    return f"{url.rstrip('/')}/objects.inv"
+
+
+@dataclass
+class CachedInventory:
+    """Metadata about an inventory in the cache."""
+
+    url: str
+    """URL of the inventory file."""
+
+    sha256: str
+    """SHA-256 digest of the inventory content, which is also the name of
+    the cached inventory file.
+    """
+
+    fetched: float
+    """When the inventory was last fetched or revalidated (Unix time)."""
+
+    etag: Optional[str] = None
+    """The ETag HTTP header of the inventory response."""
+
+    last_modified: Optional[str] = None
+    """The Last-Modified HTTP header of the inventory response."""
+
+
+class InventoryCache:
+    """A content-addressed cache of intersphinx inventories, which can be
+    shared by several projects.
+
+    Inventory files are stored by the SHA-256 digest of their content in
+    the ``objects`` directory, and the metadata of each URL is stored in the
+    ``urls`` directory (as JSON files named by the digest of the URL). The
+    ``inventories`` directory has a copy of each URL's current inventory,
+    also named by the digest of the URL, which is replaced when the
+    inventory changes; the intersphinx mapping refers to these files, so
+    that the configuration doesn't change with the inventory content. All
+    writes are atomic, so concurrent builds can share the cache.
+
+    Parameters
+    ----------
+    cache_dir
+        The cache directory.
+    timeout
+        Timeout for each request, in seconds.
+    max_age
+        Inventories fetched or revalidated more recently than this (in
+        seconds) are used without a request.
+    offline
+        If `True`, never make requests and use only cached inventories.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        *,
+        timeout: float = 10.0,
+        max_age: float = 86400.0,
+        offline: bool = False,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.max_age = max_age
+        self.offline = offline
+
+    def get_path(self, entry: CachedInventory) -> Path:
+        """Get the path of a cached inventory file."""
+        return self.cache_dir / "objects" / f"{entry.sha256}.inv"
+
+    def get_url_path(self, url: str) -> Path:
+        """Get the path of the current inventory file of a URL, which has a
+        stable name and is updated in place.
+        """
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / "inventories" / f"{digest}.inv"
+
+    def _get_entry_path(self, url: str) -> Path:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / "urls" / f"{digest}.json"
+
+    def _update_url_file(self, entry: CachedInventory) -> Path:
+        """Update the current inventory file of a URL to the content of a
+        cache entry, if it differs.
+        """
+        path = self.get_url_path(entry.url)
+        try:
+            with path.open("rb") as f:
+                current = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            current = None
+        if current != entry.sha256:
+            _write_atomic(path, self.get_path(entry).read_bytes())
+        return path
+
+    def get(self, url: str) -> Optional[CachedInventory]:
+        """Get the cached inventory of a URL, or `None` if the URL isn't
+        cached.
+        """
+        try:
+            data = json.loads(self._get_entry_path(url).read_text())
+            entry = CachedInventory(**data)
+        except (OSError, TypeError, ValueError):
+            return None
+        if entry.url != url or not self.get_path(entry).is_file():
+            return None
+        return entry
+
+    def _write_entry(self, entry: CachedInventory) -> None:
+        _write_atomic(
+            self._get_entry_path(entry.url),
+            json.dumps(asdict(entry)).encode("utf-8"),
+        )
+
+    def store(
+        self,
+        url: str,
+        content: bytes,
+        *,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CachedInventory:
+        """Store an inventory in the cache."""
+        entry = CachedInventory(
+            url=url,
+            sha256=hashlib.sha256(content).hexdigest(),
+            fetched=time.time(),
+            etag=etag,
+            last_modified=last_modified,
+        )
+        path = self.get_path(entry)
+        if not path.is_file():
+            _write_atomic(path, content)
+        self._write_entry(entry)
+        return entry
+
+    def fetch(self, url: str) -> Optional[CachedInventory]:
+        """Get an inventory, fetching it if the cached copy is missing or
+        older than ``max_age``.
+
+        Cached inventories are revalidated with conditional requests. If
+        the request fails, a cached inventory is used regardless of its age.
+
+        Returns
+        -------
+        CachedInventory or None
+            The cached inventory, or `None` if the inventory isn't cached and
+            can't be fetched.
+        """
+        entry = self.get(url)
+        if self.offline:
+            if entry is None:
+                logger.warning(
+                    "intersphinx inventory %s isn't cached and network "
+                    "access is disabled",
+                    url,
+                )
+            return entry
+        if entry is not None and time.time() - entry.fetched < self.max_age:
+            return entry
+
+        request = urllib.request.Request(
+            url, headers={"User-Agent": f"spherex-sphinx/{__version__}"}
+        )
+        if entry is not None:
+            if entry.etag:
+                request.add_header("If-None-Match", entry.etag)
+            if entry.last_modified:
+                request.add_header("If-Modified-Since", entry.last_modified)
+        try:
+            with urllib.request.urlopen(
+                request, timeout=self.timeout
+            ) as response:
+                content = response.read()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except HTTPError as e:
+            if e.code == 304 and entry is not None:
+                entry.fetched = time.time()
+                self._write_entry(entry)
+                return entry
+            return self._fallback(url, entry, e)
+        except Exception as e:
+            return self._fallback(url, entry, e)
+
+        if not content.startswith(INVENTORY_HEADER):
+            return self._fallback(
+                url, entry, ValueError("not a Sphinx inventory file")
+            )
+        return self.store(url, content, etag=etag, last_modified=last_modified)
+
+    def _fallback(
+        self, url: str, entry: Optional[CachedInventory], error: Exception
+    ) -> Optional[CachedInventory]:
+        if entry is not None:
+            logger.info(
+                "failed to fetch intersphinx inventory %s (%s); using the "
+                "cached copy",
+                url,
+                error,
+            )
+        else:
+            logger.warning(
+                "failed to fetch intersphinx inventory %s: %s", url, error
+            )
+        return entry
+
+    def prefetch(
+        self, urls: Iterable[str], *, max_workers: int = 8
+    ) -> Dict[str, Optional[CachedInventory]]:
+        """Fetch several inventories concurrently.
+
+        Returns
+        -------
+        dict
+            Mapping of URLs to the cached inventories, or `None` for
+            inventories that aren't available.
+        """
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(urls))
+        ) as executor:
+            return dict(zip(urls, executor.map(self.fetch, urls)))
+
+    def get_intersphinx_mapping(
+        self, projects: Dict[str, str]
+    ) -> Dict[str, Tuple[str, Optional[str]]]:
+        """Prefetch the inventories of projects, and get the intersphinx
+        mapping to the cached inventory files.
+
+        Parameters
+        ----------
+        projects
+            Mapping of project names to the projects' root URLs.
+
+        Returns
+        -------
+        dict
+            The intersphinx mapping, with the current inventory file of each
+            URL (see `get_url_path`). Projects whose inventories can't be
+            fetched or found in the cache are omitted.
+        """
+        entries = self.prefetch(
+            get_inventory_url(url) for url in projects.values()
+        )
+        mapping: Dict[str, Tuple[str, Optional[str]]] = {}
+        for project, url in projects.items():
+            entry = entries[get_inventory_url(url)]
+            if entry is None:
+                continue
+            try:
+                path = self._update_url_file(entry)
+            except OSError as e:
+                logger.warning(
+                    "cannot write the intersphinx inventory of %s: %s", url, e
+                )
+                continue
+            mapping[project] = (url, str(path))
+        return mapping
+
+
+def _write_atomic(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(
+        f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    tmp_path.write_bytes(content)
+    tmp_path.replace(path)
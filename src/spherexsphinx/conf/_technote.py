@@ -0,0 +1,52 @@
+"""Support for the technote configuration, in a module that's importable
+without loading a technote's configuration.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any
+
+from technote.metadata.model import TechnoteMetadata
+from technote.templating.context import TechnoteJinjaContext
+
+__all__ = ["StableJinjaContext"]
+
+
+class StableJinjaContext(TechnoteJinjaContext):
+    """A technote Jinja context that equals the context of another build of
+    the same technote.
+
+    Sphinx compares the ``html_context`` of the pickled environment with
+    the new one. The base class compares by identity and has the object's
+    address in its representation, so the HTML builder would write every
+    page again in each build.
+
+    The context is compared by the technote metadata and root filename when
+    the context is created, since technote's extensions set the title and
+    abstract from the content while Sphinx reads it.
+
+    Parameters
+    ----------
+    metadata
+        The technote metadata.
+    root_filename
+        The technote's root source file.
+    """
+
+    def __init__(
+        self, metadata: TechnoteMetadata, root_filename: Path
+    ) -> None:
+        super().__init__(metadata=metadata, root_filename=root_filename)
+        self._key = f"{metadata!r}, {root_filename.name!r}"
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, StableJinjaContext):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self) -> int:
+        return hash(self._key)
+
+    def __repr__(self) -> str:
+        return f"TechnoteJinjaContext({self._key})"
@@ -2,28 +2,61 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import pickle
 import sys
 from collections.abc import MutableMapping
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple
 from urllib.parse import urlparse
 
-from git import Repo
+from pydantic import VERSION as PYDANTIC_VERSION
 from pydantic import BaseModel, Field, HttpUrl, ValidationError
 from sphinx.errors import ConfigError
 
+from .. import __version__
+from ._intersphinx import InventoryCache, is_offline, is_prefetch_forced
+
 if sys.version_info < (3, 11):
     import tomli as tomllib
 else:
     import tomllib
 
+if TYPE_CHECKING:
+    from git import Repo
+
 __all__ = [
     "get_asset_path",
+    "get_static_asset_path",
+    "get_build_date",
+    "get_build_year",
+    "get_cache_dir",
+    "get_project_key",
     "SpherexConfig",
     "ConfigRoot",
+    "TechnoteConfigRoot",
+    "GitRepository",
+]
+
+
+TECHNOTE_BIBFILE_REPOS: List[Dict[str, Any]] = [
+    {
+        "repo": "SPHEREx/spherex-tex",
+        "ref": "main",
+        "bibfiles": [
+            "texmf/bibtex/bib/spherex.bib",
+        ],
+    }
 ]
+"""The GitHub repositories of the BibTeX files used by technotes, in the
+format of documenteer's ``documenteer_bibfile_github_repos``
+configuration.
+"""
 
 
 def get_asset_path(name: str) -> str:
@@ -51,6 +84,129 @@ def get_asset_path(name: str) -> str:
     return str(path)
 
 
+def get_static_asset_path(name: str, base_dir: Optional[Path] = None) -> str:
+    """Get a stable path to a file in ``assets`` for use with Sphinx's
+    ``html_static_path``.
+
+    The asset is copied to the ``assets`` directory of the spherex-sphinx
+    cache directory, so that the path doesn't depend on where spherex-sphinx
+    is installed. Paths in the project directory are relative, so they're
+    the same in every checkout. The configuration then stays the same
+    across virtual environments and CI runners, and Sphinx doesn't write
+    every page again.
+
+    Parameters
+    ----------
+    name
+        The name of an asset file in the ``assets`` directory.
+    base_dir
+        The documentation project's directory (containing conf.py). Default
+        is the current working directory, which is the documentation
+        directory while Sphinx executes conf.py.
+
+    Returns
+    -------
+    str
+        Path to the copy of the asset, relative to ``base_dir`` if it's in
+        that directory.
+    """
+    if base_dir is None:
+        base_dir = Path.cwd()
+    source = Path(get_asset_path(name))
+    copy_path = get_cache_dir(base_dir) / "assets" / name
+    data = source.read_bytes()
+    try:
+        unchanged = copy_path.read_bytes() == data
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        copy_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write atomically because parallel builds may share the cache, and
+        # another build may be copying the asset to its output directory.
+        tmp_path = copy_path.with_name(f"{name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(copy_path)
+    try:
+        return copy_path.relative_to(base_dir).as_posix()
+    except ValueError:
+        return str(copy_path.resolve())
+
+
+def get_build_date() -> datetime:
+    """Get the date of the build, which is the time of the
+    ``SOURCE_DATE_EPOCH`` timestamp if it's set, for reproducible builds, or
+    otherwise the start of the current day (UTC).
+    """
+    source_date_epoch = os.environ.get("SOURCE_DATE_EPOCH")
+    if source_date_epoch:
+        try:
+            return datetime.fromtimestamp(
+                int(source_date_epoch), tz=timezone.utc
+            )
+        except ValueError:
+            pass
+    return datetime.now(tz=timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def get_build_year() -> int:
+    """Get the year of the build (see `get_build_date`)."""
+    return get_build_date().year
+
+
+def get_cache_dir(base_dir: Optional[Path] = None) -> Path:
+    """Get the directory for spherex-sphinx's build caches.
+
+    The cache directory is set by the ``SPHEREX_SPHINX_CACHE_DIR``
+    environment variable, which lets several projects or CI jobs share
+    a cache. Otherwise the cache is in the ``_build/.spherex-cache``
+    directory of the documentation project.
+
+    Parameters
+    ----------
+    base_dir
+        The documentation project's directory (containing conf.py). Default
+        is the current working directory, which is the documentation
+        directory while Sphinx executes conf.py.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the cache directory, which may not exist yet.
+    """
+    if base_dir is None:
+        base_dir = Path.cwd()
+    env_dir = os.environ.get("SPHEREX_SPHINX_CACHE_DIR")
+    if env_dir:
+        return base_dir.joinpath(env_dir)
+    return base_dir.joinpath("_build", ".spherex-cache")
+
+
+def get_project_key(base_dir: Optional[Path] = None) -> str:
+    """Get the key that names a documentation project's own entries in the
+    cache directory.
+
+    Projects can share the cache directory (see `get_cache_dir`), so the
+    cache entries that only apply to one project are named with this key.
+
+    Parameters
+    ----------
+    base_dir
+        The documentation project's directory. Default is the current
+        working directory.
+
+    Returns
+    -------
+    str
+        A short hash of the resolved project directory.
+    """
+    if base_dir is None:
+        base_dir = Path.cwd()
+    digest = hashlib.sha256(str(base_dir.resolve()).encode()).hexdigest()
+    return digest[:16]
+
+
 class ProjectModel(BaseModel):
     """Model for the project table in the spherex.toml configuration file,
     dealing with overall project metadata.
@@ -70,7 +226,7 @@ class ProjectModel(BaseModel):
     copyright: str = Field(
         description="Copyright statement, without a 'copyright' prefix word.",
         default_factory=(
-            lambda: f"{datetime.now().year} California Institute of Technology"
+            lambda: f"{get_build_year()} California Institute of Technology"
         ),
     )
 
@@ -96,6 +252,382 @@ class IntersphinxModel(BaseModel):
         default_factory=dict,
     )
 
+    prefetch: bool = Field(
+        default=False,
+        description=(
+            "Fetch the projects' inventories concurrently into the "
+            "spherex-sphinx cache directory before the build, and configure "
+            "intersphinx to read the cached files."
+        ),
+    )
+
+    max_age: float = Field(
+        default=24.0,
+        description=(
+            "Hours before a prefetched inventory is revalidated with the "
+            "project's server."
+        ),
+    )
+
+
+class CrossrefModel(BaseModel):
+    """Model for the sphinx.crossref table in spherex.toml, configuring the
+    spherexsphinx.ext.crossref extension.
+    """
+
+    registry: Optional[str] = Field(
+        default=None,
+        description=(
+            "Path to a JSON registry of SPHEREx documents, relative to the "
+            "documentation directory. When set, spherexdoc references are "
+            "validated against the registry."
+        ),
+    )
+
+    use_titles: bool = Field(
+        default=False,
+        description=(
+            "Use the document titles from the registry as the link text "
+            "of spherexdoc references without explicit display text."
+        ),
+    )
+
+    inventories: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Handles of SPHEREx documents whose objects.inv inventories are "
+            "used to resolve and check spherexdoc anchor references (like "
+            "SSDC-MS-001#requirements)."
+        ),
+    )
+
+
+class ProfileModel(BaseModel):
+    """Model for the sphinx.profile table in spherex.toml, configuring the
+    spherexsphinx.ext.buildprofile extension.
+    """
+
+    enabled: bool = Field(
+        default=False,
+        description="Profile the build with spherexsphinx.ext.buildprofile.",
+    )
+
+    output_dir: Optional[str] = Field(
+        default=None,
+        description=(
+            "Directory for the profile reports, relative to the "
+            "documentation directory. Default is a buildprofile directory "
+            "next to the builder's output directory."
+        ),
+    )
+
+    formats: List[Literal["json", "csv"]] = Field(
+        default=["json", "csv"],
+        description="Formats of the profile reports.",
+    )
+
+    top: int = Field(
+        default=10,
+        description="Number of the slowest pages to list in the console.",
+    )
+
+    handlers: bool = Field(
+        default=False,
+        description=(
+            "Also profile the time spent in each extension's event "
+            "handlers, roles and directives with "
+            "spherexsphinx.ext.handlerprofile."
+        ),
+    )
+
+
+class CompressModel(BaseModel):
+    """Model for the sphinx.compress table in spherex.toml, configuring the
+    spherexsphinx.ext.compress extension.
+    """
+
+    enabled: bool = Field(
+        default=False,
+        description=(
+            "Minify and precompress the HTML output with "
+            "spherexsphinx.ext.compress."
+        ),
+    )
+
+    minify: bool = Field(
+        default=True, description="Minify HTML and CSS files."
+    )
+
+    formats: List[Literal["gzip", "brotli"]] = Field(
+        default=["gzip", "brotli"],
+        description=(
+            "Precompressed formats to write. Brotli files are only written "
+            "if the brotli package is installed."
+        ),
+    )
+
+    min_size: int = Field(
+        default=1024,
+        description="Files smaller than this (in bytes) aren't compressed.",
+    )
+
+    parallel: Optional[int] = Field(
+        default=None,
+        description=(
+            "Number of processes for compressing files. Default is the "
+            "number of CPUs."
+        ),
+    )
+
+
+class AssetsModel(BaseModel):
+    """Model for the static asset settings (the sphinx.assets table in
+    spherex.toml, or the spherex.assets table in technote.toml).
+    """
+
+    fingerprint: bool = Field(
+        default=False,
+        description=(
+            "Add copies of the spherex-sphinx static assets with a hash "
+            "of their content in the file name, and reference the copies "
+            "from the pages, with spherexsphinx.ext.fingerprint."
+        ),
+    )
+
+
+class DeployModel(BaseModel):
+    """Model for the deploy settings (the sphinx.deploy table in
+    spherex.toml, or the spherex.deploy table in technote.toml).
+    """
+
+    manifest: bool = Field(
+        default=False,
+        description=(
+            "Write a deploy-manifest.json file with the content hash of "
+            "each output file, with spherexsphinx.ext.deploymanifest."
+        ),
+    )
+
+    exclude: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Glob patterns of output paths to leave out of the deploy "
+            "manifest."
+        ),
+    )
+
+
+class ApiCacheModel(BaseModel):
+    """Model for the API cache settings (the sphinx.apicache table in
+    spherex.toml).
+    """
+
+    enabled: bool = Field(
+        default=False,
+        description=(
+            "Cache the API summaries and stubs that sphinx-automodapi "
+            "generates, with spherexsphinx.ext.apicache."
+        ),
+    )
+
+
+class LastModifiedModel(BaseModel):
+    """Model for the last-modified page metadata settings (the
+    sphinx.last_modified table in spherex.toml).
+    """
+
+    enabled: bool = Field(
+        default=False,
+        description=(
+            "Show the date and commit of the last change to each page, "
+            "from the Git history, with spherexsphinx.ext.lastmodified."
+        ),
+    )
+
+
+class EpilogModel(BaseModel):
+    """Model for the shared epilog settings (the sphinx.epilog table in
+    spherex.toml).
+    """
+
+    enabled: bool = Field(
+        default=False,
+        description=(
+            "Parse the substitution definitions and hyperlink targets of "
+            "_rst_epilog.rst once and share them with all the documents, "
+            "including MyST substitutions, with spherexsphinx.ext.epilog, "
+            "instead of appending the file to each document as rst_epilog."
+        ),
+    )
+
+
+class DoctreesModel(BaseModel):
+    """Model for the doctree storage settings (the sphinx.doctrees table in
+    spherex.toml).
+    """
+
+    compression: Literal["none", "zlib", "lzma"] = Field(
+        default="none",
+        description=(
+            "Compression of the pickled doctrees, with "
+            "spherexsphinx.ext.doctreecompress."
+        ),
+    )
+
+    level: Optional[int] = Field(
+        default=None,
+        ge=0,
+        le=9,
+        description=(
+            "Compression level (zlib) or preset (lzma). Default is 6 for "
+            "zlib and 1 for lzma."
+        ),
+    )
+
+    environment: bool = Field(
+        default=False,
+        description="Also compress the pickled build environment.",
+    )
+
+
+class SearchModel(BaseModel):
+    """Model for the search index settings (the sphinx.search table in
+    spherex.toml).
+    """
+
+    sharded: bool = Field(
+        default=False,
+        description=(
+            "Split the search index into shards that the browser loads "
+            "when a search needs them, with spherexsphinx.ext.searchshards."
+        ),
+    )
+
+    prefix_length: int = Field(
+        default=2,
+        ge=1,
+        description=(
+            "Number of leading characters of the search terms that "
+            "determines their shard."
+        ),
+    )
+
+
+class NotebookImagesModel(BaseModel):
+    """Model for the output image settings of Jupyter notebooks (the
+    sphinx.notebooks.images table in spherex.toml, or the
+    spherex.notebooks.images table in technote.toml).
+    """
+
+    enabled: bool = Field(
+        default=False,
+        description=(
+            "Store each unique notebook output image once, by content "
+            "hash, and recompress oversized images, with "
+            "spherexsphinx.ext.nbimages."
+        ),
+    )
+
+    max_width: Optional[int] = Field(
+        default=None,
+        description=(
+            "Downsample raster images wider than this, in pixels. Requires "
+            "Pillow."
+        ),
+    )
+
+    max_height: Optional[int] = Field(
+        default=None,
+        description=(
+            "Downsample raster images taller than this, in pixels. "
+            "Requires Pillow."
+        ),
+    )
+
+    max_bytes: Optional[int] = Field(
+        default=None,
+        description=(
+            "Recompress PNG and JPEG images larger than this, in bytes. "
+            "Requires Pillow."
+        ),
+    )
+
+    jpeg_quality: int = Field(
+        default=85,
+        ge=1,
+        le=95,
+        description="Quality of recompressed JPEG images.",
+    )
+
+
+class NotebooksModel(BaseModel):
+    """Model for the execution settings of Jupyter notebooks with myst-nb
+    and spherexsphinx.ext.nbexec (the sphinx.notebooks table in
+    spherex.toml, or the spherex.notebooks table in technote.toml).
+    """
+
+    execution_mode: Literal["off", "force", "auto", "cache", "inline"] = Field(
+        default="auto",
+        description=(
+            "The myst-nb execution mode. In the cache mode, executed "
+            "notebooks are cached with jupyter-cache and only notebooks "
+            "whose code cells changed are executed again, in parallel."
+        ),
+    )
+
+    cache_dir: Optional[str] = Field(
+        default=None,
+        description=(
+            "The jupyter-cache directory, relative to the documentation "
+            "directory. Default is the jupyter directory in the "
+            "spherex-sphinx cache directory."
+        ),
+    )
+
+    timeout: int = Field(
+        default=300,
+        description=(
+            "Timeout for executing each cell, in seconds. Use -1 for no "
+            "timeout."
+        ),
+    )
+
+    timeouts: Dict[str, int] = Field(
+        default_factory=dict,
+        description=(
+            "Cell timeouts of specific notebooks, keyed by glob patterns of "
+            "document names."
+        ),
+    )
+
+    parallel: Optional[int] = Field(
+        default=None,
+        description=(
+            "Number of processes for executing outdated notebooks in the "
+            "cache mode. Default is the number of CPUs."
+        ),
+    )
+
+    exclude: List[str] = Field(
+        default_factory=list,
+        description="Glob patterns of notebook paths to never execute.",
+    )
+
+    allow_errors: bool = Field(
+        default=False,
+        description="Continue executing notebooks after a cell fails.",
+    )
+
+    images: NotebookImagesModel = Field(
+        default_factory=lambda: NotebookImagesModel()
+    )
+
+    def get_cache_path(self) -> str:
+        """Get the absolute path of the jupyter-cache directory."""
+        if self.cache_dir:
+            return str(Path(self.cache_dir).resolve())
+        return str((get_cache_dir() / "jupyter").resolve())
+
 
 class SphinxModel(BaseModel):
     """Model for the sphinx table in the spherex.toml configuration file,
@@ -104,6 +636,36 @@ class SphinxModel(BaseModel):
 
     intersphinx: IntersphinxModel
 
+    crossref: CrossrefModel = Field(default_factory=lambda: CrossrefModel())
+
+    profile: ProfileModel = Field(default_factory=lambda: ProfileModel())
+
+    compress: CompressModel = Field(default_factory=lambda: CompressModel())
+
+    assets: AssetsModel = Field(default_factory=lambda: AssetsModel())
+
+    deploy: DeployModel = Field(default_factory=lambda: DeployModel())
+
+    search: SearchModel = Field(default_factory=lambda: SearchModel())
+
+    doctrees: DoctreesModel = Field(default_factory=lambda: DoctreesModel())
+
+    apicache: ApiCacheModel = Field(default_factory=lambda: ApiCacheModel())
+
+    last_modified: LastModifiedModel = Field(
+        default_factory=lambda: LastModifiedModel()
+    )
+
+    epilog: EpilogModel = Field(default_factory=lambda: EpilogModel())
+
+    notebooks: Optional[NotebooksModel] = Field(
+        default=None,
+        description=(
+            "Settings for Jupyter notebooks. Setting this table enables "
+            "notebook sources with myst-nb."
+        ),
+    )
+
     extensions: List[str] = Field(
         description=(
             "Additional Sphinx extensions to use, beyond the base set."
@@ -111,6 +673,15 @@ class SphinxModel(BaseModel):
         default_factory=list,
     )
 
+    lazy_extensions: bool = Field(
+        default=False,
+        description=(
+            "Only enable the optional extensions of the base set that the "
+            "sources use, as determined by scanning the source files for "
+            "file suffixes, directives and roles."
+        ),
+    )
+
     nitpick_ignore: List[Tuple[str, str]] = Field(
         description=(
             "Errors to ignore. First item is the type (like a role or "
@@ -137,6 +708,50 @@ class ConfigRoot(BaseModel):
     sphinx: SphinxModel
 
 
+class TechnoteSpherexModel(BaseModel):
+    """Model for the spherex table in technote.toml, which configures
+    spherex-sphinx features of technotes. The technote package ignores
+    this table.
+    """
+
+    notebooks: NotebooksModel = Field(default_factory=lambda: NotebooksModel())
+
+    assets: AssetsModel = Field(default_factory=lambda: AssetsModel())
+
+    deploy: DeployModel = Field(default_factory=lambda: DeployModel())
+
+    lazy_extensions: bool = Field(
+        default=False,
+        description=(
+            "Only enable the optional extensions of the technote "
+            "configuration that the sources use."
+        ),
+    )
+
+
+class TechnoteConfigRoot(BaseModel):
+    """Root of the spherex-sphinx settings in technote.toml."""
+
+    spherex: TechnoteSpherexModel = Field(
+        default_factory=lambda: TechnoteSpherexModel()
+    )
+
+    @classmethod
+    def load(cls) -> TechnoteConfigRoot:
+        """Load the spherex-sphinx settings from the technote.toml file in
+        the current directory.
+        """
+        path = Path("technote.toml")
+        if not path.is_file():
+            raise ConfigError("Cannot find the technote.toml file.")
+        try:
+            return cls.model_validate(tomllib.loads(path.read_text()))
+        except (ValidationError, tomllib.TOMLDecodeError) as e:
+            raise ConfigError(
+                f"Syntax or validation issue in technote.toml:\n\n {str(e)}"
+            )
+
+
 @dataclass
 class SpherexConfig:
     """Configuration from a spherex.toml configuration file."""
@@ -167,13 +782,33 @@ class SpherexConfig:
         """Apply the configurations from sphinx.intersphinx.projects to
         the existing mapping.
 
+        If ``prefetch`` is enabled (or the
+        ``SPHEREX_SPHINX_INTERSPHINX_PREFETCH`` environment variable is set),
+        the inventories are fetched concurrently
+        into the cache directory (see `get_cache_dir`), and the mapping
+        points intersphinx to the cached inventory files. Projects whose
+        inventories can't be fetched or found in the cache are omitted.
+
         Parameters
         ----------
         intersphinx_mapping
             Base intersphinx mapping configuration to extend.
         """
-        for project, url in self.config.sphinx.intersphinx.projects.items():
-            intersphinx_mapping[project] = (str(url), None)
+        intersphinx = self.config.sphinx.intersphinx
+        urls = {
+            project: str(url) for project, url in intersphinx.projects.items()
+        }
+        if not (intersphinx.prefetch or is_prefetch_forced()):
+            for project, url in urls.items():
+                intersphinx_mapping[project] = (url, None)
+            return
+
+        cache = InventoryCache(
+            get_cache_dir() / "intersphinx",
+            max_age=intersphinx.max_age * 3600,
+            offline=is_offline(),
+        )
+        intersphinx_mapping.update(cache.get_intersphinx_mapping(urls))
 
     def extend_sphinx_extensions(self, extensions: List[str]) -> None:
         """Append additional sphinx extensions from sphinx.extensions to
@@ -237,6 +872,19 @@ class SpherexConfig:
         if not path.is_file():
             raise ConfigError("Cannot find the spherex.toml file.")
         toml_content = path.read_text()
+
+        # Parsing and validating spherex.toml happens every time conf.py
+        # executes, so reuse the validated config from previous builds.
+        # Projects can share the cache directory, so each project has its own
+        # cache file.
+        cache = _ConfigCache(
+            get_cache_dir() / f"spherex-config-{get_project_key()}.pickle"
+        )
+        cache_key = cache.make_key(toml_content)
+        config = cache.get(cache_key)
+        if config is not None:
+            return cls(config=config)
+
         try:
             config = ConfigRoot.model_validate(tomllib.loads(toml_content))
         except ValidationError as e:
@@ -244,21 +892,225 @@ class SpherexConfig:
                 f"Syntax or validation issue in spherex.toml:\n\n {str(e)}"
             )
             raise ConfigError(message)
+        cache.set(cache_key, config)
         return cls(config=config)
 
 
+@lru_cache(maxsize=None)
+def _get_schema_digest() -> str:
+    """Get a hash of the JSON schema of the configuration models."""
+    schema = json.dumps(ConfigRoot.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()
+
+
+def _has_all_fields(value: Any) -> bool:
+    """Check that a model (and the models it contains) has a value for each
+    field of its class.
+
+    A model pickled with an older version of its class, like by an editable
+    install that keeps the same version, can miss fields.
+    """
+    if isinstance(value, BaseModel):
+        return all(
+            name in value.__dict__ and _has_all_fields(value.__dict__[name])
+            for name in type(value).model_fields
+        )
+    if isinstance(value, (list, tuple)):
+        return all(_has_all_fields(item) for item in value)
+    if isinstance(value, dict):
+        return all(_has_all_fields(item) for item in value.values())
+    return True
+
+
+class _ConfigCache:
+    """A persistent cache of the validated spherex.toml configuration.
+
+    The cache holds a single entry that is keyed by the content of
+    spherex.toml, the versions of spherex-sphinx and pydantic, and the
+    schema of the configuration models. The cache is best-effort:
+    unreadable, outdated or unwritable cache files are ignored.
+
+    Parameters
+    ----------
+    path
+        Path to the cache file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+
+    def make_key(self, toml_content: str) -> str:
+        """Compute the cache key for the content of spherex.toml."""
+        h = hashlib.sha256(toml_content.encode("utf-8"))
+        # The year is part of the key because the default copyright
+        # statement includes the build year.
+        for item in (
+            __version__,
+            PYDANTIC_VERSION,
+            _get_schema_digest(),
+            get_build_year(),
+        ):
+            h.update(f"\0{item}".encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[ConfigRoot]:
+        """Get the cached configuration if it matches the key, or `None`."""
+        try:
+            with self._path.open("rb") as f:
+                cached_key, config = pickle.load(f)
+            if (
+                cached_key != key
+                or not isinstance(config, ConfigRoot)
+                or not _has_all_fields(config)
+            ):
+                return None
+        except Exception:
+            return None
+        return config
+
+    def set(self, key: str, config: ConfigRoot) -> None:
+        """Store the configuration in the cache."""
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically because parallel builds may share the cache.
+            tmp_path = self._path.with_name(
+                f"{self._path.name}.{os.getpid()}.tmp"
+            )
+            with tmp_path.open("wb") as f:
+                pickle.dump((key, config), f, pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(self._path)
+        except OSError:
+            pass
+
+
 class GitRepository:
     """Access to to metadata about the Git repository of the documentation
     project.
+
+    The repository is found by searching ``dirname`` and its parent
+    directories for a ``.git`` directory, or a ``.git`` file with a
+    ``gitdir:`` pointer (as used by linked worktrees and submodules). This
+    lookup only reads files, so it doesn't import GitPython or start
+    ``git`` processes. Use `repo` for features that need GitPython.
+
+    Parameters
+    ----------
+    dirname
+        A directory inside the repository's working tree.
+
+    Raises
+    ------
+    sphinx.errors.ConfigError
+        Raised if ``dirname`` isn't inside a Git repository.
     """
 
     def __init__(self, dirname: Path) -> None:
-        self._repo = Repo(dirname, search_parent_directories=True)
+        self._working_tree_dir, self._git_dir = self._find(dirname)
+        self._repo: Optional[Repo] = None
+
+    @staticmethod
+    def _find(dirname: Path) -> Tuple[Path, Path]:
+        dirname = dirname.resolve()
+        for candidate in (dirname, *dirname.parents):
+            dot_git = candidate / ".git"
+            if dot_git.is_dir():
+                return candidate, dot_git
+            if dot_git.is_file():
+                content = dot_git.read_text().strip()
+                if content.startswith("gitdir:"):
+                    git_dir = Path(content[len("gitdir:") :].strip())
+                    # Relative paths are relative to the .git file
+                    git_dir = candidate.joinpath(git_dir).resolve()
+                    if git_dir.joinpath("HEAD").is_file():
+                        return candidate, git_dir
+        raise ConfigError(f"Cannot find a Git repository containing {dirname}")
 
     @property
     def working_tree_dir(self) -> Path:
         """The root directory of the Git repository."""
-        path = self._repo.working_tree_dir
-        if path is None:
-            raise RuntimeError("Git repository is not available.")
-        return Path(path)
+        return self._working_tree_dir
+
+    @property
+    def git_dir(self) -> Path:
+        """The Git directory of the working tree (for a linked worktree,
+        this is the worktree's directory inside the main repository's Git
+        directory).
+        """
+        return self._git_dir
+
+    @property
+    def common_dir(self) -> Path:
+        """The Git directory that is shared by all worktrees, containing
+        the objects and branch references.
+        """
+        commondir_path = self._git_dir / "commondir"
+        if commondir_path.is_file():
+            return self._git_dir.joinpath(
+                commondir_path.read_text().strip()
+            ).resolve()
+        return self._git_dir
+
+    @property
+    def head_commit(self) -> Optional[str]:
+        """The SHA of the commit checked out in the working tree, or `None`
+        if HEAD doesn't point to a commit yet (an unborn branch).
+        """
+        ref = "HEAD"
+        # Follow symbolic references, like HEAD -> refs/heads/main
+        for _ in range(10):
+            value = self._read_ref(ref)
+            if value is None:
+                return None
+            if not value.startswith("ref:"):
+                return value
+            ref = value[len("ref:") :].strip()
+        return None
+
+    def get_remote_url(self, name: str = "origin") -> Optional[str]:
+        """Get the URL of a remote from the repository's Git configuration,
+        or `None` if the remote isn't configured.
+        """
+        config_path = self.common_dir / "config"
+        if not config_path.is_file():
+            return None
+        section = f'[remote "{name}"]'
+        in_section = False
+        for line in config_path.read_text().splitlines():
+            line = line.strip()
+            if line.startswith("["):
+                in_section = line == section
+            elif in_section:
+                key, _, value = line.partition("=")
+                if key.strip() == "url":
+                    return value.strip()
+        return None
+
+    def _read_ref(self, ref: str) -> Optional[str]:
+        # Per-worktree refs like HEAD are in the worktree's Git directory,
+        # and shared refs are in the common Git directory.
+        for base_dir in (self._git_dir, self.common_dir):
+            ref_path = base_dir / ref
+            if ref_path.is_file():
+                return ref_path.read_text().strip()
+        packed_refs_path = self.common_dir / "packed-refs"
+        if packed_refs_path.is_file():
+            for line in packed_refs_path.read_text().splitlines():
+                if line.startswith(("#", "^")):
+                    continue
+                sha, _, name = line.partition(" ")
+                if name.strip() == ref:
+                    return sha
+        return None
+
+    @property
+    def repo(self) -> Repo:
+        """The GitPython repository object, for features that need full
+        Git functionality.
+
+        GitPython is only imported when this property is first used.
+        """
+        if self._repo is None:
+            from git import Repo
+
+            self._repo = Repo(self._working_tree_dir)
+        return self._repo
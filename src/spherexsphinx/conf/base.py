@@ -10,7 +10,8 @@ from __future__ import annotations
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from ._utils import SpherexConfig, get_asset_path
+from ._extensions import select_extensions
+from ._utils import SpherexConfig, get_static_asset_path
 
 c = SpherexConfig.load()
 
@@ -34,8 +35,10 @@ root_doc = "index"
 
 exclude_patterns = ["_build", "README.rst", "_rst_epilog.rst"]
 
+# With sphinx.epilog in spherex.toml, spherexsphinx.ext.epilog parses the
+# epilog once instead.
 epilog_path = Path("_rst_epilog.rst")
-if epilog_path.is_file():
+if epilog_path.is_file() and not c.config.sphinx.epilog.enabled:
     rst_epilog = epilog_path.read_text()
 
 pygments_style = "sphinx"
@@ -73,10 +76,56 @@ extensions = [
     "sphinx_automodapi.smart_resolver",
     "sphinxcontrib.mermaid",
     "spherexsphinx.ext.crossref",
+    "spherexsphinx.ext.configdrift",
     "sphinx_click",
 ]
 c.extend_sphinx_extensions(extensions)
 
+if c.config.sphinx.notebooks is not None:
+    # myst-nb includes myst-parser, and adds support for notebook sources.
+    extensions[extensions.index("myst_parser")] = "myst_nb"
+    extensions.append("spherexsphinx.ext.nbexec")
+    if c.config.sphinx.notebooks.images.enabled:
+        extensions.append("spherexsphinx.ext.nbimages")
+
+if c.config.sphinx.lazy_extensions:
+    # Drop the default extensions whose file types, directives and roles
+    # the sources don't use.
+    extensions = select_extensions(extensions, keep=c.config.sphinx.extensions)
+
+if c.config.sphinx.assets.fingerprint:
+    extensions.append("spherexsphinx.ext.fingerprint")
+
+if c.config.sphinx.compress.enabled:
+    extensions.append("spherexsphinx.ext.compress")
+
+if c.config.sphinx.deploy.manifest:
+    extensions.append("spherexsphinx.ext.deploymanifest")
+
+if c.config.sphinx.search.sharded:
+    extensions.append("spherexsphinx.ext.searchshards")
+
+if c.config.sphinx.doctrees.compression != "none":
+    extensions.append("spherexsphinx.ext.doctreecompress")
+
+if (
+    c.config.sphinx.apicache.enabled
+    and "sphinx_automodapi.automodapi" in extensions
+):
+    extensions.append("spherexsphinx.ext.apicache")
+
+if c.config.sphinx.last_modified.enabled:
+    extensions.append("spherexsphinx.ext.lastmodified")
+
+if c.config.sphinx.epilog.enabled:
+    extensions.append("spherexsphinx.ext.epilog")
+
+if c.config.sphinx.profile.enabled:
+    extensions.append("spherexsphinx.ext.buildprofile")
+if c.config.sphinx.profile.handlers:
+    # Listed first so that it wraps the event handlers of other extensions.
+    extensions.insert(0, "spherexsphinx.ext.handlerprofile")
+
 # HTML =======================================================================
 # Uses https://pydata-sphinx-theme.readthedocs.io/en/stable/
 
@@ -117,6 +166,13 @@ if c.github_url:
         }
     )
 
+if c.config.sphinx.last_modified.enabled:
+    html_theme_options["footer_items"] = [
+        "copyright.html",
+        "last-modified.html",
+        "sphinx-version.html",
+    ]
+
 html_title = project
 html_short_title = project
 if c.base_url:
@@ -126,11 +182,19 @@ if c.base_url:
 html_show_sourcelink = False
 html_copy_source = False
 
-# Assets available to the HTML theme from spherexsphinx's "assets" directory
+# The theme and extensions add their template directories to this list. A
+# new list for each build keeps them from accumulating in Sphinx's default
+# list when several builds run in one process, which would change the
+# configuration and make Sphinx write every page again.
+templates_path: List[str] = []
+
+# Assets available to the HTML theme from spherexsphinx's "assets" directory,
+# copied to the cache directory so that the paths are the same in every
+# environment
 html_static_path = [
-    get_asset_path("spherex-logo-color-light.png"),
-    get_asset_path("spherex-logo-color-dark.png"),
-    get_asset_path("spherex-favicon.png"),
+    get_static_asset_path("spherex-logo-color-light.png"),
+    get_static_asset_path("spherex-logo-color-dark.png"),
+    get_static_asset_path("spherex-favicon.png"),
 ]
 
 # Intersphinx ================================================================
@@ -195,6 +259,70 @@ myst_enable_extensions = [
     "tasklist",
 ]
 
+# Jupyter notebooks ==========================================================
+# myst-nb and spherexsphinx.ext.nbexec, enabled with sphinx.notebooks in
+# spherex.toml
+# https://myst-nb.readthedocs.io/en/latest/computation/execute.html
+
+if c.config.sphinx.notebooks is not None:
+    nb_execution_mode = c.config.sphinx.notebooks.execution_mode
+    nb_execution_cache_path = c.config.sphinx.notebooks.get_cache_path()
+    nb_execution_timeout = c.config.sphinx.notebooks.timeout
+    nb_execution_excludepatterns = c.config.sphinx.notebooks.exclude
+    nb_execution_allow_errors = c.config.sphinx.notebooks.allow_errors
+    nbexec_parallel = c.config.sphinx.notebooks.parallel
+    nbexec_timeouts = c.config.sphinx.notebooks.timeouts
+    nbimages_max_width = c.config.sphinx.notebooks.images.max_width
+    nbimages_max_height = c.config.sphinx.notebooks.images.max_height
+    nbimages_max_bytes = c.config.sphinx.notebooks.images.max_bytes
+    nbimages_jpeg_quality = c.config.sphinx.notebooks.images.jpeg_quality
+
+# SPHEREx cross references ===================================================
+# spherexsphinx.ext.crossref
+
+spherexdoc_registry = c.config.sphinx.crossref.registry
+spherexdoc_use_titles = c.config.sphinx.crossref.use_titles
+spherexdoc_inventories = c.config.sphinx.crossref.inventories
+
+# Output compression =========================================================
+# spherexsphinx.ext.compress, enabled with sphinx.compress in spherex.toml
+
+compress_minify = c.config.sphinx.compress.minify
+compress_formats = c.config.sphinx.compress.formats
+compress_min_size = c.config.sphinx.compress.min_size
+compress_parallel = c.config.sphinx.compress.parallel
+
+# Sharded search index =======================================================
+# spherexsphinx.ext.searchshards, enabled with sphinx.search in spherex.toml
+
+searchshards_prefix_length = c.config.sphinx.search.prefix_length
+
+# Doctree compression ========================================================
+# spherexsphinx.ext.doctreecompress, enabled with sphinx.doctrees in
+# spherex.toml
+
+doctreecompress_method = c.config.sphinx.doctrees.compression
+doctreecompress_level = c.config.sphinx.doctrees.level
+doctreecompress_environment = c.config.sphinx.doctrees.environment
+
+# Last-modified dates ========================================================
+# spherexsphinx.ext.lastmodified, enabled with sphinx.last_modified in
+# spherex.toml
+
+lastmodified_github_url = c.github_url
+
+# Deploy manifest ============================================================
+# spherexsphinx.ext.deploymanifest, enabled with sphinx.deploy in spherex.toml
+
+deploy_manifest_exclude = c.config.sphinx.deploy.exclude
+
+# Build profiling ============================================================
+# spherexsphinx.ext.buildprofile, enabled with sphinx.profile in spherex.toml
+
+buildprofile_dir = c.config.sphinx.profile.output_dir
+buildprofile_formats = c.config.sphinx.profile.formats
+buildprofile_top = c.config.sphinx.profile.top
+
 # Mermaid diagram support ====================================================
 # https://github.com/mgaitan/sphinxcontrib-mermaid
 # https://mermaid-js.github.io/mermaid/#/
@@ -1,10 +1,24 @@
 """Sphinx configuration for SPHEREx technotes."""
 
+import os
 from contextlib import suppress
 from pathlib import Path
 
 from technote.sphinxconf import *  # noqa: F401 F403
 
+from ._extensions import select_extensions
+from ._intersphinx import InventoryCache, is_offline, is_prefetch_forced
+from ._technote import StableJinjaContext
+from ._utils import (
+    TECHNOTE_BIBFILE_REPOS,
+    TechnoteConfigRoot,
+    get_build_date,
+    get_cache_dir,
+    get_static_asset_path,
+)
+
+_spherex = TechnoteConfigRoot.load().spherex
+
 with suppress(ValueError):
     # Remove the sphinxcontrib-bibtex extension so that we can add it back
     # in the proper order relative to documenteer.ext.githubbibcache.
@@ -18,24 +32,39 @@ with suppress(ValueError):
 extensions.extend(  # noqa: F405
     [
         "myst_nb",
+        "spherexsphinx.ext.nbexec",
         "sphinxcontrib.mermaid",
         "sphinx_prompt",
         "sphinx_design",
         "documenteer.ext.githubbibcache",
         "sphinxcontrib.bibtex",
+        "spherexsphinx.ext.bibcache",
+        "spherexsphinx.ext.configdrift",
     ]
 )
 
-_assets_dir = Path(__file__).parent.joinpath("../assets")
-
+# Assets from spherexsphinx's "assets" directory, copied to the cache
+# directory so that the paths are the same in every environment
 html_static_path: list[str] = [
-    str(_assets_dir.joinpath("spherex-logo-color-dark.png").resolve()),
-    str(_assets_dir.joinpath("spherex-logo-color-light.png").resolve()),
-    str(_assets_dir.joinpath("spherex-technote.css").resolve()),
+    get_static_asset_path("spherex-logo-color-dark.png"),
+    get_static_asset_path("spherex-logo-color-light.png"),
+    get_static_asset_path("spherex-technote.css"),
 ]
 
 html_css_files = ["spherex-technote.css"]
 
+if _spherex.assets.fingerprint:
+    extensions.append("spherexsphinx.ext.fingerprint")  # noqa: F405
+
+if _spherex.deploy.manifest:
+    extensions.append("spherexsphinx.ext.deploymanifest")  # noqa: F405
+    deploy_manifest_exclude = _spherex.deploy.exclude
+
+if _spherex.lazy_extensions:
+    # Drop the extensions whose file types, directives and roles the
+    # sources don't use.
+    extensions[:] = select_extensions(extensions)  # noqa: F405
+
 # A list of paths that contain extra templates (or templates that overwrite
 # builtin/theme-specific templates).
 _templates_dir = Path(__file__).parent.joinpath("../templates/technote")
@@ -55,23 +84,70 @@ source_suffix = {
     ".rst": "restructuredtext",
 }
 
-# Configure bibliography with the bib cache
-documenteer_bibfile_cache_dir = ".technote/bibfiles"
-documenteer_bibfile_github_repos = [
-    {
-        "repo": "SPHEREx/spherex-tex",
-        "ref": "main",
-        "bibfiles": [
-            "texmf/bibtex/bib/spherex.bib",
-        ],
-    }
-]
+# Notebook execution with myst-nb and spherexsphinx.ext.nbexec, configured
+# by the spherex.notebooks table in technote.toml
+nb_execution_mode = _spherex.notebooks.execution_mode
+nb_execution_cache_path = _spherex.notebooks.get_cache_path()
+nb_execution_timeout = _spherex.notebooks.timeout
+nb_execution_excludepatterns = _spherex.notebooks.exclude
+nb_execution_allow_errors = _spherex.notebooks.allow_errors
+nbexec_parallel = _spherex.notebooks.parallel
+nbexec_timeouts = _spherex.notebooks.timeouts
+
+# Deduplicate and recompress notebook output images, configured by the
+# spherex.notebooks.images table in technote.toml
+if _spherex.notebooks.images.enabled:
+    extensions.append("spherexsphinx.ext.nbimages")  # noqa: F405
+nbimages_max_width = _spherex.notebooks.images.max_width
+nbimages_max_height = _spherex.notebooks.images.max_height
+nbimages_max_bytes = _spherex.notebooks.images.max_bytes
+nbimages_jpeg_quality = _spherex.notebooks.images.jpeg_quality
+
+# Configure bibliography with the bib cache, which is shared by technotes
+# with a shared spherex-sphinx cache directory.
+if "SPHEREX_SPHINX_CACHE_DIR" in os.environ:
+    documenteer_bibfile_cache_dir = str(get_cache_dir() / "bibfiles")
+else:
+    documenteer_bibfile_cache_dir = ".technote/bibfiles"
+documenteer_bibfile_github_repos = TECHNOTE_BIBFILE_REPOS
+
 # Set up bibtex_bibfiles
-# Automatically load local bibfiles in the root directory.
-bibtex_bibfiles = [str(p) for p in Path.cwd().glob("*.bib")]
+# Automatically load local bibfiles in the root directory, in a stable order
+# because the order of glob results depends on the file system, and relative
+# to the source directory so that they don't depend on the checkout's
+# location.
+bibtex_bibfiles = sorted(p.name for p in Path.cwd().glob("*.bib"))
 
 bibtex_reference_style = "author_year"
 
+# Cache the parsed bibliography data next to the bibfile cache, unless a
+# shared spherex-sphinx cache directory is configured.
+if "SPHEREX_SPHINX_CACHE_DIR" not in os.environ:
+    bibcache_dir = ".technote/bibcache"
+
+# Read the intersphinx inventories from the spherex-sphinx inventory cache
+# when prefetching is forced, as in ``spherex-sphinx build-all``.
+if is_prefetch_forced():
+    intersphinx_mapping = InventoryCache(  # noqa: F405
+        get_cache_dir() / "intersphinx", offline=is_offline()
+    ).get_intersphinx_mapping(
+        {
+            name: url
+            for name, (url, _) in intersphinx_mapping.items()  # noqa: F405
+        }
+    )
+
+# technote defaults the updated date to the build time, which would change
+# the configuration in every build; use the build date instead.
+if T.toml.technote.date_updated_datetime is None:  # noqa: F405
+    T.metadata.date_updated = get_build_date()  # noqa: F405
+
+# A Jinja context that equals the previous build's, so that the HTML builder
+# doesn't write every page again
+html_context["technote"] = StableJinjaContext(  # noqa: F405
+    T.metadata, T.root_filename  # noqa: F405
+)
+
 # Add editions_url to the HTML context so it can be used by the custom
 # sidebar template
 _id = T.metadata.id  # noqa: F405
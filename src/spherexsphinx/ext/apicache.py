@@ -0,0 +1,410 @@
+"""A cache of the API stub generation of sphinx-automodapi."""
+
+from __future__ import annotations
+
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set
+
+from sphinx.util import logging
+
+from .. import __version__
+from ..conf._utils import get_cache_dir, get_project_key
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+
+__all__ = [
+    "ApiCacheStats",
+    "ApiCache",
+    "get_apicache_stats",
+    "get_package_files",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = "apicache"
+"""Name of the directory of the API caches (one per source directory) in the
+spherex-sphinx cache directory.
+"""
+
+SOURCE_SUFFIXES = (".py", ".pyi", ".pyx", ".so", ".pyd")
+"""Suffixes of the files of a package whose content is part of its
+fingerprint.
+"""
+
+CONFIG_NAMES = (
+    "automodapi_inheritance_diagram",
+    "automodapi_toctreedirnm",
+    "automodsumm_inherited_members",
+    "automodsumm_included_members",
+    "automodsumm_properties_are_attributes",
+)
+"""Configuration values that affect the generated autosummary lines and
+stubs.
+"""
+
+
+@dataclass
+class ApiCacheStats:
+    """Hit and miss statistics of the API cache in a build."""
+
+    hits: List[str] = field(default_factory=list)
+    """Source files whose autosummary lines and stubs were reused."""
+
+    misses: List[str] = field(default_factory=list)
+    """Source files that were processed by sphinx-automodapi."""
+
+    packages: Dict[str, str] = field(default_factory=dict)
+    """Fingerprints of the documented top-level packages."""
+
+
+def get_package_files(package: str) -> Optional[List[str]]:
+    """Find the source files of a top-level package, without importing it.
+
+    Parameters
+    ----------
+    package
+        Name of the top-level package or module.
+
+    Returns
+    -------
+    list of str or None
+        Sorted paths of the files with a `SOURCE_SUFFIXES` suffix, or `None`
+        if the package can't be found.
+    """
+    try:
+        spec = importlib.util.find_spec(package)
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None:
+        return None
+    paths: List[str] = []
+    if spec.submodule_search_locations:
+        for location in spec.submodule_search_locations:
+            for dirpath, dirnames, filenames in os.walk(location):
+                dirnames[:] = sorted(
+                    name for name in dirnames if name != "__pycache__"
+                )
+                paths.extend(
+                    os.path.join(dirpath, name)
+                    for name in sorted(filenames)
+                    if name.endswith(SOURCE_SUFFIXES)
+                )
+    elif spec.origin and os.path.isfile(spec.origin):
+        paths.append(spec.origin)
+    return paths
+
+
+class ApiCache:
+    """A persistent cache of the autosummary lines and stub files that
+    sphinx-automodapi generates for each source file.
+
+    Each entry is keyed by the content of the source file and the
+    fingerprints of the top-level packages of the modules it documents. A
+    package's fingerprint combines the installed version of its
+    distribution and the content hashes of its source files, so entries
+    are invalidated when the documented code changes.
+
+    Parameters
+    ----------
+    path
+        Path of the JSON cache file.
+    config_key
+        Key of the configuration values that affect stub generation.
+    """
+
+    def __init__(self, path: Path, config_key: str) -> None:
+        self.path = path
+        self.config_key = config_key
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.file_digests: Dict[str, List[Any]] = {}
+        self.stats = ApiCacheStats()
+        self._hit_files: Set[str] = set()
+        self._distributions: Optional[Dict[str, List[str]]] = None
+        try:
+            data = json.loads(path.read_text())
+            if data.get("key") == config_key:
+                self.entries = data["entries"]
+                self.file_digests = data["file_digests"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        self._used_digests: Dict[str, List[Any]] = {}
+
+    def save(self) -> None:
+        """Write the cache file (best-effort)."""
+        data = {
+            "key": self.config_key,
+            "entries": self.entries,
+            "file_digests": self._used_digests,
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically because parallel builds may share the cache.
+            tmp_path = self.path.with_name(
+                f"{self.path.name}.{os.getpid()}.tmp"
+            )
+            tmp_path.write_text(json.dumps(data))
+            tmp_path.replace(self.path)
+        except OSError:
+            pass
+
+    def _hash_file(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self.file_digests.get(path)
+        if cached is not None and cached[:2] == [
+            stat.st_size,
+            stat.st_mtime_ns,
+        ]:
+            digest = cached[2]
+        else:
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        self._used_digests[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def _get_version(self, package: str) -> str:
+        if self._distributions is None:
+            self._distributions = dict(
+                importlib.metadata.packages_distributions()
+            )
+        versions = []
+        for name in self._distributions.get(package, []):
+            try:
+                versions.append(f"{name}=={importlib.metadata.version(name)}")
+            except importlib.metadata.PackageNotFoundError:
+                continue
+        return ",".join(sorted(versions))
+
+    def get_fingerprint(self, package: str) -> Optional[str]:
+        """Get the fingerprint of a top-level package, without importing it,
+        or `None` if the package can't be found.
+        """
+        if package in self.stats.packages:
+            return self.stats.packages[package]
+        paths = get_package_files(package)
+        if paths is None:
+            return None
+        h = hashlib.sha256(self._get_version(package).encode())
+        for path in paths:
+            try:
+                digest = self._hash_file(path)
+            except OSError:
+                continue
+            h.update(f"\0{path}\0{digest}".encode())
+        fingerprint = h.hexdigest()
+        self.stats.packages[package] = fingerprint
+        return fingerprint
+
+    def _get_fingerprints(self, packages: List[str]) -> Optional[Dict]:
+        fingerprints = {}
+        for package in packages:
+            fingerprint = self.get_fingerprint(package)
+            if fingerprint is None:
+                return None
+            fingerprints[package] = fingerprint
+        return fingerprints
+
+    def get_lines(self, filename: str, source_digest: str) -> Optional[List]:
+        """Get the cached autosummary lines of a source file, if its source
+        and the documented packages are unchanged.
+        """
+        entry = self.entries.get(filename)
+        if entry is None or entry["source"] != source_digest:
+            return None
+        if self._get_fingerprints(list(entry["packages"])) != (
+            entry["packages"]
+        ):
+            return None
+        self._hit_files.add(filename)
+        return entry["lines"]
+
+    def set_lines(
+        self, filename: str, source_digest: str, lines: List[str]
+    ) -> None:
+        """Store the autosummary lines of a source file."""
+        packages = sorted(
+            {
+                line.split("::", 1)[1].strip().split(".")[0]
+                for line in lines
+                if line.strip().startswith(".. currentmodule::")
+            }
+        )
+        fingerprints = self._get_fingerprints(packages)
+        if fingerprints is None:
+            self.entries.pop(filename, None)
+            return
+        self.entries[filename] = {
+            "source": source_digest,
+            "packages": fingerprints,
+            "lines": lines,
+            "stubs": [],
+        }
+
+    def has_stubs(self, filename: str) -> bool:
+        """Check if the stubs of a source file whose lines came from the
+        cache still exist.
+        """
+        if filename not in self._hit_files:
+            return False
+        return all(
+            os.path.isfile(path) for path in self.entries[filename]["stubs"]
+        )
+
+    def set_stubs(self, filename: str, stubs: List[str]) -> None:
+        """Store the paths of the stub files of a source file."""
+        if filename in self.entries:
+            self.entries[filename]["stubs"] = stubs
+
+
+def get_apicache_stats(app: Sphinx) -> Optional[ApiCacheStats]:
+    """Get the API cache statistics of the current build, or `None` if the
+    extension isn't enabled.
+    """
+    return getattr(app.env, "apicache_stats", None)
+
+
+def _get_cache(app: Any) -> Optional[ApiCache]:
+    return getattr(app, "_spherex_apicache", None)
+
+
+def _wrap_lines(original: Callable) -> Callable:
+    def automodsumm_to_autosummary_lines(fn: str, app: Any) -> List[str]:
+        cache = _get_cache(app)
+        if cache is None:
+            return original(fn, app)
+        with open(os.path.join(app.srcdir, fn), "rb") as f:
+            source_digest = hashlib.sha256(f.read()).hexdigest()
+        lines = cache.get_lines(fn, source_digest)
+        if lines is not None:
+            cache.stats.hits.append(fn)
+            return lines
+        lines = original(fn, app)
+        # Files without automodapi or automodsumm directives don't import
+        # anything, so they aren't cached.
+        if any(line.strip() for line in lines):
+            cache.stats.misses.append(fn)
+            cache.set_lines(fn, source_digest, lines)
+        return lines
+
+    return automodsumm_to_autosummary_lines
+
+
+def _wrap_generate(original: Callable, find_items: Callable) -> Callable:
+    def generate_automodsumm_docs(
+        lines: List[str], srcfn: str, app: Any = None, **kwargs: Any
+    ) -> Any:
+        cache = _get_cache(app)
+        if cache is None:
+            return original(lines, srcfn, app=app, **kwargs)
+        if cache.has_stubs(srcfn):
+            return None
+        result = original(lines, srcfn, app=app, **kwargs)
+        suffix = kwargs.get("suffix", ".rst")
+        base_path = kwargs.get("base_path") or str(app.srcdir)
+        stubs = [
+            os.path.join(
+                os.path.abspath(os.path.join(base_path, path)), name + suffix
+            )
+            for name, path, *_ in find_items(lines, filename=srcfn)
+            if path is not None
+        ]
+        cache.set_stubs(srcfn, sorted(set(stubs)))
+        return result
+
+    return generate_automodsumm_docs
+
+
+def _install() -> None:
+    from sphinx_automodapi import automodsumm
+    from sphinx_automodapi.utils import (
+        find_autosummary_in_lines_for_automodsumm,
+    )
+
+    if getattr(automodsumm, "_spherex_apicache", False):
+        return
+    automodsumm.automodsumm_to_autosummary_lines = _wrap_lines(
+        automodsumm.automodsumm_to_autosummary_lines
+    )
+    automodsumm.generate_automodsumm_docs = _wrap_generate(
+        automodsumm.generate_automodsumm_docs,
+        find_autosummary_in_lines_for_automodsumm,
+    )
+    automodsumm._spherex_apicache = True
+
+
+def open_cache(app: Sphinx) -> None:
+    """Open the API cache before sphinx-automodapi generates the stubs
+    (``builder-inited`` handler).
+    """
+    from sphinx_automodapi import __version__ as automodapi_version
+
+    config_key = hashlib.sha256(
+        json.dumps(
+            [
+                __version__,
+                automodapi_version,
+                *(
+                    repr(app.config[name])
+                    for name in CONFIG_NAMES
+                    if name in app.config
+                ),
+            ]
+        ).encode()
+    ).hexdigest()
+    path = get_cache_dir(Path(app.confdir)) / CACHE_DIR_NAME
+    app._spherex_apicache = ApiCache(  # type: ignore[attr-defined]
+        path / f"{get_project_key(Path(app.srcdir))}.json", config_key
+    )
+
+
+def close_cache(app: Sphinx) -> None:
+    """Save the API cache after sphinx-automodapi generated the stubs, and
+    log the statistics (``builder-inited`` handler).
+    """
+    cache = _get_cache(app)
+    if cache is None:
+        return
+    cache.save()
+    stats = cache.stats
+    app.env.apicache_stats = stats  # type: ignore[attr-defined]
+    if stats.hits or stats.misses:
+        logger.info(
+            "API cache: %d hits, %d misses (%s)",
+            len(stats.hits),
+            len(stats.misses),
+            ", ".join(stats.misses) if stats.misses else "no imports",
+        )
+    # Documents that are read later import their modules as usual.
+    app._spherex_apicache = None  # type: ignore[attr-defined]
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    The extension caches the autosummary lines that sphinx-automodapi
+    generates for each source file with ``automodapi`` or ``automodsumm``
+    directives, which requires importing the documented modules. When a
+    source file and the documented packages are unchanged, the cached lines
+    are used, and the stubs aren't generated again if they exist, so the
+    modules aren't imported at the start of the build.
+    """
+    app.setup_extension("sphinx_automodapi.automodsumm")
+    _install()
+
+    # sphinx-automodapi generates the stubs in a builder-inited handler
+    # with the default priority.
+    app.connect("builder-inited", open_cache, priority=400)
+    app.connect("builder-inited", close_cache, priority=600)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
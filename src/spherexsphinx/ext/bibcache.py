@@ -0,0 +1,206 @@
+"""Persistent cache of parsed BibTeX files for sphinxcontrib-bibtex."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from importlib.metadata import version
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from sphinx.util import logging
+from sphinxcontrib.bibtex import bibfile
+from sphinxcontrib.bibtex.bibfile import BibData
+
+from .. import __version__
+from ..conf._utils import get_cache_dir
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+
+__all__ = ["BibDataCache", "get_bibcache_dir", "setup"]
+
+logger = logging.getLogger(__name__)
+
+
+class BibDataCache:
+    """A cache of parsed bibliography data, keyed by the content of the
+    BibTeX files.
+
+    Each entry holds the `~sphinxcontrib.bibtex.bibfile.BibData` parsed from
+    a sequence of BibTeX files. The key is computed from the files' content
+    (not their paths or modification times), so the cache is reused after a
+    bibliography is downloaded again or checked out in a different
+    directory, and can be shared by several projects.
+
+    Parameters
+    ----------
+    cache_dir
+        The cache directory.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+
+    def make_key(
+        self, bibfilenames: List[Path], encoding: str
+    ) -> Optional[str]:
+        """Compute the cache key for parsing BibTeX files, or `None` if
+        a file can't be read.
+        """
+        h = hashlib.sha256()
+        for item in (
+            __version__,
+            version("pybtex"),
+            version("sphinxcontrib-bibtex"),
+            encoding,
+        ):
+            h.update(f"{item}\0".encode("utf-8"))
+        for filename in bibfilenames:
+            try:
+                content = filename.read_bytes()
+            except OSError:
+                return None
+            h.update(hashlib.sha256(content).digest())
+        return h.hexdigest()
+
+    def _get_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pickle"
+
+    def get(
+        self, key: str, bibfilenames: List[Path]
+    ) -> Optional[tuple[BibData, float]]:
+        """Get cached bibliography data.
+
+        The file paths and modification times in the cached data are
+        updated to those of ``bibfilenames``, so that sphinxcontrib-bibtex
+        considers the data up to date.
+
+        Returns
+        -------
+        tuple or None
+            The bibliography data and the number of seconds it originally
+            took to parse, or `None` if the data isn't cached.
+        """
+        try:
+            with self._get_path(key).open("rb") as f:
+                bibdata, parse_seconds = pickle.load(f)
+        except Exception:
+            return None
+        if not isinstance(bibdata, BibData) or len(bibdata.bibfiles) != len(
+            bibfilenames
+        ):
+            return None
+        bibfiles = {
+            filename: cached._replace(mtime=bibfile.get_mtime(filename))
+            for filename, cached in zip(
+                bibfilenames, bibdata.bibfiles.values()
+            )
+        }
+        return bibdata._replace(bibfiles=bibfiles), parse_seconds
+
+    def set(self, key: str, bibdata: BibData, parse_seconds: float) -> None:
+        """Store parsed bibliography data in the cache."""
+        path = self._get_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically because builds may share the cache.
+            tmp_path = path.with_name(
+                f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            with tmp_path.open("wb") as f:
+                pickle.dump(
+                    (bibdata, parse_seconds), f, pickle.HIGHEST_PROTOCOL
+                )
+            tmp_path.replace(path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.warning("cannot write the bibtex cache %s: %s", path, e)
+
+
+def get_bibcache_dir(app: Sphinx) -> Path:
+    """Get the directory of the bibliography cache (``bibcache_dir``,
+    by default the ``bibtex`` directory of the spherex-sphinx cache
+    directory).
+    """
+    if app.config.bibcache_dir:
+        return Path(app.confdir).joinpath(app.config.bibcache_dir)
+    return get_cache_dir(Path(app.confdir)) / "bibtex"
+
+
+_active_cache: Optional[BibDataCache] = None
+"""The cache used by the patched ``parse_bibdata``. It's set when an
+application's configuration is initialized, since the patch applies to the
+whole process.
+"""
+
+
+def _make_cached_parse_bibdata(
+    parse_bibdata: Callable[[List[Path], str], BibData],
+) -> Callable[[List[Path], str], BibData]:
+    def cached_parse_bibdata(
+        bibfilenames: List[Path], encoding: str
+    ) -> BibData:
+        cache = _active_cache
+        key = cache.make_key(bibfilenames, encoding) if cache else None
+        if cache is None or key is None:
+            return parse_bibdata(bibfilenames, encoding)
+
+        start = time.perf_counter()
+        cached = cache.get(key, bibfilenames)
+        if cached is not None:
+            bibdata, parse_seconds = cached
+            load_seconds = time.perf_counter() - start
+            logger.info(
+                "loaded %d bibtex entries from the cache in %.2fs "
+                "(saved %.2fs)",
+                len(bibdata.data.entries),
+                load_seconds,
+                max(parse_seconds - load_seconds, 0.0),
+            )
+            return bibdata
+
+        start = time.perf_counter()
+        bibdata = parse_bibdata(bibfilenames, encoding)
+        parse_seconds = time.perf_counter() - start
+        cache.set(key, bibdata, parse_seconds)
+        return bibdata
+
+    cached_parse_bibdata.__bibcache__ = True  # type: ignore[attr-defined]
+    return cached_parse_bibdata
+
+
+def init_bibcache(app: Sphinx, config: Any) -> None:
+    """Activate the bibliography cache of the application
+    (``config-inited`` handler).
+    """
+    global _active_cache
+    _active_cache = BibDataCache(get_bibcache_dir(app))
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    sphinxcontrib-bibtex re-parses its BibTeX files when there's no saved
+    build environment, or when a file's modification time changes. This
+    extension replaces its ``parse_bibdata`` function with one that reuses
+    parsed data from a persistent cache while the files' content is
+    unchanged.
+    """
+    app.add_config_value("bibcache_dir", None, "", [str])
+
+    if not hasattr(bibfile.parse_bibdata, "__bibcache__"):
+        cached_parse_bibdata = _make_cached_parse_bibdata(
+            bibfile.parse_bibdata
+        )
+        bibfile.parse_bibdata = cached_parse_bibdata  # type: ignore
+
+    app.connect("config-inited", init_bibcache)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,354 @@
+"""Build profiling: wall time and peak memory of each build phase and
+document.
+"""
+
+from __future__ import annotations
+
+import csv
+import functools
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+import sphinx
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from docutils import nodes
+    from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+
+__all__ = ["BuildProfiler", "get_document_profiles", "setup"]
+
+logger = logging.getLogger(__name__)
+
+WRITE_DIR_NAME = "buildprofile"
+"""Name of the directory in the doctree directory where parallel writer
+processes record the profiles of the documents they write.
+"""
+
+
+def get_maxrss_kb() -> Optional[int]:
+    """Get the peak resident set size of the current process in KiB, or
+    `None` if it isn't available on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes rather than KiB.
+        maxrss //= 1024
+    return int(maxrss)
+
+
+def _get_delta(start: Optional[int], end: Optional[int]) -> Optional[int]:
+    if start is None or end is None:
+        return None
+    return end - start
+
+
+def get_document_profiles(env: BuildEnvironment) -> Dict[str, Dict[str, Any]]:
+    """Get the per-document profiles recorded in the build environment.
+
+    Profiles of the read phase are kept in the environment so that profiles
+    recorded by parallel reader processes are merged into the main process.
+
+    Returns
+    -------
+    dict
+        Mapping of document names to profiles of the read phase. Each
+        profile is a dictionary with the ``read`` wall time (seconds),
+        ``maxrss_kb``, the peak memory (high-water mark) of the process when
+        the document was read, and ``maxrss_delta_kb``, the increase of the
+        peak memory while the document was read.
+    """
+    profiles: Optional[Dict[str, Dict[str, Any]]] = getattr(
+        env, "buildprofile_documents", None
+    )
+    if profiles is None:
+        profiles = {}
+        env.buildprofile_documents = profiles  # type: ignore[attr-defined]
+    return profiles
+
+
+class BuildProfiler:
+    """Records wall time and peak memory of build phases and documents
+    through Sphinx events.
+
+    The read phase of each document is the time from ``source-read`` to
+    ``doctree-read``. The write phase of each document is the builder's
+    ``write_doc`` call, which renders and writes the page. Writer processes
+    of parallel builds record their documents in files in the doctree
+    directory, which are merged at the end of the build.
+    """
+
+    def __init__(self) -> None:
+        self._setup_time = time.perf_counter()
+        self._pid = os.getpid()
+        self._write_dir: Optional[Path] = None
+        self._phase_starts: Dict[str, float] = {}
+        self._phases: Dict[str, Dict[str, Any]] = {}
+        self._read_starts: Dict[str, Tuple[float, Optional[int]]] = {}
+        self._read_docnames: Set[str] = set()
+        self._written: Dict[str, Dict[str, Any]] = {}
+
+    def connect(self, app: Sphinx) -> None:
+        """Connect the profiler's event handlers to the application."""
+        app.connect("builder-inited", self.on_builder_inited)
+        app.connect("env-before-read-docs", self.on_env_before_read_docs)
+        app.connect("source-read", self.on_source_read)
+        app.connect("doctree-read", self.on_doctree_read)
+        app.connect("env-updated", self.on_env_updated)
+        app.connect("env-purge-doc", self.on_env_purge_doc)
+        app.connect("env-merge-info", self.on_env_merge_info)
+        # Run after other build-finished handlers so they're included in
+        # the profile.
+        app.connect("build-finished", self.on_build_finished, priority=1000)
+
+    def _set_phase(self, name: str, start: float) -> None:
+        # The peak memory is the process's high-water mark at the end of
+        # the phase.
+        self._phases[name] = {
+            "seconds": time.perf_counter() - start,
+            "maxrss_kb": get_maxrss_kb(),
+        }
+
+    def _end_phase(self, name: str) -> None:
+        start = self._phase_starts.pop(name, None)
+        if start is not None:
+            self._set_phase(name, start)
+
+    def on_builder_inited(self, app: Sphinx) -> None:
+        self._write_dir = Path(app.doctreedir) / WRITE_DIR_NAME
+        write_doc = app.builder.write_doc
+
+        @functools.wraps(write_doc)
+        def profiled_write_doc(docname: str, doctree: nodes.document) -> None:
+            start = time.perf_counter()
+            maxrss_start = get_maxrss_kb()
+            write_doc(docname, doctree)
+            self._record_write(
+                docname, time.perf_counter() - start, maxrss_start
+            )
+
+        app.builder.write_doc = (  # type: ignore[method-assign]
+            profiled_write_doc
+        )
+
+    def _record_write(
+        self, docname: str, seconds: float, maxrss_start: Optional[int]
+    ) -> None:
+        maxrss = get_maxrss_kb()
+        profile = {
+            "write": seconds,
+            "maxrss_kb": maxrss,
+            "maxrss_delta_kb": _get_delta(maxrss_start, maxrss),
+        }
+        if os.getpid() == self._pid or self._write_dir is None:
+            self._written[docname] = profile
+            return
+        # A parallel writer process, whose memory isn't shared with the
+        # main process.
+        path = self._write_dir / f"write-{os.getpid()}.jsonl"
+        with path.open("a") as f:
+            f.write(json.dumps([docname, profile]) + "\n")
+
+    def _merge_writes(self) -> None:
+        if self._write_dir is None or not self._write_dir.is_dir():
+            return
+        for path in sorted(self._write_dir.glob("write-*.jsonl")):
+            for line in path.read_text().splitlines():
+                docname, profile = json.loads(line)
+                self._written[docname] = profile
+            path.unlink()
+
+    def on_env_before_read_docs(
+        self, app: Sphinx, env: BuildEnvironment, docnames: List[str]
+    ) -> None:
+        self._set_phase("startup", self._setup_time)
+        self._phase_starts["read"] = time.perf_counter()
+        self._read_docnames = set(docnames)
+
+    def on_source_read(
+        self, app: Sphinx, docname: str, source: List[str]
+    ) -> None:
+        self._read_starts[docname] = (time.perf_counter(), get_maxrss_kb())
+
+    def on_doctree_read(self, app: Sphinx, doctree: nodes.document) -> None:
+        docname = app.env.docname
+        start = self._read_starts.pop(docname, None)
+        if start is None:
+            return
+        maxrss = get_maxrss_kb()
+        get_document_profiles(app.env)[docname] = {
+            "read": time.perf_counter() - start[0],
+            "maxrss_kb": maxrss,
+            "maxrss_delta_kb": _get_delta(start[1], maxrss),
+        }
+
+    def on_env_updated(self, app: Sphinx, env: BuildEnvironment) -> None:
+        self._end_phase("read")
+        self._phase_starts["write"] = time.perf_counter()
+        # Remove the records of an interrupted build.
+        if self._write_dir is not None:
+            self._write_dir.mkdir(parents=True, exist_ok=True)
+            for path in self._write_dir.glob("write-*.jsonl"):
+                path.unlink()
+
+    def on_env_purge_doc(
+        self, app: Sphinx, env: BuildEnvironment, docname: str
+    ) -> None:
+        get_document_profiles(env).pop(docname, None)
+
+    def on_env_merge_info(
+        self,
+        app: Sphinx,
+        env: BuildEnvironment,
+        docnames: Set[str],
+        other: BuildEnvironment,
+    ) -> None:
+        profiles = get_document_profiles(env)
+        other_profiles = get_document_profiles(other)
+        for docname in docnames:
+            if docname in other_profiles:
+                profiles[docname] = other_profiles[docname]
+
+    def on_build_finished(
+        self, app: Sphinx, exception: Optional[Exception]
+    ) -> None:
+        if exception is not None:
+            return
+        self._end_phase("write")
+        self._set_phase("total", self._setup_time)
+        self._merge_writes()
+
+        documents = self.collect_documents(app.env)
+        output_dir = get_output_dir(app)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        formats = app.config.buildprofile_formats
+        if "json" in formats:
+            self.write_json(app, documents, output_dir / "buildprofile.json")
+        if "csv" in formats:
+            self.write_csv(documents, output_dir / "buildprofile.csv")
+        self.log_summary(documents, app.config.buildprofile_top)
+
+        # Reset for the next build by the same application.
+        self._read_docnames = set()
+        self._written = {}
+        self._phases = {}
+        self._setup_time = time.perf_counter()
+
+    def collect_documents(self, env: BuildEnvironment) -> List[Dict[str, Any]]:
+        """Collect the profiles of the documents processed in this build,
+        sorted by total time (slowest first).
+        """
+        read_profiles = get_document_profiles(env)
+        documents: List[Dict[str, Any]] = []
+        for docname in sorted(self._read_docnames | set(self._written)):
+            read = read_profiles.get(docname, {})
+            written = self._written.get(docname, {})
+            if docname not in self._read_docnames:
+                read = {}
+            maxrss = [
+                p["maxrss_kb"]
+                for p in (read, written)
+                if p.get("maxrss_kb") is not None
+            ]
+            deltas = [
+                p["maxrss_delta_kb"]
+                for p in (read, written)
+                if p.get("maxrss_delta_kb") is not None
+            ]
+            documents.append(
+                {
+                    "docname": docname,
+                    "read": read.get("read"),
+                    "write": written.get("write"),
+                    "total": read.get("read", 0.0) + written.get("write", 0.0),
+                    "maxrss_kb": max(maxrss) if maxrss else None,
+                    "maxrss_delta_kb": sum(deltas) if deltas else None,
+                }
+            )
+        documents.sort(key=lambda d: d["total"], reverse=True)
+        return documents
+
+    def write_json(
+        self, app: Sphinx, documents: List[Dict[str, Any]], path: Path
+    ) -> None:
+        """Write the profile as a JSON file."""
+        data = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "project": app.config.project,
+            "builder": app.builder.name,
+            "parallel": app.parallel,
+            "sphinx_version": sphinx.__display_version__,
+            "spherex_sphinx_version": __version__,
+            "phases": self._phases,
+            "maxrss_kb": get_maxrss_kb(),
+            "documents": documents,
+        }
+        path.write_text(json.dumps(data, indent=2))
+
+    def write_csv(self, documents: List[Dict[str, Any]], path: Path) -> None:
+        """Write the per-document profiles as a CSV file."""
+        with path.open("w", newline="") as f:
+            writer = csv.DictWriter(
+                f,
+                fieldnames=[
+                    "docname",
+                    "read",
+                    "write",
+                    "total",
+                    "maxrss_kb",
+                    "maxrss_delta_kb",
+                ],
+            )
+            writer.writeheader()
+            writer.writerows(documents)
+
+    def log_summary(self, documents: List[Dict[str, Any]], top: int) -> None:
+        """Log the phase timings and the slowest documents."""
+        phases = ", ".join(
+            f"{name} {phase['seconds']:.2f}s"
+            for name, phase in self._phases.items()
+        )
+        logger.info("build profile: %s", phases)
+        if top <= 0 or not documents:
+            return
+        logger.info(
+            "build profile: %d slowest pages", min(top, len(documents))
+        )
+        for document in documents[:top]:
+            logger.info("  %8.3fs  %s", document["total"], document["docname"])
+
+
+def get_output_dir(app: Sphinx) -> Path:
+    """Get the directory for build profile reports (``buildprofile_dir``,
+    by default ``buildprofile`` next to the builder's output directory).
+    """
+    if app.config.buildprofile_dir:
+        return Path(app.confdir).joinpath(app.config.buildprofile_dir)
+    return Path(app.outdir).parent / "buildprofile"
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook)."""
+    app.add_config_value("buildprofile_dir", None, "", [str])
+    app.add_config_value("buildprofile_formats", ["json", "csv"], "", [list])
+    app.add_config_value("buildprofile_top", 10, "", [int])
+
+    BuildProfiler().connect(app)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,332 @@
+"""Minification and precompression of HTML build output."""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+
+__all__ = [
+    "minify_html",
+    "minify_css",
+    "compress_file",
+    "get_brotli",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "compress.json"
+"""Name of the manifest of compressed files in the doctree directory."""
+
+_HTML_PRESERVE_RE = re.compile(
+    r"(<(pre|textarea|script|style)\b.*?</\2\s*>)",
+    re.DOTALL | re.IGNORECASE,
+)
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[).*?-->", re.DOTALL)
+_HTML_INDENT_RE = re.compile(r"\n\s+")
+
+_CSS_STRING_RE = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')""")
+_CSS_COMMENT_RE = re.compile(r"/\*(?!!).*?\*/", re.DOTALL)
+_CSS_PLACEHOLDER_RE = re.compile("\x00([0-9]+)\x00")
+_CSS_PUNCTUATION_RE = re.compile(r"\s*([{};,>])\s*")
+
+
+def minify_html(html: str) -> str:
+    """Minify HTML by removing comments, indentation and blank lines.
+
+    Whitespace isn't removed entirely, so the rendering of inline content
+    doesn't change. The content of ``pre``, ``textarea``, ``script`` and
+    ``style`` elements is preserved.
+    """
+    parts = _HTML_PRESERVE_RE.split(html)
+    # re.split returns the text between matches, then the groups of each
+    # match (the whole element and its tag name).
+    output: List[str] = []
+    for i in range(0, len(parts), 3):
+        text = _HTML_COMMENT_RE.sub("", parts[i])
+        output.append(_HTML_INDENT_RE.sub("\n", text))
+        if i + 1 < len(parts):
+            output.append(parts[i + 1])
+    return "".join(output).strip() + "\n"
+
+
+def minify_css(css: str) -> str:
+    """Minify CSS by removing comments and unnecessary whitespace.
+
+    Strings and ``/*! ... */`` comments (conventionally used for licenses)
+    are preserved.
+    """
+    strings: List[str] = []
+
+    def stash(match: re.Match) -> str:
+        strings.append(match.group(0))
+        return f"\x00{len(strings) - 1}\x00"
+
+    text = _CSS_STRING_RE.sub(stash, css)
+    text = _CSS_COMMENT_RE.sub("", text)
+    text = re.sub(r"\s+", " ", text)
+    text = _CSS_PUNCTUATION_RE.sub(r"\1", text).replace(";}", "}")
+    text = _CSS_PLACEHOLDER_RE.sub(lambda m: strings[int(m.group(1))], text)
+    return text.strip() + "\n"
+
+
+def get_brotli() -> Optional[ModuleType]:
+    """Get the brotli (or brotlicffi) module, or `None` if neither is
+    installed.
+    """
+    for name in ("brotli", "brotlicffi"):
+        try:
+            return __import__(name)
+        except ImportError:
+            continue
+    return None
+
+
+def compress_file(
+    path: Path,
+    *,
+    minify: bool,
+    formats: List[str],
+    min_size: int,
+    previous_digest: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Minify a file in place and write its precompressed siblings.
+
+    Parameters
+    ----------
+    path
+        Path of the file.
+    minify
+        Minify HTML and CSS files.
+    formats
+        Compression formats: ``gzip`` (``.gz`` files) and ``brotli``
+        (``.br`` files, if the brotli module is installed).
+    min_size
+        Files smaller than this (in bytes, after minification) aren't
+        compressed.
+    previous_digest
+        The digest of the file's content after the previous build. If the
+        minified content has the same digest and the compressed siblings
+        exist, they aren't written again.
+
+    Returns
+    -------
+    dict
+        Statistics: the ``digest`` of the final content, and the ``size``
+        of the original file, the ``minified`` file, and the ``gzip`` and
+        ``brotli`` siblings.
+    """
+    content = path.read_bytes()
+    stats: Dict[str, Any] = {"size": len(content)}
+    if minify and path.suffix in (".html", ".css"):
+        text = content.decode("utf-8")
+        text = (
+            minify_html(text) if path.suffix == ".html" else minify_css(text)
+        )
+        minified = text.encode("utf-8")
+        if minified != content:
+            content = minified
+            path.write_bytes(content)
+    stats["minified"] = len(content)
+    stats["digest"] = hashlib.sha256(content).hexdigest()
+
+    siblings: List[Tuple[str, Path]] = []
+    if "gzip" in formats:
+        siblings.append(("gzip", path.with_name(f"{path.name}.gz")))
+    brotli = get_brotli() if "brotli" in formats else None
+    if brotli is not None:
+        siblings.append(("brotli", path.with_name(f"{path.name}.br")))
+
+    if len(content) < min_size:
+        for _, sibling in siblings:
+            sibling.unlink(missing_ok=True)
+        return stats
+    if stats["digest"] == previous_digest and all(
+        sibling.is_file() for _, sibling in siblings
+    ):
+        for name, sibling in siblings:
+            stats[name] = sibling.stat().st_size
+        return stats
+
+    for name, sibling in siblings:
+        if name == "gzip":
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        else:
+            compressed = brotli.compress(content)  # type: ignore[union-attr]
+        if len(compressed) < len(content):
+            sibling.write_bytes(compressed)
+            stats[name] = len(compressed)
+        else:
+            sibling.unlink(missing_ok=True)
+    return stats
+
+
+def _compress_file_job(
+    args: Tuple[Path, bool, List[str], int, Optional[str]],
+) -> Dict[str, Any]:
+    path, minify, formats, min_size, previous_digest = args
+    return compress_file(
+        path,
+        minify=minify,
+        formats=formats,
+        min_size=min_size,
+        previous_digest=previous_digest,
+    )
+
+
+class CompressManifest:
+    """The digests of the compressed files after the previous build, which
+    is kept in the doctree directory so that it isn't deployed.
+
+    The manifest is ignored if the compression settings change.
+
+    Parameters
+    ----------
+    path
+        Path of the manifest file.
+    settings
+        The compression settings.
+    """
+
+    def __init__(self, path: Path, settings: Dict[str, Any]) -> None:
+        self._path = path
+        self._settings = settings
+        self.digests: Dict[str, str] = {}
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        if data.get("settings") == settings:
+            self.digests = data.get("files", {})
+
+    def save(self) -> None:
+        """Save the manifest."""
+        data = {"settings": self._settings, "files": self.digests}
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._path.write_text(json.dumps(data, indent=2, sort_keys=True))
+
+
+def find_compressible_files(outdir: Path, suffixes: List[str]) -> List[Path]:
+    """Find the files in the output directory with the given suffixes."""
+    suffix_set = set(suffixes)
+    return sorted(
+        path
+        for path in outdir.rglob("*")
+        if path.suffix in suffix_set and path.is_file()
+    )
+
+
+def compress_output(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Minify and precompress the HTML output (``build-finished``
+    handler).
+    """
+    if exception is not None or app.builder.format != "html":
+        return
+    config = app.config
+    start = time.perf_counter()
+    outdir = Path(app.outdir)
+    formats = list(config.compress_formats)
+    if "brotli" in formats and get_brotli() is None:
+        logger.info("brotli isn't installed; skipping .br files")
+        formats.remove("brotli")
+    settings = {
+        "version": __version__,
+        "minify": config.compress_minify,
+        "formats": formats,
+        "min_size": config.compress_min_size,
+    }
+    manifest = CompressManifest(Path(app.doctreedir) / MANIFEST_NAME, settings)
+
+    paths = find_compressible_files(outdir, config.compress_suffixes)
+    jobs = []
+    digests: Dict[str, str] = {}
+    for path in paths:
+        relpath = path.relative_to(outdir).as_posix()
+        previous_digest = manifest.digests.get(relpath)
+        if previous_digest is not None:
+            # The file is unchanged since it was processed in a previous
+            # build, so its compressed siblings are up to date.
+            digest = hashlib.sha256(path.read_bytes()).hexdigest()
+            if digest == previous_digest:
+                digests[relpath] = digest
+                continue
+        jobs.append(
+            (
+                path,
+                config.compress_minify,
+                formats,
+                config.compress_min_size,
+                previous_digest,
+            )
+        )
+
+    max_workers = min(
+        config.compress_parallel or os.cpu_count() or 1, max(len(jobs), 1)
+    )
+    results: List[Dict[str, Any]]
+    if max_workers == 1:
+        results = [_compress_file_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(_compress_file_job, jobs, chunksize=16)
+            )
+
+    skipped = len(digests)
+    for job, stats in zip(jobs, results):
+        digests[job[0].relative_to(outdir).as_posix()] = stats["digest"]
+    manifest.digests = digests
+    manifest.save()
+
+    size = sum(stats["size"] for stats in results)
+    minified = sum(stats["minified"] for stats in results)
+    gzipped = sum(stats.get("gzip", stats["minified"]) for stats in results)
+    logger.info(
+        "compressed %d files (%d unchanged) in %.2fs: %.1f KiB, "
+        "%.1f KiB minified, %.1f KiB gzip",
+        len(jobs),
+        skipped,
+        time.perf_counter() - start,
+        size / 1024,
+        minified / 1024,
+        gzipped / 1024,
+    )
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook)."""
+    app.add_config_value("compress_minify", True, "", [bool])
+    app.add_config_value("compress_formats", ["gzip", "brotli"], "", [list])
+    app.add_config_value(
+        "compress_suffixes",
+        [".html", ".css", ".js", ".json", ".svg", ".txt", ".xml"],
+        "",
+        [list],
+    )
+    app.add_config_value("compress_min_size", 1024, "", [int])
+    app.add_config_value("compress_parallel", None, "", [int])
+
+    # Run after stages that rewrite the output, and before the deploy
+    # manifest and the build profile.
+    app.connect("build-finished", compress_output, priority=800)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
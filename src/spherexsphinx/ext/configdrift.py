@@ -0,0 +1,302 @@
+"""Explanations of the configuration changes that make Sphinx read or write
+every document again.
+"""
+
+from __future__ import annotations
+
+import copy
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from sphinx.application import ENV_PICKLE_FILENAME
+from sphinx.config import is_serializable
+from sphinx.environment import (
+    CONFIG_CHANGED,
+    CONFIG_EXTENSIONS_CHANGED,
+    CONFIG_NEW,
+    BuildEnvironment,
+)
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+    from sphinx.config import Config
+
+__all__ = [
+    "KNOWN_CAUSES",
+    "ConfigChange",
+    "diff_configs",
+    "record_config",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+REPORTED_REBUILDS = ("env", "html")
+"""Rebuild types of the reported configuration values: ``env`` values make
+Sphinx read every document, and ``html`` values make the HTML builder write
+every page.
+"""
+
+KNOWN_CAUSES: Dict[str, str] = {
+    "copyright": (
+        "the default copyright has the current year; set project.copyright "
+        "in spherex.toml, or SOURCE_DATE_EPOCH for reproducible builds"
+    ),
+    "rst_epilog": "read from _rst_epilog.rst",
+    "bibtex_bibfiles": "the .bib files in the documentation directory",
+    "extensions": (
+        "with lazy_extensions, the extensions depend on the file types, "
+        "directives and roles in the sources"
+    ),
+    "html_static_path": (
+        "paths of the spherex-sphinx assets in the cache directory, which "
+        "depend on SPHEREX_SPHINX_CACHE_DIR"
+    ),
+    "templates_path": (
+        "paths in the installed spherex-sphinx package, which differ "
+        "between virtual environments"
+    ),
+    "intersphinx_mapping": (
+        "with prefetching, the inventories are read from paths in the "
+        "cache directory, which depend on SPHEREX_SPHINX_CACHE_DIR"
+    ),
+    "nb_execution_cache_path": (
+        "a path in the cache directory, which depends on "
+        "SPHEREX_SPHINX_CACHE_DIR"
+    ),
+    "html_context": (
+        "includes the Git repository's documentation path for the edit "
+        "button, and the technote metadata from technote.toml"
+    ),
+}
+"""Explanations of the configuration values of spherex-sphinx that are
+computed when the configuration is loaded.
+"""
+
+
+def _get_rebuild(rebuild: Any) -> str:
+    # Old-style boolean rebuild values mean "env".
+    if rebuild is True:
+        return "env"
+    return rebuild or ""
+
+
+@dataclass
+class ConfigChange:
+    """A changed configuration value."""
+
+    name: str
+    """Name of the value."""
+
+    rebuild: str
+    """Rebuild type of the value (``env`` or ``html``)."""
+
+    old: Optional[str]
+    """Representation of the previous value, or `None` if it was unset."""
+
+    new: Optional[str]
+    """Representation of the new value, or `None` if it's unset."""
+
+    @property
+    def cause(self) -> Optional[str]:
+        """The known cause of changes to the value, if any."""
+        return KNOWN_CAUSES.get(self.name)
+
+    def format(self, width: int = 60) -> str:
+        """Format the change for the console, with shortened values."""
+
+        def shorten(value: Optional[str]) -> str:
+            if value is None:
+                return "(unset)"
+            if len(value) > width:
+                return value[: width - 3] + "..."
+            return value
+
+        text = (
+            f"{self.name} ({self.rebuild}): {shorten(self.old)} -> "
+            f"{shorten(self.new)}"
+        )
+        if self.cause:
+            text += f"\n      {self.cause}"
+        return text
+
+
+_UNSET = object()
+
+
+def _equal(old: Any, new: Any) -> bool:
+    try:
+        return bool(old == new)
+    except Exception:
+        return False
+
+
+def diff_configs(old: Config, new: Config) -> List[ConfigChange]:
+    """Find the changed values that affect reading or writing HTML documents
+    between two configurations, in the order of their names.
+
+    Values are compared by equality, like Sphinx compares the configuration
+    of the pickled environment with the new configuration.
+    """
+    changes = []
+    if list(old.extensions) != list(new.extensions):
+        changes.append(
+            ConfigChange(
+                "extensions",
+                "env",
+                repr(list(old.extensions)),
+                repr(list(new.extensions)),
+            )
+        )
+    old_values = {item.name: item for item in old}
+    new_values = {item.name: item for item in new}
+    for name, item in sorted({**old_values, **new_values}.items()):
+        rebuild = _get_rebuild(item.rebuild)
+        if rebuild not in REPORTED_REBUILDS:
+            continue
+        old_item = old_values.get(name)
+        new_item = new_values.get(name)
+        old_value = old_item.value if old_item else _UNSET
+        new_value = new_item.value if new_item else _UNSET
+        if _equal(old_value, new_value):
+            continue
+        changes.append(
+            ConfigChange(
+                name,
+                rebuild,
+                repr(old_value) if old_item else None,
+                repr(new_value) if new_item else None,
+            )
+        )
+    return changes
+
+
+def _make_recording_setup(
+    setup_env: Callable[[BuildEnvironment, Sphinx], None],
+) -> Callable[[BuildEnvironment, Sphinx], None]:
+    def recording_setup(env: BuildEnvironment, app: Sphinx) -> None:
+        # The configuration of a pickled environment is the previous
+        # build's, until Sphinx compares it with the new configuration and
+        # replaces it.
+        previous = env.config
+        if previous is not None:
+            # Compare the values as conf.py and the config-inited handlers
+            # set them, like the new configuration, rather than with the
+            # changes of the extensions that run when the builder is
+            # initialized.
+            inited_values = getattr(env, "spherex_inited_config", {})
+            for name, value in inited_values.items():
+                if name in previous:
+                    setattr(previous, name, value)
+        setup_env(env, app)
+        if hasattr(app, "_spherex_config_changes"):
+            app._spherex_config_changes = (
+                None
+                if previous is None
+                else diff_configs(previous, app.config)
+            )
+
+    recording_setup.__configdrift__ = True  # type: ignore[attr-defined]
+    return recording_setup
+
+
+def record_config(app: Sphinx, config: Config) -> None:
+    """Record the configuration values after the configuration is
+    initialized (``config-inited`` handler).
+
+    Sphinx and other extensions change some values, like
+    ``html_static_path``, when the builder is initialized. The recorded
+    values are saved in the environment, and the next build compares them
+    with its configuration instead of the changed values.
+    """
+    values: Dict[str, Any] = {}
+    for item in config:
+        if not is_serializable(item.value):
+            continue
+        try:
+            values[item.name] = copy.deepcopy(item.value)
+        except Exception:
+            continue
+    app._spherex_inited_config = values  # type: ignore[attr-defined]
+
+
+def report_drift(app: Sphinx) -> None:
+    """Report the configuration values that changed since the previous build
+    when Sphinx reads or writes every document again (``builder-inited``
+    handler).
+    """
+    app.env.spherex_inited_config = getattr(  # type: ignore[attr-defined]
+        app, "_spherex_inited_config", {}
+    )
+    changes = getattr(app, "_spherex_config_changes", None)
+    status = app.env.config_status
+    if changes is None:
+        if (
+            status == CONFIG_NEW
+            and Path(app.doctreedir, ENV_PICKLE_FILENAME).is_file()
+        ):
+            logger.info(
+                "configuration drift: the previous build environment "
+                "couldn't be loaded (a different Sphinx version, or a fresh "
+                "environment was requested), so every document is read"
+            )
+        return
+
+    if status in (CONFIG_CHANGED, CONFIG_EXTENSIONS_CHANGED):
+        env_changes = [c for c in changes if c.rebuild == "env"]
+        _log_changes(
+            "every document is read again because the configuration "
+            "changed",
+            env_changes or changes,
+        )
+    html_changes = [c for c in changes if c.rebuild == "html"]
+    if html_changes and app.builder.format == "html":
+        _log_changes(
+            "every page is written again because the HTML configuration "
+            "changed",
+            html_changes,
+        )
+
+
+def _log_changes(message: str, changes: List[ConfigChange]) -> None:
+    lines = [f"configuration drift: {message}:"]
+    lines.extend(f"    {change.format()}" for change in changes)
+    logger.info("\n".join(lines))
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    When Sphinx loads the pickled environment of the previous build, the
+    extension compares its configuration with the new configuration. When
+    Sphinx reads every document again because the configuration changed, or
+    the HTML builder writes every page again, the extension lists the values
+    that changed, with the known causes of changes to the values that
+    spherex-sphinx computes.
+
+    Sphinx and other extensions change some configuration values when the
+    builder is initialized, so the extension saves the values from before
+    these changes in the environment, and Sphinx compares the new
+    configuration with those values.
+    """
+    app._spherex_config_changes = None  # type: ignore[attr-defined]
+    if not hasattr(BuildEnvironment.setup, "__configdrift__"):
+        BuildEnvironment.setup = _make_recording_setup(  # type: ignore
+            BuildEnvironment.setup
+        )
+
+    # Run after the other config-inited handlers.
+    app.connect("config-inited", record_config, priority=900)
+    # Run after the extensions that change the configuration when the
+    # builder is initialized.
+    app.connect("builder-inited", report_drift, priority=900)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
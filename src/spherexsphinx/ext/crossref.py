@@ -2,17 +2,49 @@
 
 from __future__ import annotations
 
+import bisect
+import difflib
+import hashlib
+import io
 import re
-from typing import TYPE_CHECKING, Optional
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Set
 
 from docutils import nodes
+from pydantic import BaseModel, Field, ValidationError
+from sphinx.errors import ExtensionError
+from sphinx.util import logging
+from sphinx.util.inventory import InventoryFile
+
+from .. import __version__
+from ..conf._intersphinx import InventoryCache, get_inventory_url, is_offline
+from ..conf._utils import get_cache_dir
 
 if TYPE_CHECKING:
     from docutils.nodes import Node, system_message
     from docutils.parsers.rst.states import Inliner
     from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+
+__all__ = [
+    "spherexdoc_link_role",
+    "get_spherexdoc_references",
+    "get_spherexdoc_registry",
+    "SpherexDocument",
+    "SpherexDocRegistry",
+    "InventoryItem",
+    "InventoryIndex",
+    "parse_inventory",
+    "get_spherexdoc_inventory",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
 
-__all__ = ["spherexdoc_link_role", "setup"]
+SPHEREX_DOCS_URL = "https://spherex-docs.ipac.caltech.edu"
+"""Root URL of the SPHEREx documentation site."""
 
 
 def spherexdoc_link_role(
@@ -26,31 +58,546 @@ def spherexdoc_link_role(
 ) -> tuple[list[Node], list[system_message]]:
     """Link to a SPHEREx document or project hosted on
     ``spherex-docs.ipac.caltech.edu`` given the project name (first part of
-    the URL path).
+    the URL path), optionally followed by ``#`` and a label or section
+    anchor in that document.
 
-    Example::
+    Examples::
 
         :spherexdoc:`SSDC-MS-001`
+        :spherexdoc:`SSDC-MS-001#requirements`
+
+    Anchors are resolved with the document's inventory if it's configured
+    with ``spherexdoc_inventories``.
     """
     m = re.search(r"(?P<display>.+)<(?P<reference>.+)>", text)
     if m:
         display_text = m.group("display").strip()
-        path = m.group("reference").lower().strip()
+        reference = m.group("reference").strip()
     else:
         display_text = text
-        path = text.lower().strip()
+        reference = text.strip()
+    path, _, anchor = reference.partition("#")
+    path = path.lower().strip().rstrip("/")
+    anchor = anchor.strip()
+    refuri = f"{SPHEREX_DOCS_URL}/{path}"
 
     if options is None:
         options = {}
 
+    env = getattr(inliner.document.settings, "env", None)
+    if env is not None:
+        recorded_path = f"{path}#{anchor}" if anchor else path
+        get_spherexdoc_references(env).setdefault(env.docname, set()).add(
+            recorded_path
+        )
+
+        registry = get_spherexdoc_registry(env)
+        if registry is not None:
+            document = registry.check_path(
+                path, location=(env.docname, lineno)
+            )
+            if (
+                m is None
+                and not anchor
+                and document is not None
+                and document.title
+                and env.config.spherexdoc_use_titles
+            ):
+                display_text = document.title
+
+        if anchor:
+            handle = path.split("/")[0]
+            inventory = get_spherexdoc_inventory(env, handle)
+            if inventory is not None:
+                item = inventory.check_anchor(
+                    handle, anchor, location=(env.docname, lineno)
+                )
+                if item is not None:
+                    # Inventory URIs are relative to the document's root,
+                    # not to an edition path in the reference.
+                    refuri = f"{SPHEREX_DOCS_URL}/{handle}/{item.uri}"
+                    if m is None and item.dispname:
+                        display_text = item.dispname
+                    anchor = ""
+    if anchor:
+        refuri = f"{refuri}#{anchor}"
+
     node = nodes.reference(
         text=display_text,
-        refuri=f"https://spherex-docs.ipac.caltech.edu/{path}",
+        refuri=refuri,
         **options,
     )
     return [node], []
 
 
-def setup(app: Sphinx) -> None:
+class SpherexDocument(BaseModel):
+    """A SPHEREx document or documentation project in the registry."""
+
+    handle: str = Field(
+        description=(
+            "Document handle, which is also the first part of the URL path "
+            "on spherex-docs.ipac.caltech.edu."
+        ),
+        examples=["SSDC-MS-001"],
+    )
+
+    title: Optional[str] = Field(None, description="Title of the document.")
+
+    editions: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Names of the published editions of the document (the path "
+            "component after ``/v/``)."
+        ),
+    )
+
+
+class _RegistryFile(BaseModel):
+    """Model for the SPHEREx document registry JSON file."""
+
+    documents: List[SpherexDocument] = Field(default_factory=list)
+
+
+class SpherexDocRegistry:
+    """An offline registry of SPHEREx documents, indexed by handle.
+
+    Parameters
+    ----------
+    documents
+        The documents in the registry.
+    digest
+        A digest of the registry's source content, used to detect changes
+        to the registry between builds.
+    """
+
+    def __init__(self, documents: List[SpherexDocument], digest: str) -> None:
+        self._documents: Dict[str, SpherexDocument] = {
+            document.handle.lower(): document for document in documents
+        }
+        self.digest = digest
+
+    def __contains__(self, handle: str) -> bool:
+        return handle.lower() in self._documents
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def get(self, handle: str) -> Optional[SpherexDocument]:
+        """Get a document given its handle (case-insensitive), or `None` if
+        the handle is not in the registry.
+        """
+        return self._documents.get(handle.lower())
+
+    def check_path(
+        self, path: str, *, location: Any = None
+    ) -> Optional[SpherexDocument]:
+        """Get the document referenced by a ``spherexdoc`` path, logging a
+        warning if the document or edition is unknown.
+
+        Parameters
+        ----------
+        path
+            The path on spherex-docs.ipac.caltech.edu. The first path
+            component is the document handle. A path of the form
+            ``{handle}/v/{edition}`` references a specific edition.
+        location
+            The location of the reference, used for warnings.
+
+        Returns
+        -------
+        SpherexDocument or None
+            The document, or `None` if the document is unknown.
+        """
+        parts = path.strip("/").split("/")
+        document = self.get(parts[0])
+        if document is None:
+            logger.warning(
+                "Unknown SPHEREx document %r",
+                parts[0],
+                location=location,
+                type="spherexdoc",
+                subtype="unknown",
+            )
+            return None
+        if len(parts) > 2 and parts[1] == "v" and document.editions:
+            editions = {edition.lower() for edition in document.editions}
+            if parts[2] not in editions:
+                logger.warning(
+                    "Unknown edition %r of SPHEREx document %r",
+                    parts[2],
+                    document.handle,
+                    location=location,
+                    type="spherexdoc",
+                    subtype="unknown",
+                )
+        return document
+
+    @classmethod
+    def parse(cls, content: bytes) -> SpherexDocRegistry:
+        """Parse a registry from the content of a JSON registry file.
+
+        Raises
+        ------
+        pydantic.ValidationError
+            Raised if the registry content is invalid.
+        """
+        data = _RegistryFile.model_validate_json(content)
+        return cls(data.documents, hashlib.sha256(content).hexdigest())
+
+    @classmethod
+    def load(cls, path: Path) -> SpherexDocRegistry:
+        """Load a registry from a JSON registry file.
+
+        Raises
+        ------
+        sphinx.errors.ExtensionError
+            Raised if the registry can't be read or is invalid.
+        """
+        try:
+            return cls.parse(path.read_bytes())
+        except (OSError, ValidationError) as e:
+            raise ExtensionError(
+                f"Cannot load the SPHEREx document registry {path}:\n\n{e}"
+            )
+
+
+@lru_cache(maxsize=8)
+def _load_registry(path: str, mtime_ns: int) -> SpherexDocRegistry:
+    return SpherexDocRegistry.load(Path(path))
+
+
+def get_spherexdoc_registry(
+    env: BuildEnvironment,
+) -> Optional[SpherexDocRegistry]:
+    """Get the SPHEREx document registry configured with
+    ``spherexdoc_registry``, or `None` if no registry is configured.
+
+    The registry is loaded once per process and reloaded only if the file
+    changes.
+    """
+    if not env.config.spherexdoc_registry:
+        return None
+    path = Path(env.srcdir).joinpath(env.config.spherexdoc_registry)
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except OSError:
+        raise ExtensionError(
+            f"The SPHEREx document registry {path} does not exist."
+        )
+    return _load_registry(str(path), mtime_ns)
+
+
+class InventoryItem(NamedTuple):
+    """An object in a Sphinx inventory."""
+
+    name: str
+    """Name of the object, such as a label or document name."""
+
+    role: str
+    """Domain and role of the object, like ``std:label``."""
+
+    uri: str
+    """URI of the object, relative to the project root."""
+
+    dispname: str
+    """Display name of the object, or an empty string if it's the same as
+    the name.
+    """
+
+
+def parse_inventory(content: bytes) -> List[InventoryItem]:
+    """Parse the content of a Sphinx ``objects.inv`` inventory, with
+    Sphinx's own inventory reader.
+
+    Raises
+    ------
+    ValueError
+        Raised if the content isn't a Sphinx inventory.
+    """
+    try:
+        inventory = InventoryFile.load(
+            io.BytesIO(content), "", lambda base, location: location
+        )
+    except zlib.error as e:
+        raise ValueError(f"invalid inventory data: {e}") from e
+    return [
+        InventoryItem(name, role, uri, "" if dispname == "-" else dispname)
+        for role, objects in inventory.items()
+        for name, (_, _, uri, dispname) in objects.items()
+    ]
+
+
+class InventoryIndex:
+    """An in-memory index of the labels, documents and HTML anchors in a
+    SPHEREx document's inventory, for resolving ``spherexdoc`` anchors.
+
+    Parameters
+    ----------
+    items
+        The inventory items. Only ``std:label`` and ``std:doc`` items are
+        indexed.
+    digest
+        A digest of the inventory content, used to detect changes between
+        builds.
+    """
+
+    def __init__(self, items: List[InventoryItem], digest: str) -> None:
+        self.digest = digest
+        self._labels: Dict[str, InventoryItem] = {}
+        self._docs: Dict[str, InventoryItem] = {}
+        self._ids: Dict[str, InventoryItem] = {}
+        for item in items:
+            if item.role == "std:label":
+                self._labels.setdefault(item.name.lower(), item)
+                _, _, fragment = item.uri.partition("#")
+                if fragment:
+                    self._ids.setdefault(fragment.lower(), item)
+            elif item.role == "std:doc":
+                self._docs.setdefault(item.name.lower(), item)
+        self._keys = sorted({*self._labels, *self._docs, *self._ids})
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def resolve(self, anchor: str) -> Optional[InventoryItem]:
+        """Get the item for an anchor, which is a label name, a document
+        name, or an HTML ``id`` (case-insensitive), or `None` if the anchor
+        doesn't exist.
+        """
+        key = anchor.lower()
+        return (
+            self._labels.get(key) or self._docs.get(key) or self._ids.get(key)
+        )
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Get the anchors that start with a prefix, in sorted order."""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keys, prefix)
+        matches: List[str] = []
+        for key in self._keys[start:]:
+            if not key.startswith(prefix) or len(matches) == limit:
+                break
+            matches.append(key)
+        return matches
+
+    def suggest(self, anchor: str, limit: int = 3) -> List[str]:
+        """Suggest existing anchors for a misspelled or incomplete
+        anchor.
+        """
+        suggestions = self.complete(anchor, limit)
+        if len(suggestions) < limit:
+            for key in difflib.get_close_matches(
+                anchor.lower(), self._keys, n=limit
+            ):
+                if key not in suggestions:
+                    suggestions.append(key)
+        return suggestions[:limit]
+
+    def check_anchor(
+        self, handle: str, anchor: str, *, location: Any = None
+    ) -> Optional[InventoryItem]:
+        """Resolve an anchor, logging a warning with suggestions if it
+        doesn't exist.
+        """
+        item = self.resolve(anchor)
+        if item is None:
+            suggestions = self.suggest(anchor)
+            hint = (
+                f" (did you mean {', '.join(repr(s) for s in suggestions)}?)"
+                if suggestions
+                else ""
+            )
+            logger.warning(
+                "Unknown anchor %r in SPHEREx document %r%s",
+                anchor,
+                handle.upper(),
+                hint,
+                location=location,
+                type="spherexdoc",
+                subtype="anchor",
+            )
+        return item
+
+
+@lru_cache(maxsize=32)
+def _load_inventory_index(path: str, digest: str) -> Optional[InventoryIndex]:
+    try:
+        items = parse_inventory(Path(path).read_bytes())
+    except (OSError, ValueError) as e:
+        logger.warning("Cannot read the inventory %s: %s", path, e)
+        return None
+    return InventoryIndex(items, digest)
+
+
+def get_spherexdoc_inventory(
+    env: BuildEnvironment, handle: str
+) -> Optional[InventoryIndex]:
+    """Get the inventory index of a SPHEREx document, or `None` if the
+    document isn't in ``spherexdoc_inventories`` or its inventory isn't
+    available.
+
+    The inventories are fetched into the spherex-sphinx cache before the
+    documents are read (see `update_spherexdoc_inventories`), and each
+    index is loaded once per process.
+    """
+    inventories: Dict[str, List[str]] = getattr(
+        env, "spherexdoc_inventories", {}
+    )
+    entry = inventories.get(handle.lower())
+    if entry is None:
+        return None
+    path, digest = entry
+    return _load_inventory_index(path, digest)
+
+
+def update_spherexdoc_inventories(
+    app: Sphinx,
+    env: BuildEnvironment,
+    added: Set[str],
+    changed: Set[str],
+    removed: Set[str],
+) -> List[str]:
+    """Fetch the inventories in ``spherexdoc_inventories``, and re-read
+    the documents with anchor references to documents whose inventories
+    changed (``env-get-outdated`` handler).
+
+    Inventories are fetched concurrently into the intersphinx directory of
+    the spherex-sphinx cache (see `spherexsphinx.conf._utils.get_cache_dir`),
+    and reused for a day.
+    """
+    handles = [handle.lower() for handle in env.config.spherexdoc_inventories]
+    previous: Dict[str, List[str]] = getattr(env, "spherexdoc_inventories", {})
+    inventories: Dict[str, List[str]] = {}
+    if handles:
+        cache = InventoryCache(
+            get_cache_dir(Path(app.confdir)) / "intersphinx",
+            offline=is_offline(),
+        )
+        urls = {
+            handle: get_inventory_url(f"{SPHEREX_DOCS_URL}/{handle}/")
+            for handle in handles
+        }
+        entries = cache.prefetch(urls.values())
+        for handle, url in urls.items():
+            cached = entries[url]
+            if cached is None:
+                logger.warning(
+                    "Cannot get the inventory of SPHEREx document %r, so its "
+                    "anchors aren't checked",
+                    handle.upper(),
+                    type="spherexdoc",
+                    subtype="inventory",
+                )
+                continue
+            inventories[handle] = [str(cache.get_path(cached)), cached.sha256]
+            # Load the index before parallel readers are forked.
+            get_spherexdoc_inventory(env, handle)
+    env.spherexdoc_inventories = inventories  # type: ignore[attr-defined]
+
+    changed_handles = {
+        handle
+        for handle in {*inventories, *previous}
+        if inventories.get(handle) != previous.get(handle)
+    }
+    if not changed_handles:
+        return []
+    return [
+        docname
+        for docname, paths in get_spherexdoc_references(env).items()
+        if docname not in removed
+        and any(
+            "#" in path and path.split("/")[0].split("#")[0] in changed_handles
+            for path in paths
+        )
+    ]
+
+
+def get_spherexdoc_references(env: BuildEnvironment) -> Dict[str, Set[str]]:
+    """Get the ``spherexdoc`` references recorded in the build environment.
+
+    Parameters
+    ----------
+    env
+        The Sphinx build environment.
+
+    Returns
+    -------
+    dict
+        Mapping of document names to the set of SPHEREx document paths
+        (lowercase) referenced from that document with the ``spherexdoc``
+        role. Anchor references include the anchor after a ``#``.
+    """
+    references: Optional[Dict[str, Set[str]]] = getattr(
+        env, "spherexdoc_references", None
+    )
+    if references is None:
+        references = {}
+        env.spherexdoc_references = references  # type: ignore[attr-defined]
+    return references
+
+
+def purge_spherexdoc_references(
+    app: Sphinx, env: BuildEnvironment, docname: str
+) -> None:
+    """Remove the references recorded for a document that is about to be
+    re-read (``env-purge-doc`` handler).
+    """
+    get_spherexdoc_references(env).pop(docname, None)
+
+
+def merge_spherexdoc_references(
+    app: Sphinx,
+    env: BuildEnvironment,
+    docnames: Set[str],
+    other: BuildEnvironment,
+) -> None:
+    """Merge references recorded by a parallel reader process into the
+    main environment (``env-merge-info`` handler).
+    """
+    references = get_spherexdoc_references(env)
+    other_references = get_spherexdoc_references(other)
+    for docname in docnames:
+        if docname in other_references:
+            references[docname] = other_references[docname]
+
+
+def get_outdated_registry_docs(
+    app: Sphinx,
+    env: BuildEnvironment,
+    added: Set[str],
+    changed: Set[str],
+    removed: Set[str],
+) -> List[str]:
+    """Re-read documents with ``spherexdoc`` references if the registry
+    changed since the last build (``env-get-outdated`` handler).
+    """
+    registry = get_spherexdoc_registry(env)
+    digest = registry.digest if registry is not None else None
+    previous_digest = getattr(env, "spherexdoc_registry_digest", None)
+    env.spherexdoc_registry_digest = digest  # type: ignore[attr-defined]
+    if digest == previous_digest:
+        return []
+    return [
+        docname
+        for docname, paths in get_spherexdoc_references(env).items()
+        if paths and docname not in removed
+    ]
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
     """Set up the extensions (Sphinx hook)."""
+    app.add_config_value("spherexdoc_registry", None, "env", [str])
+    app.add_config_value("spherexdoc_use_titles", False, "env", [bool])
+    app.add_config_value("spherexdoc_inventories", [], "env", [list])
+
     app.add_role("spherexdoc", spherexdoc_link_role)
+    app.connect("env-purge-doc", purge_spherexdoc_references)
+    app.connect("env-merge-info", merge_spherexdoc_references)
+    app.connect("env-get-outdated", get_outdated_registry_docs)
+    app.connect("env-get-outdated", update_spherexdoc_inventories)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,302 @@
+"""Manifest of the content hashes of the HTML output, for incremental
+deploys.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+
+__all__ = [
+    "MANIFEST_NAME",
+    "DeployManifestError",
+    "ManifestDiff",
+    "hash_output",
+    "get_manifest_url",
+    "load_manifest",
+    "diff_manifests",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "deploy-manifest.json"
+"""Name of the deploy manifest in the output directory."""
+
+STAT_CACHE_NAME = "deploymanifest.json"
+"""Name of the cache of file hashes in the doctree directory."""
+
+ALWAYS_EXCLUDE = [MANIFEST_NAME, ".buildinfo", ".buildinfo.bak"]
+"""Output files that are never in the manifest: the manifest itself, and
+Sphinx's record of the build configuration.
+"""
+
+FORMAT_VERSION = 1
+"""Version of the manifest format."""
+
+FileEntries = Dict[str, Dict[str, Any]]
+"""Manifest entries (the ``sha256`` digest and ``size`` of each file), keyed
+by POSIX paths relative to the output directory.
+"""
+
+
+class DeployManifestError(Exception):
+    """Raised when a deploy manifest can't be loaded."""
+
+
+@dataclass
+class ManifestDiff:
+    """The differences between a previously deployed manifest and a new
+    one.
+    """
+
+    added: List[str] = field(default_factory=list)
+    """Paths of files that are only in the new manifest."""
+
+    changed: List[str] = field(default_factory=list)
+    """Paths of files whose content changed."""
+
+    removed: List[str] = field(default_factory=list)
+    """Paths of files that are only in the previous manifest."""
+
+    unchanged: int = 0
+    """Number of files whose content is unchanged."""
+
+    @property
+    def upload(self) -> List[str]:
+        """Paths of the files to upload (added and changed files)."""
+        return sorted(self.added + self.changed)
+
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_output(
+    outdir: Path,
+    *,
+    exclude: Optional[List[str]] = None,
+    stat_cache: Optional[Dict[str, List[Any]]] = None,
+) -> Tuple[FileEntries, Dict[str, List[Any]]]:
+    """Compute the manifest entries of the files in an output directory.
+
+    Parameters
+    ----------
+    outdir
+        The output directory.
+    exclude
+        Glob patterns of paths (relative to ``outdir``) to leave out, in
+        addition to `ALWAYS_EXCLUDE`.
+    stat_cache
+        The size, modification time (in nanoseconds) and digest of each
+        file from a previous call. Files whose size and modification time
+        are unchanged aren't read again.
+
+    Returns
+    -------
+    tuple
+        The manifest entries, and the updated stat cache.
+    """
+    patterns = [*ALWAYS_EXCLUDE, *(exclude or [])]
+    stat_cache = stat_cache or {}
+    new_stat_cache: Dict[str, List[Any]] = {}
+    to_hash: List[Tuple[str, Path, os.stat_result]] = []
+    for root, dirnames, filenames in os.walk(outdir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = Path(root, filename)
+            relpath = path.relative_to(outdir).as_posix()
+            if any(fnmatch(relpath, pattern) for pattern in patterns):
+                continue
+            stat = path.stat()
+            cached = stat_cache.get(relpath)
+            if cached is not None and cached[:2] == [
+                stat.st_size,
+                stat.st_mtime_ns,
+            ]:
+                new_stat_cache[relpath] = cached
+            else:
+                to_hash.append((relpath, path, stat))
+
+    # hashlib releases the GIL while hashing, so threads read and hash
+    # files concurrently.
+    with ThreadPoolExecutor() as executor:
+        digests = executor.map(_hash_file, [item[1] for item in to_hash])
+        for (relpath, _, stat), digest in zip(to_hash, digests):
+            new_stat_cache[relpath] = [stat.st_size, stat.st_mtime_ns, digest]
+
+    entries = {
+        relpath: {"sha256": cached[2], "size": cached[0]}
+        for relpath, cached in sorted(new_stat_cache.items())
+    }
+    return entries, new_stat_cache
+
+
+def get_manifest_url(url: str) -> str:
+    """Get the URL of a deploy manifest given its URL or the URL of its
+    site.
+
+    URLs whose path doesn't end with ``.json`` are sites (or directories),
+    with or without a trailing slash, and :file:`deploy-manifest.json` is
+    appended to their path.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.path.endswith(".json"):
+        return url
+    path = parts.path if parts.path.endswith("/") else f"{parts.path}/"
+    return urllib.parse.urlunsplit(parts._replace(path=path + MANIFEST_NAME))
+
+
+def load_manifest(source: str, *, timeout: float = 30.0) -> FileEntries:
+    """Load the entries of a deploy manifest.
+
+    Parameters
+    ----------
+    source
+        The path or URL of a manifest, or of the directory (or site) that
+        contains :file:`deploy-manifest.json`. URLs are manifests only if
+        their path ends with ``.json`` (see `get_manifest_url`).
+    timeout
+        Timeout for downloading a manifest, in seconds.
+
+    Raises
+    ------
+    DeployManifestError
+        Raised if the manifest can't be read or isn't a deploy manifest.
+    FileNotFoundError
+        Raised if the manifest doesn't exist.
+    """
+    if source.startswith(("http://", "https://")):
+        url = get_manifest_url(source)
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                content = response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                raise FileNotFoundError(url) from e
+            raise DeployManifestError(f"Cannot download {url}: {e}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise DeployManifestError(f"Cannot download {url}: {e}") from e
+    else:
+        path = Path(source)
+        if path.is_dir():
+            path = path / MANIFEST_NAME
+        if not path.exists():
+            raise FileNotFoundError(str(path))
+        try:
+            content = path.read_bytes()
+        except OSError as e:
+            raise DeployManifestError(f"Cannot read {path}: {e}") from e
+
+    try:
+        data = json.loads(content)
+        if data["version"] != FORMAT_VERSION:
+            raise DeployManifestError(
+                f"Unsupported deploy manifest version {data['version']} in "
+                f"{source}."
+            )
+        files: FileEntries = data["files"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise DeployManifestError(
+            f"{source} isn't a valid deploy manifest: {e}"
+        ) from e
+    return files
+
+
+def diff_manifests(
+    previous: FileEntries, current: FileEntries
+) -> ManifestDiff:
+    """Compare a previously deployed manifest with a new one."""
+    diff = ManifestDiff()
+    for relpath, entry in sorted(current.items()):
+        previous_entry = previous.get(relpath)
+        if previous_entry is None:
+            diff.added.append(relpath)
+        elif previous_entry.get("sha256") != entry.get("sha256"):
+            diff.changed.append(relpath)
+        else:
+            diff.unchanged += 1
+    diff.removed = sorted(set(previous) - set(current))
+    return diff
+
+
+def write_deploy_manifest(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Write the deploy manifest to the output directory
+    (``build-finished`` handler).
+    """
+    if exception is not None or app.builder.format != "html":
+        return
+    start = time.perf_counter()
+    outdir = Path(app.outdir)
+    stat_cache_path = Path(app.doctreedir) / STAT_CACHE_NAME
+    try:
+        stat_cache = json.loads(stat_cache_path.read_text())
+    except (OSError, ValueError):
+        stat_cache = {}
+
+    exclude = list(app.config.deploy_manifest_exclude)
+    doctreedir = Path(app.doctreedir).resolve()
+    if doctreedir.is_relative_to(outdir.resolve()):
+        exclude.append(f"{doctreedir.relative_to(outdir.resolve())}/*")
+    entries, stat_cache = hash_output(
+        outdir, exclude=exclude, stat_cache=stat_cache
+    )
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "generator": f"spherex-sphinx {__version__}",
+        "files": entries,
+    }
+    (outdir / MANIFEST_NAME).write_text(
+        json.dumps(manifest, indent=1, sort_keys=True) + "\n"
+    )
+    stat_cache_path.parent.mkdir(parents=True, exist_ok=True)
+    stat_cache_path.write_text(json.dumps(stat_cache))
+    logger.info(
+        "wrote the deploy manifest of %d files in %.2fs",
+        len(entries),
+        time.perf_counter() - start,
+    )
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    At the end of HTML builds, the extension writes
+    :file:`deploy-manifest.json` to the output directory, with the SHA-256
+    digest of each output file. Comparing it with the manifest of the
+    deployed site (with ``spherex-sphinx deploy-diff``) lists the files
+    that need to be uploaded or deleted.
+    """
+    app.add_config_value("deploy_manifest_exclude", [], "", [list])
+
+    # Run after the stages that rewrite or add output files, including
+    # compression, and before the build profile.
+    app.connect("build-finished", write_deploy_manifest, priority=900)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
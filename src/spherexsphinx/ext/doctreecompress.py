@@ -0,0 +1,306 @@
+"""Compressed storage of pickled doctrees and build environments."""
+
+from __future__ import annotations
+
+import importlib
+import lzma
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import IO, TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from sphinx.application import ENV_PICKLE_FILENAME
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+    from sphinx.config import Config
+
+__all__ = [
+    "MAGIC",
+    "compress_pickle",
+    "decompress_pickle",
+    "read_header",
+    "StorageStats",
+    "get_storage_stats",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SPHXZ1"
+"""The first bytes of a compressed pickle file, followed by the method
+(``z`` for zlib or ``x`` for lzma) and the uncompressed size as an
+unsigned 64-bit big-endian integer.
+"""
+
+_HEADER = struct.Struct(f">{len(MAGIC)}scQ")
+
+METHODS = {"zlib": b"z", "lzma": b"x"}
+"""Codes of the compression methods in the header."""
+
+DEFAULT_LEVELS = {"zlib": 6, "lzma": 1}
+"""Default compression levels (the lzma preset)."""
+
+PATCHED_MODULES = (
+    "sphinx.application",
+    "sphinx.builders",
+    "sphinx.environment",
+    "sphinx.versioning",
+)
+"""Sphinx modules whose doctree and environment pickling is routed through
+the compressed pickle module.
+"""
+
+
+def compress_pickle(data: bytes, method: str, level: Optional[int]) -> bytes:
+    """Compress pickled data, with a header that identifies the method and
+    records the uncompressed size.
+    """
+    if level is None:
+        level = DEFAULT_LEVELS[method]
+    if method == "zlib":
+        compressed = zlib.compress(data, level)
+    else:
+        compressed = lzma.compress(data, preset=level)
+    return _HEADER.pack(MAGIC, METHODS[method], len(data)) + compressed
+
+
+def read_header(data: bytes) -> Optional[Tuple[str, int]]:
+    """Read the method and uncompressed size of compressed pickled data, or
+    get `None` if the data isn't compressed.
+    """
+    if not data.startswith(MAGIC) or len(data) < _HEADER.size:
+        return None
+    _, code, size = _HEADER.unpack_from(data)
+    for method, method_code in METHODS.items():
+        if code == method_code:
+            return method, size
+    raise ValueError(f"Unknown compression method {code!r}")
+
+
+def decompress_pickle(data: bytes) -> bytes:
+    """Decompress pickled data from `compress_pickle`. Uncompressed data
+    is returned unchanged.
+    """
+    header = read_header(data)
+    if header is None:
+        return data
+    body = memoryview(data)[_HEADER.size :]
+    if header[0] == "zlib":
+        return zlib.decompress(body)
+    return lzma.decompress(body)
+
+
+@dataclass
+class _Settings:
+    method: str
+    level: Optional[int]
+    environment: bool
+
+
+class _CompressedPickle(ModuleType):
+    """A stand-in for the `pickle` module in Sphinx modules.
+
+    Files in the registered doctree directories are compressed when
+    they're dumped; any compressed data is decompressed when it's loaded.
+    Other functions are the ones of the `pickle` module.
+    """
+
+    def __init__(self) -> None:
+        super().__init__("pickle")
+        # The instance attributes would shadow the methods.
+        self.__dict__.update(
+            {
+                key: value
+                for key, value in pickle.__dict__.items()
+                if not key.startswith("__")
+                and key not in {"dump", "load", "loads"}
+            }
+        )
+        self.settings: Dict[Path, _Settings] = {}
+        self.lock = threading.Lock()
+        self.compress_seconds = 0.0
+        self.decompress_seconds = 0.0
+        self.decompressed = 0
+
+    def _get_settings(self, file: IO) -> Optional[_Settings]:
+        name = getattr(file, "name", None)
+        if not isinstance(name, str) or not self.settings:
+            return None
+        parents = Path(os.path.abspath(name)).parents
+        for doctreedir, settings in self.settings.items():
+            if doctreedir in parents:
+                return settings
+        return None
+
+    def dump(self, obj: Any, file: IO, *args: Any, **kwargs: Any) -> None:
+        settings = self._get_settings(file)
+        name = str(getattr(file, "name", ""))
+        is_env = os.path.basename(name) == ENV_PICKLE_FILENAME
+        if settings is None or (is_env and not settings.environment):
+            pickle.dump(obj, file, *args, **kwargs)
+            return
+        data = pickle.dumps(obj, *args, **kwargs)
+        start = time.perf_counter()
+        file.write(compress_pickle(data, settings.method, settings.level))
+        with self.lock:
+            self.compress_seconds += time.perf_counter() - start
+
+    def load(self, file: IO, **kwargs: Any) -> Any:
+        return self.loads(file.read(), **kwargs)
+
+    def loads(self, data: bytes, **kwargs: Any) -> Any:
+        if data[: len(MAGIC)] == MAGIC:
+            start = time.perf_counter()
+            data = decompress_pickle(data)
+            with self.lock:
+                self.decompress_seconds += time.perf_counter() - start
+                self.decompressed += 1
+        return pickle.loads(data, **kwargs)
+
+
+_compressed_pickle = _CompressedPickle()
+
+
+def _install() -> None:
+    for name in PATCHED_MODULES:
+        module = importlib.import_module(name)
+        module.pickle = _compressed_pickle  # type: ignore[attr-defined]
+
+
+@dataclass
+class StorageStats:
+    """The stored and uncompressed sizes of the pickles in a doctree
+    directory.
+    """
+
+    files: int = 0
+    """Number of doctree and environment pickle files."""
+
+    compressed_files: int = 0
+    """Number of compressed files."""
+
+    stored_bytes: int = 0
+    """Total size of the files."""
+
+    raw_bytes: int = 0
+    """Total uncompressed size of the files."""
+
+    @property
+    def saved_fraction(self) -> float:
+        """Fraction of the uncompressed size saved by compression."""
+        if not self.raw_bytes:
+            return 0.0
+        return 1 - self.stored_bytes / self.raw_bytes
+
+
+def get_storage_stats(doctreedir: Path) -> StorageStats:
+    """Measure the stored and uncompressed sizes of the doctrees and
+    environment pickle in a doctree directory, by reading the headers of
+    the files.
+    """
+    stats = StorageStats()
+    paths = list(doctreedir.rglob("*.doctree"))
+    paths.append(doctreedir / ENV_PICKLE_FILENAME)
+    for path in paths:
+        try:
+            size = path.stat().st_size
+            with path.open("rb") as f:
+                header = read_header(f.read(_HEADER.size))
+        except (OSError, ValueError):
+            continue
+        stats.files += 1
+        stats.stored_bytes += size
+        if header is None:
+            stats.raw_bytes += size
+        else:
+            stats.compressed_files += 1
+            stats.raw_bytes += header[1]
+    return stats
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1000:
+            return f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} GB"
+
+
+def register_doctreedir(app: Sphinx, config: Config) -> None:
+    """Compress the pickles in the application's doctree directory
+    (``config-inited`` handler).
+    """
+    method = config.doctreecompress_method
+    if method not in METHODS:
+        logger.warning(
+            "Unknown doctree compression method %r; use one of %s",
+            method,
+            ", ".join(METHODS),
+            type="doctreecompress",
+        )
+        return
+    _compressed_pickle.settings[Path(app.doctreedir).resolve()] = _Settings(
+        method=method,
+        level=config.doctreecompress_level,
+        environment=config.doctreecompress_environment,
+    )
+
+
+def report_storage(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Log the size savings of the compressed doctrees, and the time spent
+    compressing and decompressing them in this process (``build-finished``
+    handler).
+    """
+    if exception is not None:
+        return
+    stats = get_storage_stats(Path(app.doctreedir))
+    logger.info(
+        "doctree storage: %s (%s uncompressed, %d%% smaller); "
+        "compressed in %.2fs, decompressed %d pickles in %.2fs",
+        _format_size(stats.stored_bytes),
+        _format_size(stats.raw_bytes),
+        round(stats.saved_fraction * 100),
+        _compressed_pickle.compress_seconds,
+        _compressed_pickle.decompressed,
+        _compressed_pickle.decompress_seconds,
+    )
+    # Report each build of a warm application separately.
+    with _compressed_pickle.lock:
+        _compressed_pickle.compress_seconds = 0.0
+        _compressed_pickle.decompress_seconds = 0.0
+        _compressed_pickle.decompressed = 0
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    The extension stores the pickled doctrees in the doctree directory
+    (and optionally the environment pickle) compressed with zlib or lzma,
+    and decompresses them transparently when Sphinx reads them. Sphinx
+    reads uncompressed pickles from previous builds as usual.
+    """
+    app.add_config_value("doctreecompress_method", "zlib", "", [str])
+    app.add_config_value("doctreecompress_level", None, "", [int])
+    app.add_config_value("doctreecompress_environment", False, "", [bool])
+
+    # The environment pickle is loaded after the extensions are set up, so
+    # the loader is already in place.
+    _install()
+    app.connect("config-inited", register_doctreedir)
+    app.connect("build-finished", report_storage, priority=1000)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
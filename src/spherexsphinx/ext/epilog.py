@@ -0,0 +1,423 @@
+"""Substitution definitions and hyperlink targets of the epilog, parsed once
+and shared with every document.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+
+from docutils import nodes
+from docutils.nodes import fully_normalize_name, whitespace_normalize_name
+from docutils.parsers.rst import Parser as RSTParser
+from sphinx import addnodes
+from sphinx.transforms import SphinxTransform
+from sphinx.util import logging
+from sphinx.util.docutils import new_document, sphinx_domains
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+
+__all__ = [
+    "Epilog",
+    "parse_epilog",
+    "EpilogTransform",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+EPILOG_DOCNAME = "_rst_epilog"
+"""Document name of the epilog while it's parsed."""
+
+SUBSTITUTION_PATTERN = re.compile(r"\{\{\s*([A-Za-z_]\w*)")
+"""Pattern of the names in MyST substitution references."""
+
+
+def substitution_key(name: str) -> str:
+    """Get the key of a substitution name in the epilog's digests and the
+    documents' lookups (substitution names are case-insensitive).
+    """
+    return f"|{whitespace_normalize_name(name).lower()}|"
+
+
+def target_key(name: str) -> str:
+    """Get the key of a hyperlink target name in the epilog's digests and
+    the documents' lookups.
+    """
+    return f"_{fully_normalize_name(name)}"
+
+
+@dataclass
+class Epilog:
+    """The substitution definitions and hyperlink targets of an epilog."""
+
+    substitutions: Dict[str, nodes.substitution_definition] = field(
+        default_factory=dict
+    )
+    """Substitution definitions, keyed by their names."""
+
+    targets: Dict[str, nodes.target] = field(default_factory=dict)
+    """External hyperlink targets, keyed by their normalized names."""
+
+    ignored: List[str] = field(default_factory=list)
+    """Descriptions of the other content of the epilog, which isn't shared
+    with the documents.
+    """
+
+    def get_substitution(
+        self, name: str
+    ) -> Optional[nodes.substitution_definition]:
+        """Get a substitution definition by its name, falling back to a
+        case-insensitive match like docutils.
+        """
+        definition = self.substitutions.get(name)
+        if definition is None:
+            normalized = whitespace_normalize_name(name).lower()
+            for other_name, other in self.substitutions.items():
+                if other_name.lower() == normalized:
+                    return other
+        return definition
+
+    @property
+    def digests(self) -> Dict[str, str]:
+        """Content hashes of the definitions, keyed by
+        `substitution_key` and `target_key`.
+        """
+        digests: Dict[str, str] = {}
+        for name, definition in self.substitutions.items():
+            digests[substitution_key(name)] = _digest(definition)
+        for name, target in self.targets.items():
+            digests[target_key(name)] = _digest(target)
+        return digests
+
+    def to_myst_substitutions(self) -> Dict[str, str]:
+        """Convert the substitutions to MyST substitutions, in MyST Markdown
+        syntax.
+
+        Substitutions whose names aren't Python identifiers, or whose
+        content can't be written in Markdown (like directives other than
+        ``replace`` and ``image``), are left out.
+        """
+        substitutions: Dict[str, str] = {}
+        for name, definition in self.substitutions.items():
+            if not name.isidentifier():
+                continue
+            markdown = _to_markdown(definition.children, self.targets)
+            if markdown is not None:
+                substitutions[name] = markdown
+        return substitutions
+
+
+def _digest(node: nodes.Node) -> str:
+    return hashlib.sha256(node.pformat().encode()).hexdigest()
+
+
+def _to_markdown(
+    children: List[nodes.Node], targets: Dict[str, nodes.target]
+) -> Optional[str]:
+    parts: List[str] = []
+    for child in children:
+        if isinstance(child, nodes.Text):
+            parts.append(child.astext())
+        elif isinstance(child, (nodes.emphasis, nodes.strong)):
+            text = _to_markdown(child.children, targets)
+            if text is None:
+                return None
+            marker = "*" if isinstance(child, nodes.emphasis) else "**"
+            parts.append(f"{marker}{text}{marker}")
+        elif isinstance(child, nodes.literal):
+            parts.append(f"`{child.astext()}`")
+        elif isinstance(child, nodes.reference):
+            uri = child.get("refuri")
+            if uri is None and child.get("refname") in targets:
+                uri = targets[child["refname"]].get("refuri")
+            if uri is None:
+                return None
+            parts.append(f"[{child.astext()}]({uri})")
+        elif isinstance(child, nodes.image):
+            parts.append(f"![{child.get('alt', '')}]({child['uri']})")
+        elif isinstance(child, addnodes.pending_xref):
+            role = child["reftype"]
+            if child.get("refdomain") not in (None, "", "std"):
+                role = f"{child['refdomain']}:{role}"
+            target = child["reftarget"]
+            if child.get("refexplicit"):
+                target = f"{child.astext()} <{target}>"
+            parts.append(f"{{{role}}}`{target}`")
+        elif isinstance(child, nodes.target):
+            # The target of an embedded URI, like `text <uri>`_
+            continue
+        else:
+            return None
+    return "".join(parts)
+
+
+def parse_epilog(app: Sphinx, path: Path) -> Epilog:
+    """Parse an epilog file with the reStructuredText parser and the
+    project's roles.
+
+    Parameters
+    ----------
+    app
+        The Sphinx application.
+    path
+        Path of the epilog file.
+
+    Returns
+    -------
+    Epilog
+        The substitution definitions and external hyperlink targets of the
+        epilog.
+    """
+    env = app.env
+    publisher = app.registry.get_publisher(app, "restructuredtext")
+    document = new_document(str(path), publisher.settings)
+    env.prepare_settings(EPILOG_DOCNAME)
+    try:
+        with sphinx_domains(env):
+            RSTParser().parse(path.read_text(), document)
+    finally:
+        env.temp_data.clear()
+        env.ref_context.clear()
+
+    epilog = Epilog()
+    for child in document.children:
+        if isinstance(child, nodes.substitution_definition):
+            for name in child["names"]:
+                epilog.substitutions[name] = child
+        elif isinstance(child, nodes.target) and "refuri" in child:
+            for name in child["names"]:
+                epilog.targets[name] = child
+        elif isinstance(child, nodes.Element) and not isinstance(
+            child, (nodes.comment, nodes.system_message)
+        ):
+            epilog.ignored.append(f"line {child.line}: {child.tagname}")
+    return epilog
+
+
+def _get_lookups(env: BuildEnvironment) -> Dict[str, Set[str]]:
+    """Get the epilog names that each document looked up, keyed by document
+    name.
+    """
+    lookups: Optional[Dict[str, Set[str]]] = getattr(
+        env, "epilog_lookups", None
+    )
+    if lookups is None:
+        lookups = {}
+        env.epilog_lookups = lookups  # type: ignore[attr-defined]
+    return lookups
+
+
+def _set_refdoc(node: nodes.Element, docname: str) -> None:
+    # Cross-references in the epilog are relative to the document that
+    # uses them.
+    for xref in node.findall(addnodes.pending_xref):
+        xref["refdoc"] = docname
+
+
+class EpilogTransform(SphinxTransform):
+    """Add the epilog's substitution definitions and hyperlink targets that
+    a document references, and record which it looked up.
+
+    The transform runs before the docutils transforms that resolve
+    substitution references and hyperlink references.
+    """
+
+    default_priority = 200
+
+    def apply(self, **kwargs: Any) -> None:
+        epilog: Optional[Epilog] = getattr(self.app, "_spherex_epilog", None)
+        if epilog is None:
+            return
+        document = self.document
+        lookups: Set[str] = set()
+        # Definitions can reference other definitions, so add the definitions
+        # until no more are referenced.
+        added = True
+        while added:
+            added = False
+            for sub_ref in list(
+                document.findall(nodes.substitution_reference)
+            ):
+                name = sub_ref["refname"]
+                if name in document.substitution_defs or (
+                    whitespace_normalize_name(name).lower()
+                    in document.substitution_names
+                ):
+                    continue
+                lookups.add(substitution_key(name))
+                definition = epilog.get_substitution(name)
+                if definition is None:
+                    continue
+                definition = definition.deepcopy()
+                _set_refdoc(definition, self.env.docname)
+                document.append(definition)
+                document.note_substitution_def(definition, name, document)
+                added = True
+            for ref in list(document.findall(nodes.reference)):
+                name = ref.get("refname")
+                if name is None or name in document.nameids:
+                    continue
+                lookups.add(target_key(name))
+                target = epilog.targets.get(name)
+                if target is None:
+                    continue
+                target = target.deepcopy()
+                document.append(target)
+                document.note_explicit_target(target, document)
+                added = True
+        if lookups:
+            all_lookups = _get_lookups(self.env)
+            docname = self.env.docname
+            all_lookups[docname] = all_lookups.get(docname, set()) | lookups
+
+
+def record_myst_lookups(app: Sphinx, docname: str, source: List[str]) -> None:
+    """Record the substitution names that a MyST document references
+    (``source-read`` handler).
+    """
+    if Path(app.env.doc2path(docname)).suffix == ".rst":
+        return
+    names = {
+        substitution_key(name)
+        for name in SUBSTITUTION_PATTERN.findall(source[0])
+    }
+    if names:
+        lookups = _get_lookups(app.env)
+        lookups[docname] = lookups.get(docname, set()) | names
+
+
+def load_epilog(app: Sphinx) -> None:
+    """Parse the epilog file and share its substitutions with MyST
+    (``builder-inited`` handler).
+    """
+    app._spherex_epilog = None  # type: ignore[attr-defined]
+    app._spherex_epilog_changes = set()  # type: ignore[attr-defined]
+    path = Path(app.confdir) / app.config.epilog_file
+    if path.is_file():
+        epilog = parse_epilog(app, path)
+    else:
+        epilog = Epilog()
+    if epilog.ignored:
+        logger.warning(
+            "%s has content other than substitution definitions and "
+            "external hyperlink targets, which isn't added to the "
+            "documents: %s",
+            app.config.epilog_file,
+            ", ".join(epilog.ignored),
+            type="epilog",
+        )
+    # Definitions aren't stored in the environment, which is pickled.
+    app._spherex_epilog = epilog  # type: ignore[attr-defined]
+
+    digests = epilog.digests
+    previous: Optional[Dict[str, str]] = getattr(
+        app.env, "epilog_digests", None
+    )
+    if previous is not None:
+        app._spherex_epilog_changes = {  # type: ignore[attr-defined]
+            key
+            for key in previous.keys() | digests.keys()
+            if previous.get(key) != digests.get(key)
+        }
+    app.env.epilog_digests = digests  # type: ignore[attr-defined]
+
+    myst_config = getattr(app.env, "myst_config", None)
+    if myst_config is not None:
+        # The project's own MyST substitutions take priority.
+        app.env.myst_config = (  # type: ignore[attr-defined]
+            dataclasses.replace(
+                myst_config,
+                substitutions={
+                    **epilog.to_myst_substitutions(),
+                    **myst_config.substitutions,
+                },
+            )
+        )
+
+
+def get_outdated_docs(
+    app: Sphinx,
+    env: BuildEnvironment,
+    added: Set[str],
+    changed: Set[str],
+    removed: Set[str],
+) -> List[str]:
+    """Re-read the documents that use the substitutions and targets that
+    changed in the epilog (``env-get-outdated`` handler).
+    """
+    changes: Set[str] = getattr(app, "_spherex_epilog_changes", set())
+    if not changes:
+        return []
+    docnames = sorted(
+        docname
+        for docname, lookups in _get_lookups(env).items()
+        if lookups & changes and docname not in removed
+    )
+    logger.info(
+        "epilog: %d changed definitions (%s), used by %d documents",
+        len(changes),
+        ", ".join(sorted(changes)),
+        len(docnames),
+    )
+    return docnames
+
+
+def purge_lookups(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    """Remove the lookups recorded for a document that is about to be
+    re-read (``env-purge-doc`` handler).
+    """
+    _get_lookups(env).pop(docname, None)
+
+
+def merge_lookups(
+    app: Sphinx,
+    env: BuildEnvironment,
+    docnames: Set[str],
+    other: BuildEnvironment,
+) -> None:
+    """Merge lookups recorded by a parallel reader process into the main
+    environment (``env-merge-info`` handler).
+    """
+    lookups = _get_lookups(env)
+    other_lookups = _get_lookups(other)
+    for docname in docnames:
+        if docname in other_lookups:
+            lookups[docname] = other_lookups[docname]
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    The extension parses the substitution definitions and external
+    hyperlink targets of the epilog file once at the start of each build,
+    adds the ones that each reStructuredText document references to its
+    doctree before the substitutions and references are resolved, and
+    adds the substitutions to the MyST substitutions. Each document's
+    lookups are recorded, so that when the epilog changes, only the
+    documents that use the changed definitions are read again.
+    """
+    # The extension re-reads the affected documents itself.
+    app.add_config_value("epilog_file", "_rst_epilog.rst", "", [str])
+
+    app.add_transform(EpilogTransform)
+    # Run after myst-parser creates its configuration.
+    app.connect("builder-inited", load_epilog, priority=600)
+    app.connect("source-read", record_myst_lookups)
+    app.connect("env-get-outdated", get_outdated_docs)
+    app.connect("env-purge-doc", purge_lookups)
+    app.connect("env-merge-info", merge_lookups)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,140 @@
+"""Content-hashed file names for static assets."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from sphinx.util import logging
+
+from .. import __version__
+from ..conf._utils import get_cache_dir
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+    from sphinx.config import Config
+
+__all__ = [
+    "get_fingerprinted_name",
+    "fingerprint_assets",
+    "rewrite_references",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "asset-manifest.json"
+"""Name of the asset manifest in the output directory."""
+
+
+def get_fingerprinted_name(path: Path, length: int = 10) -> str:
+    """Get the name of a file with a hash of its content, like
+    ``spherex-favicon.1a2b3c4d5e.png``.
+    """
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()[:length]
+    return f"{path.stem}.{digest}{path.suffix}"
+
+
+def rewrite_references(value: Any, names: Dict[str, str]) -> Any:
+    """Replace the asset names in a configuration value, which can be a
+    string or nested lists, tuples and dictionaries of strings.
+
+    Only strings that are exactly an asset name (relative to ``_static``)
+    are replaced.
+    """
+    if isinstance(value, str):
+        return names.get(value, value)
+    if isinstance(value, list):
+        return [rewrite_references(item, names) for item in value]
+    if isinstance(value, tuple):
+        return tuple(rewrite_references(item, names) for item in value)
+    if isinstance(value, dict):
+        return {
+            key: rewrite_references(item, names) for key, item in value.items()
+        }
+    return value
+
+
+def fingerprint_assets(app: Sphinx, config: Config) -> None:
+    """Add fingerprinted copies of the static assets to
+    ``html_static_path``, and rewrite references to the assets in
+    ``html_css_files``, ``html_js_files`` and ``html_theme_options``
+    (``config-inited`` handler).
+
+    The assets are the files (not directories) in ``html_static_path``
+    with the names in ``fingerprint_assets``, or by default the files from
+    spherex-sphinx's ``assets`` directory. The original files are still
+    copied, so existing links to them keep working.
+    """
+    # The assets are in the package, or copied to the cache directory by
+    # get_static_asset_path.
+    assets_dirs = {
+        Path(__file__).parent.parent.joinpath("assets").resolve(),
+        get_cache_dir(Path(app.confdir)).joinpath("assets").resolve(),
+    }
+    copy_dir = Path(app.doctreedir) / "fingerprint"
+    names: Dict[str, str] = {}
+    static_path: List[str] = []
+    for entry in config.html_static_path:
+        path = Path(app.confdir).joinpath(entry)
+        static_path.append(entry)
+        if not path.is_file():
+            continue
+        if config.fingerprint_assets is None:
+            if path.resolve().parent not in assets_dirs:
+                continue
+        elif path.name not in config.fingerprint_assets:
+            continue
+        name = get_fingerprinted_name(path)
+        copy_path = copy_dir / name
+        if not copy_path.is_file():
+            copy_dir.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, copy_path)
+        names[path.name] = name
+        static_path.append(str(copy_path))
+    if not names:
+        return
+
+    config.html_static_path = static_path
+    for name in ("html_css_files", "html_js_files", "html_theme_options"):
+        setattr(config, name, rewrite_references(config[name], names))
+    app.fingerprint_names = names  # type: ignore[attr-defined]
+
+
+def write_manifest(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Write the manifest of fingerprinted assets to the output directory
+    (``build-finished`` handler).
+
+    The manifest maps the paths of the original assets to the paths of the
+    fingerprinted copies, relative to the output directory.
+    """
+    if exception is not None or app.builder.format != "html":
+        return
+    names: Dict[str, str] = getattr(app, "fingerprint_names", {})
+    manifest = {
+        f"_static/{name}": f"_static/{fingerprinted_name}"
+        for name, fingerprinted_name in sorted(names.items())
+    }
+    path = Path(app.outdir) / MANIFEST_NAME
+    path.write_text(json.dumps(manifest, indent=2) + "\n")
+    logger.verbose("wrote the asset manifest to %s", path)
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook)."""
+    app.add_config_value("fingerprint_assets", None, "html", [list])
+
+    # Run after the config-inited handlers of other extensions, which may
+    # add static files.
+    app.connect("config-inited", fingerprint_assets, priority=900)
+    # Before the compression and deploy manifest stages.
+    app.connect("build-finished", write_manifest, priority=400)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,348 @@
+"""Event handler profiling: time spent in each extension's event handlers,
+roles and directives.
+"""
+
+from __future__ import annotations
+
+import csv
+import functools
+import json
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from docutils.parsers.rst import directives, roles
+from sphinx.util import logging
+
+from .. import __version__
+from .buildprofile import get_output_dir
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+
+__all__ = ["HandlerProfiler", "get_document_handler_stats", "setup"]
+
+logger = logging.getLogger(__name__)
+
+HandlerKey = Tuple[str, str]
+"""Key of a handler statistic: the handler's module and the event name (or
+``role:{name}`` and ``directive:{name}`` for roles and directives).
+"""
+
+HandlerStats = Dict[HandlerKey, List[float]]
+"""Mapping of handler keys to cumulative seconds and number of calls."""
+
+
+def get_document_handler_stats(
+    env: BuildEnvironment,
+) -> Dict[str, HandlerStats]:
+    """Get the handler statistics recorded while reading each document.
+
+    Statistics from the read phase are kept in the environment so that
+    statistics recorded by parallel reader processes are merged into the
+    main process.
+    """
+    stats: Optional[Dict[str, HandlerStats]] = getattr(
+        env, "handlerprofile_documents", None
+    )
+    if stats is None:
+        stats = {}
+        env.handlerprofile_documents = stats  # type: ignore[attr-defined]
+    return stats
+
+
+class HandlerProfiler:
+    """Wraps event handlers, roles and directives to record the cumulative
+    time spent in them, attributed to the extension that registered them.
+
+    Times are inclusive: if a handler emits another event, the time of the
+    nested handlers is also counted in the outer handler.
+    """
+
+    def __init__(self, app: Sphinx) -> None:
+        self._app = app
+        self._stats: HandlerStats = {}
+        self._read_docnames: Set[str] = set()
+        self._reading = False
+
+    def install(self) -> None:
+        """Wrap the event handlers that are already connected, and any
+        handlers that are connected later.
+        """
+        events = self._app.events
+        for name, listeners in events.listeners.items():
+            listeners[:] = [
+                listener._replace(
+                    handler=self._wrap_handler(name, listener.handler)
+                )
+                for listener in listeners
+            ]
+
+        connect = events.connect
+
+        @functools.wraps(connect)
+        def timed_connect(name: str, callback: Callable, priority: int) -> int:
+            return connect(name, self._wrap_handler(name, callback), priority)
+
+        events.connect = timed_connect  # type: ignore[method-assign]
+
+    def install_docutils(self) -> None:
+        """Wrap the roles and directives registered with docutils."""
+        registered_roles: Dict[str, Any] = roles._roles  # type: ignore
+        for name, role in list(registered_roles.items()):
+            if callable(role) and not hasattr(role, "__handlerprofile__"):
+                registered_roles[name] = self._wrap_handler(
+                    f"role:{name}", role
+                )
+
+        registered_directives: Dict[str, Any] = (
+            directives._directives  # type: ignore
+        )
+        for name, directive in list(registered_directives.items()):
+            if isinstance(directive, type) and not hasattr(
+                directive, "__handlerprofile__"
+            ):
+                registered_directives[name] = self._wrap_directive(
+                    f"directive:{name}", directive
+                )
+
+    @staticmethod
+    def get_module_name(handler: Any) -> str:
+        """Get the name of the module that defines a handler."""
+        func = getattr(handler, "func", handler)  # functools.partial
+        return getattr(func, "__module__", None) or "unknown"
+
+    def get_extension_name(self, module: str) -> str:
+        """Get the name of the loaded extension that a module belongs to,
+        or the module's top-level package if it isn't part of an extension.
+        """
+        candidates = [
+            extname
+            for extname in self._app.extensions
+            if module == extname or module.startswith(f"{extname}.")
+        ]
+        if candidates:
+            return max(candidates, key=len)
+        return module.split(".")[0]
+
+    def _wrap_handler(self, event: str, handler: Callable) -> Callable:
+        if hasattr(handler, "__handlerprofile__"):
+            return handler
+        key = (self.get_module_name(handler), event)
+        record = self._record
+
+        @functools.wraps(handler)
+        def timed_handler(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                record(key, time.perf_counter() - start)
+
+        timed_handler.__handlerprofile__ = True  # type: ignore[attr-defined]
+        return timed_handler
+
+    def _wrap_directive(self, event: str, directive: type) -> type:
+        key = (self.get_module_name(directive), event)
+        record = self._record
+        original_run = directive.run  # type: ignore[attr-defined]
+
+        def run(self: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return original_run(self)
+            finally:
+                record(key, time.perf_counter() - start)
+
+        return type(
+            directive.__name__,
+            (directive,),
+            {
+                "run": run,
+                "__module__": directive.__module__,
+                "__doc__": directive.__doc__,
+                "__handlerprofile__": True,
+            },
+        )
+
+    def _record(self, key: HandlerKey, seconds: float) -> None:
+        stats = self._stats
+        env = getattr(self._app, "env", None)
+        # Only the read phase is attributed to documents. The builder also
+        # sets the current document while writing (like for
+        # missing-reference handlers), but that time is only counted in the
+        # build's totals.
+        if self._reading and env is not None:
+            docname = env.temp_data.get("docname")
+            if docname is not None:
+                stats = get_document_handler_stats(env).setdefault(docname, {})
+        stat = stats.get(key)
+        if stat is None:
+            stats[key] = [seconds, 1]
+        else:
+            stat[0] += seconds
+            stat[1] += 1
+
+    def on_builder_inited(self, app: Sphinx) -> None:
+        self.install_docutils()
+
+    def on_env_before_read_docs(
+        self, app: Sphinx, env: BuildEnvironment, docnames: List[str]
+    ) -> None:
+        self._read_docnames = set(docnames)
+        self._reading = True
+
+    def on_env_updated(self, app: Sphinx, env: BuildEnvironment) -> None:
+        self._reading = False
+
+    def on_env_purge_doc(
+        self, app: Sphinx, env: BuildEnvironment, docname: str
+    ) -> None:
+        get_document_handler_stats(env).pop(docname, None)
+
+    def on_env_merge_info(
+        self,
+        app: Sphinx,
+        env: BuildEnvironment,
+        docnames: Set[str],
+        other: BuildEnvironment,
+    ) -> None:
+        stats = get_document_handler_stats(env)
+        other_stats = get_document_handler_stats(other)
+        for docname in docnames:
+            if docname in other_stats:
+                stats[docname] = other_stats[docname]
+
+    def on_build_finished(
+        self, app: Sphinx, exception: Optional[Exception]
+    ) -> None:
+        if exception is not None:
+            return
+        rows = self.collect(app.env)
+        output_dir = get_output_dir(app)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        formats = app.config.buildprofile_formats
+        if "json" in formats:
+            self.write_json(rows, output_dir / "handlerprofile.json")
+        if "csv" in formats:
+            self.write_csv(rows, output_dir / "handlerprofile.csv")
+        self.log_summary(rows, app.config.buildprofile_top)
+
+        # Reset for the next build by the same application.
+        self._stats = {}
+        self._read_docnames = set()
+        self._reading = False
+
+    def collect(self, env: BuildEnvironment) -> List[Dict[str, Any]]:
+        """Collect the statistics of this build, including those recorded
+        while reading documents, sorted by cumulative time.
+        """
+        totals: HandlerStats = {}
+        document_stats = get_document_handler_stats(env)
+        for stats in (
+            self._stats,
+            *(
+                document_stats.get(docname, {})
+                for docname in self._read_docnames
+            ),
+        ):
+            for (module, event), (seconds, calls) in stats.items():
+                key = (self.get_extension_name(module), event)
+                total = totals.setdefault(key, [0.0, 0])
+                total[0] += seconds
+                total[1] += calls
+        rows: List[Dict[str, Any]] = [
+            {
+                "extension": extension,
+                "event": event,
+                "seconds": seconds,
+                "calls": int(calls),
+            }
+            for (extension, event), (seconds, calls) in totals.items()
+        ]
+        rows.sort(key=lambda row: row["seconds"], reverse=True)
+        return rows
+
+    @staticmethod
+    def summarize_extensions(
+        rows: List[Dict[str, Any]],
+    ) -> Dict[str, Dict[str, Any]]:
+        """Summarize cumulative time and calls by extension, sorted by
+        cumulative time.
+        """
+        extensions: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            summary = extensions.setdefault(
+                row["extension"], {"seconds": 0.0, "calls": 0}
+            )
+            summary["seconds"] += row["seconds"]
+            summary["calls"] += row["calls"]
+        return dict(
+            sorted(
+                extensions.items(),
+                key=lambda item: item[1]["seconds"],
+                reverse=True,
+            )
+        )
+
+    def write_json(self, rows: List[Dict[str, Any]], path: Path) -> None:
+        """Write the statistics as a JSON file."""
+        data = {
+            "extensions": self.summarize_extensions(rows),
+            "handlers": rows,
+        }
+        path.write_text(json.dumps(data, indent=2))
+
+    def write_csv(self, rows: List[Dict[str, Any]], path: Path) -> None:
+        """Write the statistics as a CSV file."""
+        with path.open("w", newline="") as f:
+            writer = csv.DictWriter(
+                f, fieldnames=["extension", "event", "seconds", "calls"]
+            )
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def log_summary(self, rows: List[Dict[str, Any]], top: int) -> None:
+        """Log the extensions with the most cumulative handler time."""
+        extensions = self.summarize_extensions(rows)
+        if top <= 0 or not extensions:
+            return
+        logger.info(
+            "handler profile: %d slowest extensions",
+            min(top, len(extensions)),
+        )
+        for extname, summary in list(extensions.items())[:top]:
+            logger.info(
+                "  %8.3fs %8d calls  %s",
+                summary["seconds"],
+                summary["calls"],
+                extname,
+            )
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    List this extension first in ``extensions`` so that it can wrap the
+    event handlers of all other extensions as they're connected.
+    """
+    app.setup_extension("spherexsphinx.ext.buildprofile")
+
+    profiler = HandlerProfiler(app)
+    profiler.install()
+    app.connect("builder-inited", profiler.on_builder_inited)
+    app.connect("env-before-read-docs", profiler.on_env_before_read_docs)
+    # Run before the other env-updated handlers, which run after the read
+    # phase.
+    app.connect("env-updated", profiler.on_env_updated, priority=0)
+    app.connect("env-purge-doc", profiler.on_env_purge_doc)
+    app.connect("env-merge-info", profiler.on_env_merge_info)
+    app.connect("build-finished", profiler.on_build_finished, priority=1000)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
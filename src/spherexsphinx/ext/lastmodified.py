@@ -0,0 +1,404 @@
+"""The last Git commit that modified each page, in the HTML page context."""
+
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from sphinx.errors import ConfigError
+from sphinx.util import logging
+from sphinx.util.i18n import format_date
+
+from .. import __version__
+from ..conf._utils import GitRepository, get_cache_dir, get_project_key
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+
+__all__ = [
+    "LastModified",
+    "read_git_log",
+    "LastModifiedMap",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = "lastmodified"
+"""Name of the directory of the last-modified maps (one per source
+directory) in the spherex-sphinx cache directory.
+"""
+
+TEMPLATES_DIR = Path(__file__).parent.parent.joinpath("templates", "base")
+"""Directory of the ``last-modified.html`` theme component."""
+
+
+@dataclass(frozen=True)
+class LastModified:
+    """The last commit that modified a file."""
+
+    commit: str
+    """SHA of the commit."""
+
+    timestamp: int
+    """Commit time, in seconds since the epoch."""
+
+    @property
+    def datetime(self) -> datetime:
+        """The commit time, in UTC."""
+        return datetime.fromtimestamp(self.timestamp, tz=timezone.utc)
+
+
+def read_git_log(
+    working_tree_dir: Path,
+    pathspec: str = ".",
+    revision_range: str = "HEAD",
+) -> Dict[str, LastModified]:
+    """Find the last commit that modified each file, with a single
+    ``git log`` traversal of the history.
+
+    Parameters
+    ----------
+    working_tree_dir
+        The root directory of the Git repository.
+    pathspec
+        Path of the directory (relative to the repository root) whose files
+        are included.
+    revision_range
+        The commits to traverse, like ``HEAD`` or ``<commit>..HEAD``.
+
+    Returns
+    -------
+    dict
+        The last commits, keyed by the paths of the files relative to the
+        repository root (with ``/`` separators). Files that were deleted
+        or renamed away are included too.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        Raised if ``git log`` fails.
+    """
+    output = subprocess.run(
+        [
+            "git",
+            "log",
+            "--no-renames",
+            "--format=%x1e%H %ct",
+            "--name-only",
+            "-z",
+            revision_range,
+            "--",
+            pathspec,
+        ],
+        cwd=working_tree_dir,
+        capture_output=True,
+        check=True,
+    ).stdout.decode("utf-8", errors="surrogateescape")
+
+    paths: Dict[str, LastModified] = {}
+    for record in output.split("\x1e")[1:]:
+        header, *names = record.split("\0")
+        commit, timestamp = header.split()
+        last_modified = LastModified(commit, int(timestamp))
+        for name in names:
+            name = name.lstrip("\n")
+            # The log lists the newest commits first.
+            if name and name not in paths:
+                paths[name] = last_modified
+    return paths
+
+
+class LastModifiedMap:
+    """The last commits of the files in a directory of a Git repository,
+    cached by the HEAD commit.
+
+    When HEAD changes to a descendant of the cached commit, only the new
+    commits are read. Otherwise the whole history is read again.
+
+    In a shallow clone, the oldest fetched commits (the shallow boundary)
+    list every file as added, since their parents aren't fetched. Files
+    whose last commit is a boundary commit don't have a last commit.
+
+    Parameters
+    ----------
+    repo
+        The Git repository.
+    pathspec
+        Path of the directory (relative to the repository root) whose files
+        are included.
+    cache_path
+        Path of the JSON cache file.
+    """
+
+    def __init__(
+        self, repo: GitRepository, pathspec: str, cache_path: Path
+    ) -> None:
+        self.repo = repo
+        self.pathspec = pathspec
+        self.cache_path = cache_path
+        self.paths: Dict[str, LastModified] = {}
+        self.head: Optional[str] = None
+        self.shallow_commits: Set[str] = set()
+        """The shallow boundary commits, if the repository is a shallow
+        clone.
+        """
+        self.updated: Optional[int] = None
+        """Number of files whose commits were read from the new commits, or
+        `None` if the whole history was read.
+        """
+
+    def _load_cache(self) -> Tuple[Optional[str], Dict[str, LastModified]]:
+        try:
+            data = json.loads(self.cache_path.read_text())
+            if (
+                data["version"] != __version__
+                or data["pathspec"] != self.pathspec
+                or data["shallow"] != sorted(self.shallow_commits)
+            ):
+                return None, {}
+            return data["head"], {
+                path: LastModified(*value)
+                for path, value in data["paths"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, {}
+
+    def _save_cache(self) -> None:
+        data = {
+            "version": __version__,
+            "pathspec": self.pathspec,
+            "head": self.head,
+            "shallow": sorted(self.shallow_commits),
+            "paths": {
+                path: [value.commit, value.timestamp]
+                for path, value in self.paths.items()
+            },
+        }
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            # Write atomically because parallel builds may share the cache.
+            tmp_path = self.cache_path.with_name(
+                f"{self.cache_path.name}.{os.getpid()}.tmp"
+            )
+            tmp_path.write_text(json.dumps(data))
+            tmp_path.replace(self.cache_path)
+        except OSError:
+            pass
+
+    def _read_shallow_commits(self) -> Set[str]:
+        try:
+            content = self.repo.common_dir.joinpath("shallow").read_text()
+        except OSError:
+            return set()
+        return set(content.split())
+
+    def _is_ancestor(self, commit: str, head: str) -> bool:
+        return (
+            subprocess.run(
+                ["git", "merge-base", "--is-ancestor", commit, head],
+                cwd=self.repo.working_tree_dir,
+                capture_output=True,
+            ).returncode
+            == 0
+        )
+
+    def update(self) -> None:
+        """Read the last commits of the files, from the cache and the new
+        commits since the cached HEAD.
+
+        Raises
+        ------
+        subprocess.CalledProcessError
+            Raised if ``git log`` fails.
+        """
+        head = self.repo.head_commit
+        # Deepening or unshallowing the clone changes the commits of the
+        # files at the old boundary, so the cache is only used with the
+        # same boundary.
+        self.shallow_commits = self._read_shallow_commits()
+        if head is None:
+            self.head, self.paths = None, {}
+            return
+        cached_head, cached_paths = self._load_cache()
+        if cached_head == head:
+            self.head, self.paths = head, cached_paths
+            self.updated = 0
+            return
+        if cached_head is not None and self._is_ancestor(cached_head, head):
+            new_paths = read_git_log(
+                self.repo.working_tree_dir,
+                self.pathspec,
+                f"{cached_head}..{head}",
+            )
+            self.paths = {**cached_paths, **new_paths}
+            self.updated = len(new_paths)
+        else:
+            self.paths = read_git_log(
+                self.repo.working_tree_dir, self.pathspec, head
+            )
+            self.updated = None
+        self.head = head
+        self._save_cache()
+
+    @property
+    def boundary_count(self) -> int:
+        """Number of files whose last commit is a shallow boundary commit,
+        which are unknown.
+        """
+        return sum(
+            value.commit in self.shallow_commits
+            for value in self.paths.values()
+        )
+
+    def get(self, path: Path) -> Optional[LastModified]:
+        """Get the last commit of a file, given its absolute path, or
+        `None` if the file isn't committed or its last commit is before
+        the history of a shallow clone.
+        """
+        try:
+            relpath = path.resolve().relative_to(self.repo.working_tree_dir)
+        except ValueError:
+            return None
+        last_modified = self.paths.get(relpath.as_posix())
+        if (
+            last_modified is not None
+            and last_modified.commit in self.shallow_commits
+        ):
+            return None
+        return last_modified
+
+
+def load_map(app: Sphinx) -> None:
+    """Build the last-modified map of the source directory (``builder-inited``
+    handler).
+    """
+    app._spherex_lastmodified = None  # type: ignore[attr-defined]
+    if app.builder.format != "html":
+        return
+    srcdir = Path(app.srcdir).resolve()
+    try:
+        repo = GitRepository(srcdir)
+    except ConfigError:
+        logger.info("last-modified dates: the sources aren't in a Git repo")
+        return
+    # Use the documentation directory of the "Edit on GitHub" links, if
+    # it's configured.
+    pathspec = app.config.html_context.get("doc_path") or (
+        srcdir.relative_to(repo.working_tree_dir).as_posix()
+    )
+    last_modified_map = LastModifiedMap(
+        repo,
+        pathspec,
+        get_cache_dir(Path(app.confdir))
+        / CACHE_DIR_NAME
+        / f"{get_project_key(srcdir)}.json",
+    )
+    try:
+        last_modified_map.update()
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(
+            "Cannot read the Git history for last-modified dates: %s",
+            e,
+            type="lastmodified",
+        )
+        return
+    if last_modified_map.shallow_commits:
+        logger.info(
+            "last-modified dates: the repository is a shallow clone, so %d "
+            "files last changed before the fetched history have no date",
+            last_modified_map.boundary_count,
+        )
+    if last_modified_map.updated is None:
+        source = "read the whole history"
+    else:
+        source = f"{last_modified_map.updated} updated from new commits"
+    logger.info(
+        "last-modified dates: %d files (%s)",
+        len(last_modified_map.paths),
+        source,
+    )
+    # The map isn't stored in the environment, which is pickled.
+    app._spherex_lastmodified = (  # type: ignore[attr-defined]
+        last_modified_map
+    )
+
+
+def add_page_context(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Any,
+) -> None:
+    """Add the last commit of the page's source to the page context
+    (``html-page-context`` handler).
+
+    The context gets a ``last_modified`` dictionary with the ``commit``,
+    ``short_commit``, ``timestamp``, ``date`` (ISO 8601) and ``commit_url``
+    (if the project's GitHub URL is known), and ``last_updated`` is set to
+    the page's commit date in the ``html_last_updated_fmt`` format.
+    """
+    last_modified_map: Optional[LastModifiedMap] = getattr(
+        app, "_spherex_lastmodified", None
+    )
+    if last_modified_map is None or pagename not in app.env.all_docs:
+        return
+    last_modified = last_modified_map.get(Path(app.env.doc2path(pagename)))
+    if last_modified is None:
+        # Uncommitted pages, and pages last changed before the history of a
+        # shallow clone
+        return
+    commit_url = None
+    github_url = app.config.lastmodified_github_url
+    if github_url:
+        commit_url = f"{github_url.rstrip('/')}/commit/{last_modified.commit}"
+    context["last_modified"] = {
+        "commit": last_modified.commit,
+        "short_commit": last_modified.commit[:7],
+        "timestamp": last_modified.timestamp,
+        "date": last_modified.datetime.isoformat(),
+        "commit_url": commit_url,
+    }
+    context["last_updated"] = format_date(
+        app.config.html_last_updated_fmt or "%b %d, %Y",
+        date=last_modified.datetime,
+        language=app.config.language,
+    )
+
+
+def add_templates(app: Sphinx, config: Any) -> None:
+    """Add the directory of the ``last-modified.html`` component to the
+    template path (``config-inited`` handler).
+    """
+    templates_path: List[str] = list(config.templates_path)
+    templates_path.append(str(TEMPLATES_DIR))
+    config.templates_path = templates_path
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    The extension finds the last commit that modified each source file with
+    a single ``git log`` traversal at the start of HTML builds, caches the
+    result by HEAD commit in the spherex-sphinx cache directory (reading
+    only the new commits when HEAD moves forward), and adds each page's
+    commit and date to its HTML context. The ``last-modified.html`` theme
+    component shows them.
+    """
+    app.add_config_value("lastmodified_github_url", None, "html", [str])
+
+    app.connect("config-inited", add_templates)
+    app.connect("builder-inited", load_map)
+    app.connect("html-page-context", add_page_context)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
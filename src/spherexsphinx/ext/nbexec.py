@@ -0,0 +1,240 @@
+"""Parallel execution of outdated Jupyter notebooks into the myst-nb
+execution cache.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import nbformat
+from jupyter_cache import get_cache
+from jupyter_cache.base import CacheBundleIn
+from jupyter_cache.cache.db import NbProjectRecord
+from jupyter_cache.executors.utils import single_nb_execution
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from myst_nb.core.config import NbParserConfig
+    from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+
+__all__ = ["find_outdated_notebooks", "execute_notebooks", "setup"]
+
+logger = logging.getLogger(__name__)
+
+ExecutionOutcome = Tuple[Optional[nbformat.NotebookNode], float, Optional[str]]
+"""The executed notebook (or `None` if execution failed), the execution
+time in seconds, and the traceback of a failed execution.
+"""
+
+
+KERNEL_ATTEMPTS = 2
+"""Number of times a notebook is executed if its kernel fails to start or
+dies, which happens when many kernels start at once on a busy machine.
+Errors in the notebook's cells aren't retried.
+"""
+
+
+def get_mystnb_config(app: Sphinx) -> NbParserConfig:
+    """Get the myst-nb configuration, with the resolved path of the
+    execution cache.
+    """
+    return app.env.mystnb_config  # type: ignore[attr-defined]
+
+
+def find_outdated_notebooks(
+    app: Sphinx, docnames: List[str]
+) -> Dict[str, Path]:
+    """Find the notebooks among the documents that aren't in the execution
+    cache, meaning that their code cells changed since they were last
+    executed.
+
+    Notebooks that are excluded from execution by
+    ``nb_execution_excludepatterns`` aren't included.
+
+    Returns
+    -------
+    dict
+        Mapping of document names to the paths of the notebook files.
+    """
+    nb_config = get_mystnb_config(app)
+    cache = get_cache(nb_config.execution_cache_path)
+    outdated: Dict[str, Path] = {}
+    for docname in sorted(docnames):
+        path = Path(app.env.doc2path(docname))
+        if path.suffix != ".ipynb":
+            continue
+        posix_path = PurePosixPath(path.as_posix())
+        if any(
+            posix_path.match(pattern)
+            for pattern in nb_config.execution_excludepatterns
+        ):
+            continue
+        try:
+            notebook = nbformat.read(path, as_version=4)
+            cache.match_cache_notebook(notebook)
+        except KeyError:
+            outdated[docname] = path
+        except Exception as e:
+            logger.warning(
+                "cannot check the execution cache for %s: %s", path, e
+            )
+    return outdated
+
+
+def get_notebook_timeout(app: Sphinx, docname: str) -> Optional[int]:
+    """Get the cell execution timeout of a notebook from the first pattern
+    in ``nbexec_timeouts`` that matches its document name, or
+    ``nb_execution_timeout``.
+    """
+    for pattern, timeout in app.config.nbexec_timeouts.items():
+        if PurePosixPath(docname).match(pattern):
+            return timeout
+    return get_mystnb_config(app).execution_timeout
+
+
+def _execute_notebook(
+    path: Path, timeout: Optional[int], allow_errors: bool, in_temp: bool
+) -> ExecutionOutcome:
+    """Execute a notebook (in a worker process).
+
+    Kernel failures are retried (see `KERNEL_ATTEMPTS`), so that myst-nb
+    doesn't execute the notebook again while it reads it.
+    """
+    exc_string = ""
+    for _ in range(KERNEL_ATTEMPTS):
+        # Execution modifies the notebook, so each attempt reads it again.
+        notebook = nbformat.read(path, as_version=4)
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                cwd = temp_dir if in_temp else str(path.parent)
+                result = single_nb_execution(
+                    notebook,
+                    cwd=os.path.abspath(cwd),
+                    allow_errors=allow_errors,
+                    timeout=timeout,
+                    meta_override=True,
+                )
+        except Exception:
+            # single_nb_execution only catches errors in cells.
+            exc_string = traceback.format_exc()
+            continue
+        if result.err is not None:
+            return None, result.time, result.exc_string
+        return result.nb, result.time, None
+    return None, 0.0, exc_string
+
+
+def execute_notebooks(app: Sphinx, notebooks: Dict[str, Path]) -> None:
+    """Execute notebooks concurrently and add the executed notebooks to
+    the execution cache.
+
+    Failed executions are reported as warnings and recorded in the cache
+    project, like myst-nb does. myst-nb executes the failed notebooks again
+    when it reads them.
+    """
+    if not notebooks:
+        return
+    nb_config = get_mystnb_config(app)
+    cache = get_cache(nb_config.execution_cache_path)
+    max_workers = app.config.nbexec_parallel or os.cpu_count() or 1
+    max_workers = min(max_workers, len(notebooks))
+    logger.info(
+        "executing %d outdated notebook(s) in %d process(es)",
+        len(notebooks),
+        max_workers,
+    )
+
+    start = time.perf_counter()
+    jobs = {
+        docname: (
+            path,
+            get_notebook_timeout(app, docname),
+            nb_config.execution_allow_errors,
+            nb_config.execution_in_temp,
+        )
+        for docname, path in notebooks.items()
+    }
+    outcomes: Dict[str, ExecutionOutcome] = {}
+    if max_workers == 1:
+        for docname, job in jobs.items():
+            outcomes[docname] = _execute_notebook(*job)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                docname: executor.submit(_execute_notebook, *job)
+                for docname, job in jobs.items()
+            }
+            for docname, future in futures.items():
+                try:
+                    outcomes[docname] = future.result()
+                except Exception as e:
+                    outcomes[docname] = (None, 0.0, repr(e))
+
+    for docname, (notebook, seconds, exc_string) in outcomes.items():
+        path = notebooks[docname]
+        record = cache.add_nb_to_project(str(path))
+        NbProjectRecord.remove_tracebacks([record.pk], cache.db)
+        if notebook is None:
+            logger.warning(
+                "executing notebook %s failed:\n%s",
+                path,
+                exc_string,
+                location=docname,
+                type="nbexec",
+            )
+            NbProjectRecord.set_traceback(record.uri, exc_string, cache.db)
+            continue
+        cache.cache_notebook_bundle(
+            CacheBundleIn(
+                notebook, record.uri, data={"execution_seconds": seconds}
+            ),
+            check_validity=False,
+            overwrite=True,
+        )
+        logger.verbose("executed notebook %s in %.2fs", docname, seconds)
+    logger.info(
+        "executed %d notebook(s) in %.2fs",
+        len(notebooks),
+        time.perf_counter() - start,
+    )
+
+
+def execute_outdated_notebooks(
+    app: Sphinx, env: BuildEnvironment, docnames: List[str]
+) -> None:
+    """Execute the outdated notebooks that are about to be read
+    (``env-before-read-docs`` handler).
+    """
+    if get_mystnb_config(app).execution_mode != "cache":
+        return
+    execute_notebooks(app, find_outdated_notebooks(app, docnames))
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    In myst-nb's ``cache`` execution mode, myst-nb executes each outdated
+    notebook one at a time while reading it. This extension executes all of
+    the outdated notebooks in parallel processes before the documents are
+    read, so that myst-nb finds them in the execution cache.
+    """
+    app.setup_extension("myst_nb")
+    app.add_config_value("nbexec_parallel", None, "", [int])
+    app.add_config_value("nbexec_timeouts", {}, "", [dict])
+
+    app.connect("env-before-read-docs", execute_outdated_notebooks)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,429 @@
+"""Deduplication and recompression of the output images of Jupyter
+notebooks.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from docutils import nodes
+from sphinx.util import logging
+
+from .. import __version__
+from ..conf._utils import get_cache_dir
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+    from sphinx.environment import BuildEnvironment
+
+__all__ = [
+    "ImageLimits",
+    "get_pillow",
+    "recompress_image",
+    "store_image",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME = "nbimages"
+"""Name of the directory of the stored images in the spherex-sphinx cache
+directory.
+"""
+
+RECOMPRESSED_FORMATS = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG"}
+"""Pillow formats of the image file suffixes that can be recompressed."""
+
+ImageRecord = Tuple[str, int, int, str]
+"""The content hash of an output image, its size and the size of the stored
+image (in bytes), and the URI of the stored image.
+"""
+
+
+@dataclass(frozen=True)
+class ImageLimits:
+    """Limits of the size of the stored raster images."""
+
+    max_width: Optional[int] = None
+    """Images wider than this (in pixels) are downsampled."""
+
+    max_height: Optional[int] = None
+    """Images taller than this (in pixels) are downsampled."""
+
+    max_bytes: Optional[int] = None
+    """Images larger than this (in bytes) are recompressed."""
+
+    jpeg_quality: int = 85
+    """Quality of recompressed JPEG images."""
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any limit is set."""
+        return any(
+            limit is not None
+            for limit in (self.max_width, self.max_height, self.max_bytes)
+        )
+
+    @property
+    def key(self) -> str:
+        """A short hash of the limits, which names the directory of the
+        images stored with them.
+        """
+        if not self.enabled:
+            return "original"
+        text = (
+            f"{self.max_width}-{self.max_height}-{self.max_bytes}-"
+            f"{self.jpeg_quality}"
+        )
+        return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def get_pillow() -> Optional[ModuleType]:
+    """Get Pillow's ``PIL.Image`` module, or `None` if Pillow isn't
+    installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def recompress_image(data: bytes, suffix: str, limits: ImageLimits) -> bytes:
+    """Downsample or recompress a PNG or JPEG image that exceeds the
+    limits, with Pillow.
+
+    Parameters
+    ----------
+    data
+        Content of the image file.
+    suffix
+        The image file's suffix, like ``.png``.
+    limits
+        The size limits.
+
+    Returns
+    -------
+    bytes
+        Content of the processed image, or the original content if the
+        image is within the limits, isn't a PNG or JPEG image, Pillow isn't
+        installed, or recompressing doesn't make the image smaller.
+    """
+    image_format = RECOMPRESSED_FORMATS.get(suffix.lower())
+    image_module = get_pillow()
+    if image_format is None or image_module is None:
+        return data
+    with image_module.open(io.BytesIO(data)) as image:
+        width, height = image.size
+        resize = (
+            limits.max_width is not None and width > limits.max_width
+        ) or (limits.max_height is not None and height > limits.max_height)
+        if not resize and (
+            limits.max_bytes is None or len(data) <= limits.max_bytes
+        ):
+            return data
+        image.load()
+        if resize:
+            # Keep the aspect ratio.
+            image.thumbnail(
+                (limits.max_width or width, limits.max_height or height),
+                image_module.Resampling.LANCZOS,
+            )
+        output = io.BytesIO()
+        if image_format == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(
+                output, "JPEG", quality=limits.jpeg_quality, optimize=True
+            )
+        else:
+            image.save(output, "PNG", optimize=True)
+    result = output.getvalue()
+    if not resize and len(result) >= len(data):
+        return data
+    return result
+
+
+def store_image(
+    path: Path, store_dir: Path, limits: ImageLimits
+) -> Tuple[Path, str, int, int]:
+    """Store an image once in a directory, by the hash of its content,
+    recompressed if it exceeds the limits.
+
+    Parameters
+    ----------
+    path
+        Path of the image file.
+    store_dir
+        Directory of the stored images.
+    limits
+        The size limits.
+
+    Returns
+    -------
+    path : pathlib.Path
+        Path of the stored image.
+    digest : str
+        The SHA-256 hash of the image's content.
+    size : int
+        Size of the image, in bytes.
+    stored_size : int
+        Size of the stored image, in bytes.
+    """
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()
+    stored_path = store_dir / f"{digest}{path.suffix.lower()}"
+    try:
+        stored_size = stored_path.stat().st_size
+    except OSError:
+        stored = recompress_image(data, path.suffix, limits)
+        store_dir.mkdir(parents=True, exist_ok=True)
+        # Write atomically because parallel readers may store the same
+        # image.
+        tmp_path = stored_path.with_name(
+            f"{stored_path.name}.{os.getpid()}.tmp"
+        )
+        tmp_path.write_bytes(stored)
+        tmp_path.replace(stored_path)
+        stored_size = len(stored)
+    return stored_path, digest, len(data), stored_size
+
+
+def _get_records(env: BuildEnvironment) -> Dict[str, List[ImageRecord]]:
+    """Get the output images of each notebook, keyed by document name."""
+    records: Optional[Dict[str, List[ImageRecord]]] = getattr(
+        env, "nbimages", None
+    )
+    if records is None:
+        records = {}
+        env.nbimages = records  # type: ignore[attr-defined]
+    return records
+
+
+def _get_limits(app: Sphinx) -> ImageLimits:
+    return ImageLimits(
+        max_width=app.config.nbimages_max_width,
+        max_height=app.config.nbimages_max_height,
+        max_bytes=app.config.nbimages_max_bytes,
+        jpeg_quality=app.config.nbimages_jpeg_quality,
+    )
+
+
+def check_pillow(app: Sphinx) -> None:
+    """Report if the image limits can't be applied because Pillow isn't
+    installed (``builder-inited`` handler).
+    """
+    if _get_limits(app).enabled and get_pillow() is None:
+        logger.info(
+            "notebook images: Pillow isn't installed, so oversized images "
+            "aren't downsampled or recompressed (install the images extra)"
+        )
+
+
+def process_images(app: Sphinx, doctree: nodes.document) -> None:
+    """Replace the notebook output images of a document with the stored
+    images (``doctree-read`` handler).
+
+    The handler runs before Sphinx collects the images of the document, so
+    Sphinx copies each stored image to the output once.
+    """
+    nb_config = getattr(app.env, "mystnb_config", None)
+    output_folder = getattr(nb_config, "output_folder", None)
+    if not output_folder:
+        return
+    output_dir = Path(output_folder).resolve()
+    srcdir = Path(app.srcdir).resolve()
+    docname = app.env.docname
+    limits = _get_limits(app)
+    store_dir = (
+        get_cache_dir(Path(app.confdir)).resolve()
+        / CACHE_DIR_NAME
+        / limits.key
+    )
+    records: List[ImageRecord] = []
+    for node in doctree.findall(nodes.image):
+        uri = node.get("uri", "")
+        if uri.startswith("/"):
+            path = srcdir / uri[1:]
+        else:
+            path = Path(app.env.doc2path(docname)).parent / uri
+        path = path.resolve()
+        if output_dir not in path.parents:
+            continue
+        try:
+            stored_path, digest, size, stored_size = store_image(
+                path, store_dir, limits
+            )
+        except OSError as e:
+            logger.warning(
+                "Cannot store notebook image %s: %s",
+                path,
+                e,
+                location=node,
+                type="nbimages",
+            )
+            continue
+        # Sphinx reads paths starting with "/" relative to the source
+        # directory.
+        uri = "/" + Path(os.path.relpath(stored_path, srcdir)).as_posix()
+        node["uri"] = uri
+        records.append((digest, size, stored_size, uri))
+    if records:
+        _get_records(app.env)[docname] = records
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1000:
+            return f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} GB"
+
+
+def note_read_docs(
+    app: Sphinx, env: BuildEnvironment, docnames: List[str]
+) -> None:
+    """Remember the documents that are read in this build
+    (``env-before-read-docs`` handler).
+    """
+    app._spherex_nbimages_read = set(docnames)  # type: ignore[attr-defined]
+
+
+def report_savings(app: Sphinx, env: BuildEnvironment) -> List[str]:
+    """Report the bytes saved for each notebook read in this build, and for
+    the whole project (``env-updated`` handler).
+
+    An image that several notebooks output is counted as stored by the
+    first of them (in the order of their document names).
+    """
+    records = _get_records(env)
+    if not records:
+        return []
+    owners: Dict[str, str] = {}
+    stored_sizes: Dict[str, int] = {}
+    for docname in sorted(records):
+        for digest, _, stored_size, _ in records[docname]:
+            owners.setdefault(digest, docname)
+            stored_sizes[digest] = stored_size
+
+    read_docs: Set[str] = getattr(app, "_spherex_nbimages_read", set())
+    for docname in sorted(read_docs & records.keys()):
+        doc_records = records[docname]
+        digests = {digest for digest, _, _, _ in doc_records}
+        original = sum(size for _, size, _, _ in doc_records)
+        stored = sum(
+            stored_sizes[digest]
+            for digest in digests
+            if owners[digest] == docname
+        )
+        logger.info(
+            "notebook images: %s: %d images (%d unique), %s -> %s "
+            "(saved %s)",
+            docname,
+            len(doc_records),
+            len(digests),
+            _format_size(original),
+            _format_size(stored),
+            _format_size(original - stored),
+        )
+
+    original = sum(
+        size
+        for doc_records in records.values()
+        for _, size, _, _ in doc_records
+    )
+    stored = sum(stored_sizes.values())
+    logger.info(
+        "notebook images: %d images (%d unique) in %d notebooks, %s -> %s "
+        "(saved %s)",
+        sum(len(doc_records) for doc_records in records.values()),
+        len(stored_sizes),
+        len(records),
+        _format_size(original),
+        _format_size(stored),
+        _format_size(original - stored),
+    )
+    return []
+
+
+def get_outdated_docs(
+    app: Sphinx,
+    env: BuildEnvironment,
+    added: Set[str],
+    changed: Set[str],
+    removed: Set[str],
+) -> List[str]:
+    """Re-read the notebooks whose stored images are missing, like after
+    the cache directory is cleared (``env-get-outdated`` handler).
+    """
+    srcdir = Path(app.srcdir)
+    return [
+        docname
+        for docname, doc_records in _get_records(env).items()
+        if docname not in removed
+        and any(
+            not srcdir.joinpath(uri[1:]).is_file()
+            for _, _, _, uri in doc_records
+        )
+    ]
+
+
+def purge_records(app: Sphinx, env: BuildEnvironment, docname: str) -> None:
+    """Remove the images recorded for a document that is about to be
+    re-read (``env-purge-doc`` handler).
+    """
+    _get_records(env).pop(docname, None)
+
+
+def merge_records(
+    app: Sphinx,
+    env: BuildEnvironment,
+    docnames: Set[str],
+    other: BuildEnvironment,
+) -> None:
+    """Merge images recorded by a parallel reader process into the main
+    environment (``env-merge-info`` handler).
+    """
+    records = _get_records(env)
+    other_records = _get_records(other)
+    for docname in docnames:
+        if docname in other_records:
+            records[docname] = other_records[docname]
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    The extension stores the output images that myst-nb writes for each
+    notebook in the ``nbimages`` directory of the spherex-sphinx cache
+    directory, named by the hash of their content, so that each unique
+    image is copied to the output once, however many notebooks output it.
+    With Pillow installed, PNG and JPEG images that exceed the configured
+    dimensions or size are downsampled or recompressed when they're
+    stored. The bytes saved for each notebook are reported after reading.
+    """
+    app.add_config_value("nbimages_max_width", None, "env", [int])
+    app.add_config_value("nbimages_max_height", None, "env", [int])
+    app.add_config_value("nbimages_max_bytes", None, "env", [int])
+    app.add_config_value("nbimages_jpeg_quality", 85, "env", [int])
+
+    app.connect("builder-inited", check_pillow)
+    app.connect("env-before-read-docs", note_read_docs)
+    # Run before Sphinx's image collector.
+    app.connect("doctree-read", process_images, priority=400)
+    app.connect("env-updated", report_savings)
+    app.connect("env-get-outdated", get_outdated_docs)
+    app.connect("env-purge-doc", purge_records)
+    app.connect("env-merge-info", merge_records)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
@@ -0,0 +1,292 @@
+"""A search index that's split into shards that the browser loads on
+demand.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from sphinx.search import js_index
+from sphinx.util import logging
+
+from .. import __version__
+
+if TYPE_CHECKING:
+    from sphinx.application import Sphinx
+
+__all__ = [
+    "get_ngrams",
+    "get_shard_key",
+    "shard_ngram_index",
+    "shard_search_index",
+    "write_sharded_index",
+    "setup",
+]
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR = "_static/searchindex"
+"""Directory of the shards in the output directory."""
+
+NGRAM_DIR = "ngrams"
+"""Directory of the n-gram shards in `SHARD_DIR`."""
+
+NGRAM_LENGTH = 3
+"""Length of the character sequences of the terms that are mapped to their
+shards. Sphinx matches query terms of at least this length anywhere in the
+indexed terms.
+"""
+
+FULL_INDEX_NAME = "searchindex.js"
+"""Name of the complete search index in the doctree directory, which
+Sphinx reads back in incremental builds.
+"""
+
+LOADER_PATH = Path(__file__).parent.parent.joinpath(
+    "assets", "spherex-searchshards.js"
+)
+"""Path of the script that loads shards in the browser, which is prepended
+to the base index.
+"""
+
+
+def get_shard_key(term: str, prefix_length: int) -> str:
+    """Get the key of the shard of a search term, which is the hexadecimal
+    UTF-8 encoding of the first ``prefix_length`` characters of the term.
+    """
+    return term[:prefix_length].encode("utf-8").hex()
+
+
+def get_ngrams(term: str) -> Set[str]:
+    """Get the sequences of `NGRAM_LENGTH` characters of a term."""
+    return {
+        term[i : i + NGRAM_LENGTH] for i in range(len(term) - NGRAM_LENGTH + 1)
+    }
+
+
+def shard_ngram_index(
+    shards: Dict[str, Dict[str, Any]], prefix_length: int
+) -> Dict[str, Dict[str, List[int]]]:
+    """Map the n-grams of the terms in shards to the shards that have them,
+    split into n-gram shards.
+
+    The browser uses the n-gram shards to load the shards that can have
+    partial matches of a query term: the shards that have all the n-grams
+    of the query term.
+
+    Parameters
+    ----------
+    shards
+        The shards, from `shard_search_index`.
+    prefix_length
+        Number of leading characters of the n-grams that determines their
+        n-gram shard.
+
+    Returns
+    -------
+    dict
+        The n-gram shards, keyed by the `get_shard_key` of their n-grams.
+        Each maps n-grams to the indexes of the shards that have them, in
+        the sorted shard keys.
+    """
+    ngram_shards: Dict[str, Dict[str, List[int]]] = {}
+    for i, key in enumerate(sorted(shards)):
+        ngrams: Set[str] = set()
+        for field in ("terms", "titleterms"):
+            for term in shards[key][field]:
+                ngrams.update(get_ngrams(term))
+        for ngram in sorted(ngrams):
+            ngram_shards.setdefault(
+                get_shard_key(ngram, prefix_length), {}
+            ).setdefault(ngram, []).append(i)
+    return ngram_shards
+
+
+def shard_search_index(
+    index: Dict[str, Any], prefix_length: int
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Split the terms of a frozen Sphinx search index into shards.
+
+    Parameters
+    ----------
+    index
+        The search index data, as in ``searchindex.js``.
+    prefix_length
+        Number of leading characters of the terms that determines their
+        shard.
+
+    Returns
+    -------
+    tuple
+        The base index, without the ``terms`` and ``titleterms`` of the
+        documents, and the shards keyed by `get_shard_key`. Each shard has
+        the ``terms`` and ``titleterms`` whose keys are in the shard.
+    """
+    shards: Dict[str, Dict[str, Any]] = {}
+    for field in ("terms", "titleterms"):
+        for term, docs in index[field].items():
+            key = get_shard_key(term, prefix_length)
+            shard = shards.setdefault(key, {"terms": {}, "titleterms": {}})
+            shard[field][term] = docs
+    base = dict(index, terms={}, titleterms={})
+    return base, shards
+
+
+def _write_if_changed(path: Path, content: str) -> bool:
+    """Write a file unless it already has the content, which keeps the
+    modification times of unchanged files for the caches of later build
+    stages.
+    """
+    data = content.encode("utf-8")
+    try:
+        if path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    path.write_bytes(data)
+    return True
+
+
+def redirect_search_index(app: Sphinx) -> None:
+    """Make the HTML builder write the complete search index to the
+    doctree directory (``builder-inited`` handler).
+
+    Sphinx reads the previous index back in incremental builds, so it
+    needs the complete index rather than the sharded one in the output
+    directory.
+    """
+    if not _is_sharded(app):
+        return
+    # The builder joins the output directory with the file name, which
+    # gives the absolute path in the doctree directory.
+    app.builder.searchindex_filename = str(  # type: ignore[attr-defined]
+        Path(app.doctreedir).resolve() / FULL_INDEX_NAME
+    )
+
+
+def _is_sharded(app: Sphinx) -> bool:
+    return (
+        app.builder.format == "html"
+        and getattr(app.builder, "indexer_format", None) is js_index
+        and getattr(app.builder, "search", False)
+    )
+
+
+def _write_shard_files(
+    directory: Path, function: str, shards: Dict[str, Any]
+) -> Tuple[Dict[str, str], int]:
+    """Write shards as scripts that pass them to a function of the loader,
+    and remove the shards that no longer exist.
+
+    Returns
+    -------
+    tuple
+        The digests of the shards (for their URLs), keyed by shard key,
+        and the number of shard files that were written.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    digests: Dict[str, str] = {}
+    written = 0
+    for key, shard in sorted(shards.items()):
+        data = json.dumps(shard, sort_keys=True, separators=(",", ":"))
+        content = f'Search.{function}("{key}",{data})\n'
+        digests[key] = hashlib.sha256(content.encode("utf-8")).hexdigest()[:10]
+        written += _write_if_changed(directory / f"{key}.js", content)
+    for path in directory.glob("*.js"):
+        if path.stem not in shards:
+            path.unlink()
+    return digests, written
+
+
+def write_sharded_index(
+    index: Dict[str, Any], outdir: Path, prefix_length: int
+) -> Tuple[int, int]:
+    """Write a search index as a base ``searchindex.js`` file, shards of
+    its terms, and n-gram shards.
+
+    The base index only has the digests of the shards besides Sphinx's
+    document data, so its size doesn't grow with the number of terms.
+
+    Parameters
+    ----------
+    index
+        The search index data, as in ``searchindex.js``.
+    outdir
+        The HTML output directory.
+    prefix_length
+        Number of leading characters of the terms (and n-grams) that
+        determines their shard.
+
+    Returns
+    -------
+    tuple
+        The number of shards, and the number of shard files written.
+    """
+    base, shards = shard_search_index(index, prefix_length)
+    shard_dir = outdir / SHARD_DIR
+    digests, written = _write_shard_files(shard_dir, "addShard", shards)
+    ngram_digests, ngrams_written = _write_shard_files(
+        shard_dir / NGRAM_DIR,
+        "addNgramShard",
+        shard_ngram_index(shards, prefix_length),
+    )
+    base["shards"] = {
+        "prefix": prefix_length,
+        "shards": digests,
+        "ngram": NGRAM_LENGTH,
+        "ngrams": ngram_digests,
+    }
+    loader = LOADER_PATH.read_text(encoding="utf-8")
+    _write_if_changed(outdir / "searchindex.js", loader + js_index.dumps(base))
+    return len(shards), written + ngrams_written
+
+
+def write_shards(app: Sphinx, exception: Optional[Exception]) -> None:
+    """Write the sharded search index to the output directory
+    (``build-finished`` handler).
+    """
+    if exception is not None or not _is_sharded(app):
+        return
+    full_index_path = Path(app.doctreedir) / FULL_INDEX_NAME
+    try:
+        with full_index_path.open(encoding="utf-8") as f:
+            index = js_index.load(f)
+    except (OSError, ValueError):
+        return
+    start = time.perf_counter()
+    count, written = write_sharded_index(
+        index, Path(app.outdir), app.config.searchshards_prefix_length
+    )
+    logger.info(
+        "sharded the search index into %d shards (%d written) in %.2fs",
+        count,
+        written,
+        time.perf_counter() - start,
+    )
+
+
+def setup(app: Sphinx) -> Dict[str, Any]:
+    """Set up the extension (Sphinx hook).
+
+    The extension replaces the ``searchindex.js`` file of HTML builds with
+    a base index, without the documents' search terms, and writes the terms
+    to shards in :file:`_static/searchindex`, grouped by the first
+    characters of the terms. The browser loads the shards of the query's
+    terms when a search runs, and the shards with partial matches of the
+    terms, from n-gram shards in :file:`_static/searchindex/ngrams`.
+    """
+    app.add_config_value("searchshards_prefix_length", 2, "", [int])
+
+    app.connect("builder-inited", redirect_search_index)
+    # Run before the stages that hash or compress the output files.
+    app.connect("build-finished", write_shards, priority=300)
+
+    return {
+        "version": __version__,
+        "parallel_read_safe": True,
+        "parallel_write_safe": True,
+    }
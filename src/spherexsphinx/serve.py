@@ -0,0 +1,328 @@
+"""Warm incremental rebuilds and a local preview server for documentation
+projects.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Optional, Set, Tuple
+
+from sphinx.application import Sphinx
+
+if sys.version_info < (3, 11):
+    import tomli as tomllib
+else:
+    import tomllib
+
+__all__ = [
+    "CONFIG_FILES",
+    "get_config_files",
+    "WarmBuilder",
+    "take_snapshot",
+    "diff_snapshots",
+    "make_server",
+    "watch",
+]
+
+EPILOG_FILE = "_rst_epilog.rst"
+"""The epilog file, which conf.py reads into ``rst_epilog`` unless
+spherexsphinx.ext.epilog is enabled.
+"""
+
+CONFIG_FILES = {"conf.py", "spherex.toml", "technote.toml", EPILOG_FILE}
+"""Files in the source directory whose changes require loading the
+configuration again (see `get_config_files`).
+"""
+
+
+def get_config_files(srcdir: Path) -> Set[str]:
+    """Get the `CONFIG_FILES` of a project whose changes require loading
+    the configuration again.
+
+    With ``[sphinx.epilog]`` enabled in :file:`spherex.toml`, the epilog
+    file isn't one of them: spherexsphinx.ext.epilog reads it at the start
+    of each build, and only the documents that use its changed definitions
+    are read again.
+    """
+    try:
+        data = tomllib.loads((srcdir / "spherex.toml").read_text())
+    except (OSError, tomllib.TOMLDecodeError):
+        return set(CONFIG_FILES)
+    if data.get("sphinx", {}).get("epilog", {}).get("enabled", False):
+        return CONFIG_FILES - {EPILOG_FILE}
+    return set(CONFIG_FILES)
+
+
+CONF_MODULES = ("spherexsphinx.conf.base", "spherexsphinx.conf.technote")
+"""Modules that load the configuration when they're imported by conf.py."""
+
+RELOAD_PATH = "/__spherex_sphinx_build__"
+"""Server path that returns the number of completed builds, which pages
+poll to reload after a build.
+"""
+
+RELOAD_SCRIPT = (
+    "<script>(function () {\n"
+    "  var build = null;\n"
+    "  setInterval(function () {\n"
+    f'    fetch("{RELOAD_PATH}", {{cache: "no-store"}})\n'
+    "      .then(function (r) { return r.text(); })\n"
+    "      .then(function (text) {\n"
+    "        if (build !== null && text !== build) location.reload();\n"
+    "        build = text;\n"
+    "      })\n"
+    "      .catch(function () {});\n"
+    "  }, 300);\n"
+    "})();</script>\n"
+)
+"""Script added to served pages to reload them after a build."""
+
+Snapshot = Dict[str, Tuple[int, int]]
+"""Modification times (in nanoseconds) and sizes of files, keyed by their
+POSIX paths relative to the source directory.
+"""
+
+
+def take_snapshot(srcdir: Path, skip_dirs: Set[Path]) -> Snapshot:
+    """Record the modification times and sizes of the files in the source
+    directory.
+
+    Hidden directories, ``_build`` directories and ``skip_dirs`` (like the
+    output directory) aren't included.
+    """
+    snapshot: Snapshot = {}
+    stack = [srcdir]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                path = Path(entry.path)
+                if entry.name != "_build" and path not in skip_dirs:
+                    stack.append(path)
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            relpath = Path(entry.path).relative_to(srcdir).as_posix()
+            snapshot[relpath] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Set[str]:
+    """Get the paths of the files that were added, changed or removed
+    between two snapshots.
+    """
+    changed = {path for path, stat in new.items() if old.get(path) != stat}
+    return changed | (set(old) - set(new))
+
+
+class WarmBuilder:
+    """Rebuilds a Sphinx project incrementally with a Sphinx application
+    that's kept loaded between builds.
+
+    Importing the configuration and extensions, and loading the saved
+    build environment, happen once. Each `build` only reads the documents
+    that changed since the previous build (as determined by Sphinx), and
+    writes the affected pages. The application is loaded again when a
+    configuration file (see `get_config_files`) changes.
+
+    Parameters
+    ----------
+    srcdir
+        The source directory, which contains :file:`conf.py`.
+    outdir
+        The output directory.
+    doctreedir
+        The doctree directory, with the saved build environment.
+    builder
+        The Sphinx builder.
+    status
+        Stream for Sphinx's status messages, or `None` to hide them.
+    warning
+        Stream for Sphinx's warnings.
+    """
+
+    def __init__(
+        self,
+        srcdir: Path,
+        outdir: Path,
+        doctreedir: Path,
+        *,
+        builder: str = "html",
+        status: Optional[IO] = sys.stdout,
+        warning: Optional[IO] = sys.stderr,
+    ) -> None:
+        self.srcdir = srcdir
+        self.outdir = outdir
+        self.doctreedir = doctreedir
+        self.builder = builder
+        self.status = status
+        self.warning = warning
+        self.app: Optional[Sphinx] = None
+        self.build_count = 0
+        """Number of completed builds."""
+
+    def load(self) -> Sphinx:
+        """Load (or reload) the Sphinx application."""
+        # conf.py imports the spherexsphinx.conf modules, which must be
+        # executed again to read the changed configuration.
+        for name in CONF_MODULES:
+            sys.modules.pop(name, None)
+        self.app = None
+        self.app = Sphinx(
+            str(self.srcdir),
+            str(self.srcdir),
+            str(self.outdir),
+            str(self.doctreedir),
+            self.builder,
+            status=self.status,
+            warning=self.warning,
+        )
+        return self.app
+
+    def build(self, changed: Optional[Set[str]] = None) -> bool:
+        """Build the project incrementally.
+
+        Parameters
+        ----------
+        changed
+            Paths of the files that changed since the previous build,
+            relative to the source directory. If a configuration file
+            changed, the application is loaded again.
+
+        Returns
+        -------
+        bool
+            Whether the build succeeded. Errors are written to the warning
+            stream, and the next build retries.
+        """
+        try:
+            if self.app is None or (
+                changed and changed & get_config_files(self.srcdir)
+            ):
+                self.load()
+            assert self.app is not None
+            self.app.build()
+        except Exception as e:
+            if self.warning is not None:
+                self.warning.write(f"build failed: {e}\n")
+            # Load the application again for the next build, since its state
+            # may be inconsistent.
+            self.app = None
+            return False
+        self.build_count += 1
+        return self.app.statuscode == 0
+
+
+class _PreviewRequestHandler(SimpleHTTPRequestHandler):
+    """Serves the output directory, adds the reload script to HTML pages,
+    and reports the build count at `RELOAD_PATH`.
+    """
+
+    builder: WarmBuilder
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path == RELOAD_PATH:
+            self._send(str(self.builder.build_count).encode(), "text/plain")
+            return
+        path = Path(self.translate_path(self.path))
+        if path.is_dir() and self.path.split("?")[0].endswith("/"):
+            path = path / "index.html"
+        if path.suffix == ".html" and path.is_file():
+            html = path.read_text(encoding="utf-8")
+            if "</body>" in html:
+                index = html.rindex("</body>")
+                html = html[:index] + RELOAD_SCRIPT + html[index:]
+            self._send(html.encode("utf-8"), "text/html; charset=utf-8")
+            return
+        super().do_GET()
+
+    def _send(self, content: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def make_server(
+    builder: WarmBuilder, host: str = "127.0.0.1", port: int = 8000
+) -> ThreadingHTTPServer:
+    """Make an HTTP server for the output of a builder, which reloads pages
+    in the browser after each build.
+
+    Call ``serve_forever`` (for example in a daemon thread) to start
+    serving.
+    """
+    handler = type(
+        "PreviewRequestHandler",
+        (_PreviewRequestHandler,),
+        {"builder": builder},
+    )
+    return ThreadingHTTPServer(
+        (host, port), partial(handler, directory=str(builder.outdir))
+    )
+
+
+def watch(
+    builder: WarmBuilder,
+    *,
+    interval: float = 0.2,
+    on_build: Optional[Callable[[Set[str], float, bool], None]] = None,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Build the project, and rebuild it whenever files in the source
+    directory change, until ``stop`` is set (or forever).
+
+    The source directory is polled every ``interval`` seconds by comparing
+    the modification times and sizes of its files.
+
+    Parameters
+    ----------
+    builder
+        The builder.
+    interval
+        Seconds between polls of the source directory.
+    on_build
+        Called after each build with the changed paths, the duration of
+        the build in seconds, and whether it succeeded.
+    stop
+        Event that stops watching.
+    """
+    skip_dirs = {builder.outdir.resolve(), builder.doctreedir.resolve()}
+    srcdir = builder.srcdir.resolve()
+    snapshot = take_snapshot(srcdir, skip_dirs)
+    changed: Set[str] = set()
+    while True:
+        start = time.perf_counter()
+        succeeded = builder.build(changed)
+        if on_build is not None:
+            on_build(changed, time.perf_counter() - start, succeeded)
+        changed = set()
+        while not changed:
+            if stop is not None and stop.wait(interval):
+                return
+            if stop is None:
+                time.sleep(interval)
+            # Changes made during a build are detected because the
+            # snapshot is taken before the build.
+            new_snapshot = take_snapshot(srcdir, skip_dirs)
+            changed = diff_snapshots(snapshot, new_snapshot)
+            snapshot = new_snapshot
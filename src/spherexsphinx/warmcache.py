@@ -0,0 +1,638 @@
+"""Archives of the build state of a documentation project, which let CI
+builds start from the state of a previous build.
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import importlib.metadata
+import io
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tarfile
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sphinx.application import ENV_PICKLE_FILENAME
+from sphinx.errors import ConfigError
+
+from . import __version__
+from .conf._utils import GitRepository, get_cache_dir, get_project_key
+from .ext.apicache import get_package_files
+from .ext.doctreecompress import decompress_pickle
+from .serve import get_config_files
+
+if sys.version_info < (3, 11):
+    import tomli as tomllib
+else:
+    import tomllib
+
+__all__ = [
+    "META_NAME",
+    "WarmCacheError",
+    "Fingerprint",
+    "RestoreResult",
+    "compute_fingerprint",
+    "get_cache_paths",
+    "save_cache",
+    "restore_cache",
+]
+
+FORMAT_VERSION = 1
+"""Version of the archive format."""
+
+META_NAME = "spherex-cache.json"
+"""Name of the metadata file in the archive."""
+
+BASE_EXTENSION_PACKAGES = (
+    "docutils",
+    "sphinx",
+    "spherexsphinx",
+    "documenteer",
+    "technote",
+    "pydata_sphinx_theme",
+    "myst_parser",
+    "myst_nb",
+    "sphinx_design",
+    "sphinx_copybutton",
+    "sphinx_autodoc_typehints",
+    "sphinx_automodapi",
+    "sphinxcontrib",
+    "sphinx_click",
+    "sphinx_prompt",
+)
+"""Top-level packages of the extensions and themes of the base and technote
+configurations.
+"""
+
+MERGED_PATHS = {"cache"}
+"""Names of the archived directories whose files are merged into the
+existing directory on restore, instead of replacing it. The cache directory
+can be shared by several projects (``SPHEREX_SPHINX_CACHE_DIR``).
+"""
+
+PROJECT_CACHE_DIRS = {"extensions", "apicache", "lastmodified"}
+"""Directories of the cache directory whose files each belong to one
+project, and are named by the project's key (see
+`spherexsphinx.conf._utils.get_project_key`).
+"""
+
+
+class WarmCacheError(Exception):
+    """Raised when a build cache archive can't be written or read."""
+
+
+@dataclass
+class Fingerprint:
+    """The fingerprint of the configuration of a documentation project,
+    which identifies the builds whose state can be reused.
+    """
+
+    digest: str
+    """SHA-256 hash of the components."""
+
+    components: Dict[str, str]
+    """The hashed values: the hashes of the configuration files, the
+    versions of the extension packages, and the repository.
+    """
+
+    commit: Optional[str] = None
+    """The Git commit checked out in the project's repository, which isn't
+    part of the digest.
+    """
+
+    @property
+    def key(self) -> str:
+        """A cache key for CI services, which starts with `prefix`."""
+        return f"{self.prefix}{self.commit or 'nocommit'}"
+
+    @property
+    def prefix(self) -> str:
+        """The prefix of the cache keys of builds with the same
+        configuration, for restoring the cache of a previous commit.
+        """
+        return f"spherex-sphinx-{self.digest[:16]}-"
+
+
+@dataclass
+class RestoreResult:
+    """The outcome of restoring a build cache archive."""
+
+    restored: bool
+    """Whether the archive was restored."""
+
+    reason: str
+    """Description of the outcome."""
+
+    commit: Optional[str] = None
+    """The Git commit of the build that saved the archive."""
+
+    unchanged: int = 0
+    """Number of source files whose content is unchanged since the build
+    that saved the archive.
+    """
+
+    changed: List[str] = field(default_factory=list)
+    """Paths of the source files that changed since the build that saved
+    the archive.
+    """
+
+
+def _get_package_versions(packages: List[str]) -> Dict[str, str]:
+    distributions = importlib.metadata.packages_distributions()
+    versions: Dict[str, str] = {}
+    for package in packages:
+        for name in distributions.get(package, []):
+            try:
+                versions[name] = importlib.metadata.version(name)
+            except importlib.metadata.PackageNotFoundError:
+                continue
+    return versions
+
+
+def _get_extension_packages(sourcedir: Path) -> List[str]:
+    packages = set(BASE_EXTENSION_PACKAGES)
+    toml_path = sourcedir / "spherex.toml"
+    if toml_path.is_file():
+        try:
+            data = tomllib.loads(toml_path.read_text())
+        except tomllib.TOMLDecodeError:
+            data = {}
+        for name in data.get("sphinx", {}).get("extensions", []):
+            packages.add(name.split(".")[0])
+    return sorted(packages)
+
+
+def compute_fingerprint(sourcedir: Path) -> Fingerprint:
+    """Compute the configuration fingerprint of a documentation project.
+
+    The fingerprint covers the content of the configuration files
+    (:file:`conf.py`, :file:`spherex.toml`, :file:`technote.toml`, and
+    :file:`_rst_epilog.rst` unless spherexsphinx.ext.epilog is enabled, see
+    `spherexsphinx.serve.get_config_files`), the Python version, the
+    installed versions of the extension packages of the configuration, and
+    the project's location in its Git repository (the ``origin`` remote and
+    the project's path).
+
+    Parameters
+    ----------
+    sourcedir
+        The project directory, which contains :file:`conf.py`.
+
+    Returns
+    -------
+    Fingerprint
+        The fingerprint, with the commit checked out in the repository.
+    """
+    sourcedir = sourcedir.resolve()
+    components: Dict[str, str] = {"format": str(FORMAT_VERSION)}
+    for name in sorted(get_config_files(sourcedir)):
+        path = sourcedir / name
+        if path.is_file():
+            components[name] = hashlib.sha256(path.read_bytes()).hexdigest()
+    components["python"] = platform.python_version()
+    for name, version in sorted(
+        _get_package_versions(_get_extension_packages(sourcedir)).items()
+    ):
+        components[f"package:{name}"] = version
+
+    commit = None
+    try:
+        repo = GitRepository(sourcedir)
+    except ConfigError:
+        pass
+    else:
+        commit = repo.head_commit
+        components["repository"] = repo.get_remote_url() or ""
+        components["path"] = sourcedir.relative_to(
+            repo.working_tree_dir
+        ).as_posix()
+
+    digest = hashlib.sha256(
+        json.dumps(components, sort_keys=True).encode()
+    ).hexdigest()
+    return Fingerprint(digest=digest, components=components, commit=commit)
+
+
+def get_cache_paths(
+    sourcedir: Path, build_dir: Optional[Path] = None
+) -> Dict[str, Path]:
+    """Get the directories of the build state of a project, keyed by their
+    names in the archive.
+
+    Parameters
+    ----------
+    sourcedir
+        The project directory.
+    build_dir
+        The build directory. Default is :file:`_build` in the project
+        directory.
+
+    Returns
+    -------
+    dict
+        The doctree directory (``doctrees``, with the pickled environment),
+        the spherex-sphinx cache directory (``cache``, with the intersphinx
+        inventories and other caches), and the bibliography caches of
+        technotes (``technote/bibfiles`` and ``technote/bibcache``).
+    """
+    sourcedir = sourcedir.resolve()
+    if build_dir is None:
+        build_dir = sourcedir / "_build"
+    return {
+        "doctrees": build_dir / "doctrees",
+        "cache": get_cache_dir(sourcedir),
+        "technote/bibfiles": sourcedir / ".technote" / "bibfiles",
+        "technote/bibcache": sourcedir / ".technote" / "bibcache",
+    }
+
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _get_source_root(sourcedir: Path) -> Path:
+    try:
+        return GitRepository(sourcedir).working_tree_dir
+    except ConfigError:
+        return sourcedir
+
+
+def _get_tracked_files(sourcedir: Path, doctreedir: Path) -> Set[Path]:
+    """Get the files whose modification times Sphinx compares to find the
+    outdated documents, from the pickled environment of a build.
+
+    These are the source files of the documents, their dependencies (like
+    included files, images and the modules of autodoc), and the source
+    files of the packages documented with sphinx-automodapi, whose content
+    hashes the API cache reuses while their modification times are
+    unchanged.
+    """
+    try:
+        data = (doctreedir / ENV_PICKLE_FILENAME).read_bytes()
+        env = pickle.loads(decompress_pickle(data))
+    except Exception as e:
+        raise WarmCacheError(
+            f"Cannot read the build environment in {doctreedir}: {e}"
+        ) from e
+    paths = {
+        sourcedir / env.doc2path(docname, False) for docname in env.found_docs
+    }
+    for dependencies in env.dependencies.values():
+        # Dependencies are relative to the source directory, or absolute.
+        paths.update(sourcedir / os.fspath(path) for path in dependencies)
+    stats = getattr(env, "apicache_stats", None)
+    for package in stats.packages if stats is not None else ():
+        paths.update(Path(path) for path in get_package_files(package) or [])
+    return paths
+
+
+def _record_sources(
+    root: Path, paths: Set[Path]
+) -> Dict[str, Tuple[str, int]]:
+    """Record the content hash and modification time of the files in the
+    working tree.
+    """
+    sources: Dict[str, Tuple[str, int]] = {}
+    for path in sorted(paths):
+        try:
+            relpath = Path(os.path.normpath(path)).relative_to(root)
+            mtime_ns = path.stat().st_mtime_ns
+            digest = _hash_file(path)
+        except (ValueError, OSError):
+            # Installed packages aren't in the working tree.
+            continue
+        sources[relpath.as_posix()] = (digest, mtime_ns)
+    return sources
+
+
+def _is_other_project_entry(name: str, project_key: str) -> bool:
+    """Check whether a path in the cache directory belongs to another
+    project that shares the cache directory.
+    """
+    parts = PurePosixPath(name).parts
+    if len(parts) == 2 and parts[0] in PROJECT_CACHE_DIRS:
+        return PurePosixPath(name).stem != project_key
+    if len(parts) == 1 and parts[0].startswith("spherex-config-"):
+        return parts[0] != f"spherex-config-{project_key}.pickle"
+    return False
+
+
+def save_cache(
+    sourcedir: Path, archive: Path, build_dir: Optional[Path] = None
+) -> Fingerprint:
+    """Write the build state of a project to an archive.
+
+    The archive is a gzipped tar file with the directories from
+    `get_cache_paths`, and a metadata file with the configuration
+    fingerprint and the content hash and modification time of each file in
+    the project's Git working tree whose modification time Sphinx checks:
+    the documents and their dependencies in the pickled environment, and
+    the source files of the packages documented with sphinx-automodapi.
+    The entries of other projects that share the cache directory aren't
+    archived.
+
+    Parameters
+    ----------
+    sourcedir
+        The project directory.
+    archive
+        Path of the archive to write.
+    build_dir
+        The build directory. Default is :file:`_build` in the project
+        directory.
+
+    Returns
+    -------
+    Fingerprint
+        The configuration fingerprint of the archive.
+
+    Raises
+    ------
+    WarmCacheError
+        Raised if the project has no doctree directory to save, or its
+        pickled environment can't be read.
+    """
+    sourcedir = sourcedir.resolve()
+    paths = get_cache_paths(sourcedir, build_dir)
+    if not paths["doctrees"].is_dir():
+        raise WarmCacheError(
+            f"Cannot find the doctree directory {paths['doctrees']}; build "
+            f"the project first."
+        )
+    fingerprint = compute_fingerprint(sourcedir)
+    root = _get_source_root(sourcedir)
+    tracked = _get_tracked_files(sourcedir, paths["doctrees"])
+    meta = {
+        "version": FORMAT_VERSION,
+        "spherex_sphinx": __version__,
+        "fingerprint": fingerprint.digest,
+        "components": fingerprint.components,
+        "commit": fingerprint.commit,
+        "sources": _record_sources(root, tracked),
+    }
+
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = archive.with_name(f"{archive.name}.{os.getpid()}.tmp")
+    try:
+        with tarfile.open(tmp_path, "w:gz") as tar:
+            # The metadata is first, so restore can check it without reading
+            # the rest of the archive.
+            data = json.dumps(meta).encode()
+            info = tarfile.TarInfo(META_NAME)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            project_key = get_project_key(sourcedir)
+
+            def select(info: tarfile.TarInfo) -> Optional[tarfile.TarInfo]:
+                cache_name = info.name.partition("/")[2]
+                if cache_name and _is_other_project_entry(
+                    cache_name, project_key
+                ):
+                    return None
+                return info
+
+            for name, path in paths.items():
+                if path.is_dir():
+                    tar.add(
+                        path,
+                        arcname=name,
+                        filter=select if name == "cache" else None,
+                    )
+        tmp_path.replace(archive)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return fingerprint
+
+
+def _read_meta(tar: tarfile.TarFile) -> Dict:
+    member = tar.next()
+    if member is None or member.name != META_NAME:
+        raise WarmCacheError(f"The archive has no {META_NAME} file.")
+    f = tar.extractfile(member)
+    if f is None:
+        raise WarmCacheError(f"Cannot read {META_NAME} in the archive.")
+    meta = json.loads(f.read())
+    if meta.get("version") != FORMAT_VERSION:
+        raise WarmCacheError(
+            f"Unsupported archive format version {meta.get('version')}."
+        )
+    return meta
+
+
+# Python versions with extraction filters warn when no filter is given.
+_FILTER: Dict[str, Any] = (
+    {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+)
+
+
+def _is_safe_member(member: tarfile.TarInfo) -> bool:
+    path = PurePosixPath(member.name)
+    return (
+        (member.isfile() or member.isdir())
+        and not path.is_absolute()
+        and ".." not in path.parts
+    )
+
+
+def _describe_mismatch(
+    previous: Dict[str, str], current: Dict[str, str]
+) -> str:
+    names = sorted(
+        name
+        for name in previous.keys() | current.keys()
+        if previous.get(name) != current.get(name)
+    )
+    return ", ".join(names)
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _move(source: Path, target: Path) -> None:
+    """Move a file or directory, copying it when the target is on another
+    filesystem.
+    """
+    try:
+        source.replace(target)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if source.is_dir():
+            shutil.copytree(source, target)
+        else:
+            shutil.copy2(source, target)
+
+
+def _install(staged: Dict[str, Tuple[Path, Path]]) -> None:
+    """Move the extracted directories into place.
+
+    Everything is first moved next to its target, on the target's
+    filesystem, and only then renamed into place. If a rename fails, the
+    previous files are put back.
+
+    Parameters
+    ----------
+    staged
+        The extracted directory and the target directory, keyed by the
+        name in the archive. The directories of `MERGED_PATHS` are merged
+        into their targets, file by file; the others replace their
+        targets.
+    """
+    suffix = f".{os.getpid()}.restore"
+    moves: List[Tuple[Path, Path]] = []
+    try:
+        for name, (source, target) in staged.items():
+            if name in MERGED_PATHS:
+                target.mkdir(parents=True, exist_ok=True)
+                staging_dir = target / f".spherex{suffix}"
+                _remove(staging_dir)
+                _move(source, staging_dir)
+                moves.extend(
+                    (path, target / path.relative_to(staging_dir))
+                    for path in sorted(staging_dir.rglob("*"))
+                    if path.is_file()
+                )
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                staging_dir = target.with_name(f".{target.name}{suffix}")
+                _remove(staging_dir)
+                _move(source, staging_dir)
+                moves.append((staging_dir, target))
+
+        backups: List[Tuple[Path, Optional[Path]]] = []
+        try:
+            for source, target in moves:
+                backup = None
+                if target.exists():
+                    backup = target.with_name(f"{target.name}{suffix}.bak")
+                    target.replace(backup)
+                backups.append((target, backup))
+                target.parent.mkdir(parents=True, exist_ok=True)
+                source.replace(target)
+        except OSError:
+            for target, backup in reversed(backups):
+                _remove(target)
+                if backup is not None:
+                    backup.replace(target)
+            raise
+        for _, backup in backups:
+            if backup is not None:
+                _remove(backup)
+    finally:
+        for name, (_, target) in staged.items():
+            if name in MERGED_PATHS:
+                staging_dir = target / f".spherex{suffix}"
+            else:
+                staging_dir = target.with_name(f".{target.name}{suffix}")
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def restore_cache(
+    sourcedir: Path, archive: Path, build_dir: Optional[Path] = None
+) -> RestoreResult:
+    """Restore the build state of a project from an archive written by
+    `save_cache`.
+
+    The archive is only restored if its configuration fingerprint matches
+    the project's current fingerprint. Otherwise, or if the archive is
+    missing or can't be read, nothing is changed and the next build is a
+    clean build.
+
+    The doctree and bibliography directories are replaced. The files of the
+    cache directory are merged into it, since other projects can share it.
+
+    After restoring the state, the modification times of the files recorded
+    by `save_cache` whose content is unchanged since the archived build are
+    set back to their times in that build. Fresh checkouts give every file
+    a new modification time, so Sphinx would otherwise read every document
+    again.
+
+    Parameters
+    ----------
+    sourcedir
+        The project directory.
+    archive
+        Path of the archive.
+    build_dir
+        The build directory. Default is :file:`_build` in the project
+        directory.
+
+    Returns
+    -------
+    RestoreResult
+        The outcome.
+    """
+    sourcedir = sourcedir.resolve()
+    if not archive.is_file():
+        return RestoreResult(False, f"no cache archive at {archive}")
+    fingerprint = compute_fingerprint(sourcedir)
+    paths = get_cache_paths(sourcedir, build_dir)
+
+    try:
+        with tarfile.open(archive, "r:gz") as tar:
+            meta = _read_meta(tar)
+            if meta["fingerprint"] != fingerprint.digest:
+                changed = _describe_mismatch(
+                    meta["components"], fingerprint.components
+                )
+                return RestoreResult(
+                    False,
+                    f"the configuration changed ({changed})",
+                    commit=meta.get("commit"),
+                )
+            # Extract to a temporary directory first, so that a damaged
+            # archive doesn't leave a partial state behind.
+            staging_parent = paths["doctrees"].parent
+            staging_parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=staging_parent) as tmp_dir:
+                for member in tar:
+                    if not _is_safe_member(member):
+                        raise WarmCacheError(
+                            f"Unsafe path in the archive: {member.name}"
+                        )
+                    tar.extract(member, tmp_dir, set_attrs=False, **_FILTER)
+                _install(
+                    {
+                        name: (Path(tmp_dir, name), path)
+                        for name, path in paths.items()
+                        if Path(tmp_dir, name).is_dir()
+                    }
+                )
+    except (OSError, ValueError, KeyError, tarfile.TarError) as e:
+        return RestoreResult(False, f"cannot read {archive}: {e}")
+    except WarmCacheError as e:
+        return RestoreResult(False, str(e))
+
+    result = RestoreResult(
+        True, "restored the build state", commit=meta.get("commit")
+    )
+    root = _get_source_root(sourcedir)
+    for relpath, (digest, mtime_ns) in meta["sources"].items():
+        path = root / relpath
+        try:
+            if _hash_file(path) != digest:
+                result.changed.append(relpath)
+                continue
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        except OSError:
+            # Deleted files are removed from the environment by Sphinx.
+            continue
+        result.unchanged += 1
+    return result
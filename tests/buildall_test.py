@@ -0,0 +1,101 @@
+"""Test building several projects with spherexsphinx.buildall."""
+
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from spherexsphinx.buildall import discover_projects, order_projects
+from spherexsphinx.cli import main
+
+ROOTS = Path(__file__).parent / "roots"
+
+
+def write_project(path: Path, base_url: str, projects: dict[str, str]) -> None:
+    """Write a minimal spherex.toml project."""
+    path.mkdir(parents=True)
+    (path / "conf.py").write_text("from spherexsphinx.conf.base import *\n")
+    lines = [
+        "[project]",
+        f'title = "{path.name}"',
+        f'base_url = "{base_url}"',
+        "",
+        "[sphinx.intersphinx.projects]",
+        *(f'{name} = "{url}"' for name, url in projects.items()),
+    ]
+    (path / "spherex.toml").write_text("\n".join(lines) + "\n")
+
+
+def test_order_projects(tmp_path: Path) -> None:
+    """Test that projects are sorted after the projects whose inventories
+    they use, and that cycles are broken.
+    """
+    write_project(
+        tmp_path / "a",
+        "https://example.org/a/",
+        {"b": "https://example.org/b"},
+    )
+    write_project(tmp_path / "b", "https://example.org/b/", {})
+    write_project(
+        tmp_path / "c" / "docs",
+        "https://example.org/c/",
+        {"a": "https://example.org/a/", "py": "https://docs.python.org/3/"},
+    )
+    write_project(
+        tmp_path / "d",
+        "https://example.org/d/",
+        {"e": "https://example.org/e/"},
+    )
+    write_project(
+        tmp_path / "e",
+        "https://example.org/e/",
+        {"d": "https://example.org/d/"},
+    )
+    # Build output isn't searched
+    write_project(
+        tmp_path / "b" / "_build" / "x", "https://example.org/x/", {}
+    )
+
+    projects = discover_projects(tmp_path)
+    assert {p.name: p.dependencies for p in projects} == {
+        "a": ["b"],
+        "b": [],
+        "c/docs": ["a"],
+        "d": ["e"],
+        "e": ["d"],
+    }
+    ordered, cyclic = order_projects(projects)
+    assert [p.name for p in ordered] == ["b", "a", "c/docs", "d", "e"]
+    assert cyclic == ["d"]
+
+
+def test_build_all(tmp_path: Path) -> None:
+    """Test building projects that share the intersphinx cache, with a
+    project that references another one.
+    """
+    shutil.copytree(ROOTS / "test-compress", tmp_path / "dep")
+    toml_path = tmp_path / "dep" / "spherex.toml"
+    toml_path.write_text(
+        toml_path.read_text().replace(
+            "[project]\n", '[project]\nbase_url = "https://example.org/dep/"\n'
+        )
+    )
+    write_project(
+        tmp_path / "main",
+        "https://example.org/main/",
+        {"dep": "https://example.org/dep/"},
+    )
+    (tmp_path / "main" / "index.rst").write_text(
+        "####\nMain\n####\n\nSee :doc:`dep:index`.\n"
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(main, ["build-all", str(tmp_path), "-j", "2"])
+    assert result.exit_code == 0, result.output
+    assert "2 succeeded, 0 failed" in result.output
+    assert "dep/_build/build-all.log" in result.output
+    html = (tmp_path / "main" / "_build" / "html" / "index.html").read_text()
+    assert 'href="https://example.org/dep/index.html"' in html
+    assert (tmp_path / "_build" / ".spherex-cache" / "intersphinx").is_dir()
@@ -0,0 +1,64 @@
+"""Test the spherex-sphinx command-line interface."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from click.testing import CliRunner
+
+from spherexsphinx.cli import main
+from spherexsphinx.ext.deploymanifest import MANIFEST_NAME
+
+
+def write_manifest(path: Path, files: dict[str, str]) -> None:
+    data = {
+        "version": 1,
+        "files": {
+            name: {"sha256": digest, "size": 1}
+            for name, digest in files.items()
+        },
+    }
+    path.mkdir(parents=True, exist_ok=True)
+    (path / MANIFEST_NAME).write_text(json.dumps(data))
+
+
+def test_deploy_diff(tmp_path: Path) -> None:
+    """Test listing the differences between deploy manifests."""
+    write_manifest(tmp_path / "old", {"a.html": "1", "b.html": "2"})
+    write_manifest(tmp_path / "new", {"a.html": "1", "c.html": "3"})
+    upload_path = tmp_path / "upload.txt"
+    delete_path = tmp_path / "delete.txt"
+
+    runner = CliRunner()
+    result = runner.invoke(
+        main,
+        [
+            "deploy-diff",
+            str(tmp_path / "old"),
+            str(tmp_path / "new"),
+            "--upload-list",
+            str(upload_path),
+            "--delete-list",
+            str(delete_path),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "A\tc.html\n" in result.output
+    assert "D\tb.html\n" in result.output
+    assert "a.html" not in result.stdout
+    assert upload_path.read_text() == f"c.html\n{MANIFEST_NAME}\n"
+    assert delete_path.read_text() == "b.html\n"
+
+
+def test_deploy_diff_missing(tmp_path: Path) -> None:
+    """Test comparing with a missing previous manifest."""
+    write_manifest(tmp_path / "new", {"a.html": "1"})
+    args = ["deploy-diff", str(tmp_path / "old"), str(tmp_path / "new")]
+
+    runner = CliRunner()
+    result = runner.invoke(main, args)
+    assert result.exit_code == 1
+    result = runner.invoke(main, [*args, "--allow-missing", "--format=json"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.stdout)["added"] == ["a.html"]
@@ -0,0 +1,98 @@
+"""Test the selection of optional extensions in
+spherexsphinx.conf._extensions.
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import IO
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.conf._extensions import scan_sources, select_extensions
+
+EXTENSIONS = [
+    "myst_parser",
+    "sphinx.ext.intersphinx",
+    "sphinx.ext.doctest",
+    "sphinx.ext.napoleon",
+    "sphinx_automodapi.automodapi",
+    "sphinx_automodapi.smart_resolver",
+    "sphinxcontrib.mermaid",
+    "sphinx_click",
+    "sphinxcontrib.bibtex",
+    "spherexsphinx.ext.bibcache",
+]
+
+
+def test_scan_sources(tmp_path: Path) -> None:
+    """Test finding directive and role names, with the scan cache."""
+    (tmp_path / "index.rst").write_text(
+        ".. automodapi:: demo\n\nSee :cite:p:`smith` and :ref:`label`.\n"
+    )
+    (tmp_path / "page.md").write_text("```{mermaid}\n```\n{doc}`index`\n")
+    (tmp_path / "_build").mkdir()
+    (tmp_path / "_build" / "out.rst").write_text(".. click:: x\n")
+    cache_path = tmp_path / "cache.json"
+
+    scan = scan_sources(tmp_path, cache_path)
+    assert scan.suffixes == {".rst", ".md"}
+    assert scan.names == {"automodapi", "cite:p", "ref", "mermaid", "doc"}
+    assert scan.scanned == 2
+
+    # Unchanged files aren't read again
+    scan = scan_sources(tmp_path, cache_path)
+    assert scan.scanned == 0
+    assert "mermaid" in scan.names
+
+    (tmp_path / "page.md").write_text("# Page\n")
+    stat = (tmp_path / "page.md").stat()
+    os.utime(tmp_path / "page.md", ns=(stat.st_atime_ns, 1))
+    scan = scan_sources(tmp_path, cache_path)
+    assert scan.scanned == 1
+    assert "mermaid" not in scan.names
+
+
+def test_select_extensions(tmp_path: Path) -> None:
+    """Test selecting extensions from the sources' names and suffixes."""
+    (tmp_path / "index.rst").write_text(
+        ".. automodapi:: demo\n\n:cite:t:`smith`\n"
+    )
+    selected = select_extensions(EXTENSIONS, tmp_path, keep=["sphinx_click"])
+    assert selected == [
+        "sphinx.ext.intersphinx",
+        "sphinx.ext.doctest",
+        "sphinx.ext.napoleon",
+        "sphinx_automodapi.automodapi",
+        "sphinx_automodapi.smart_resolver",
+        "sphinx_click",
+        "sphinxcontrib.bibtex",
+        "spherexsphinx.ext.bibcache",
+    ]
+
+    (tmp_path / "index.rst").write_text("Text\n")
+    (tmp_path / "page.md").write_text("Text\n")
+    assert select_extensions(EXTENSIONS, tmp_path) == [
+        "myst_parser",
+        "sphinx.ext.intersphinx",
+    ]
+
+
+@pytest.mark.sphinx("html", testroot="lazyextensions")
+def test_lazy_extensions(app: Sphinx, status: IO, warning: IO) -> None:
+    """Test that the base configuration only enables the extensions that the
+    sources use, and the ones in sphinx.extensions.
+    """
+    extensions = app.config.extensions
+    assert "sphinxcontrib.mermaid" in extensions
+    assert "sphinx_click" in extensions
+    assert "spherexsphinx.ext.crossref" in extensions
+    assert "myst_parser" not in extensions
+    assert "sphinx_automodapi.automodapi" not in extensions
+    assert "sphinx.ext.doctest" not in extensions
+
+    app.build()
+    html = (Path(app.outdir) / "index.html").read_text()
+    assert 'class="mermaid"' in html
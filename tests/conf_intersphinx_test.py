@@ -0,0 +1,113 @@
+"""Test the intersphinx inventory prefetch and cache."""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Iterator
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from spherexsphinx.conf._utils import SpherexConfig
+
+INVENTORY = b"# Sphinx inventory version 2\n# Project: Demo\n"
+
+
+class _Handler(SimpleHTTPRequestHandler):
+    requests: List[Tuple[str, int]] = []
+
+    def log_request(self, code: Any = "-", size: Any = "-") -> None:
+        self.requests.append((self.path, int(code)))
+
+
+@pytest.fixture
+def server(tmp_path: Path) -> Iterator[Tuple[str, Path]]:
+    """Serve a directory of inventories over HTTP on localhost."""
+    root = tmp_path / "www"
+    (root / "demo").mkdir(parents=True)
+    (root / "demo" / "objects.inv").write_bytes(INVENTORY)
+    _Handler.requests = []
+    httpd = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(_Handler, directory=str(root))
+    )
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{httpd.server_address[1]}", root
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def _apply(
+    tmp_path: Path, projects: Dict[str, str], max_age: float
+) -> Dict[str, Tuple[str, Optional[str]]]:
+    lines = [
+        '[project]\ntitle = "Demo"\n',
+        f"[sphinx.intersphinx]\nprefetch = true\nmax_age = {max_age}\n",
+        "[sphinx.intersphinx.projects]",
+        *(f'{name} = "{url}"' for name, url in projects.items()),
+    ]
+    (tmp_path / "spherex.toml").write_text("\n".join(lines) + "\n")
+    mapping: Dict[str, Tuple[str, Optional[str]]] = {}
+    SpherexConfig.load().apply_intersphinx_mapping(mapping)
+    return mapping
+
+
+def test_prefetch(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    server: Tuple[str, Path],
+) -> None:
+    """Test that inventories are prefetched into the cache, revalidated,
+    and used offline.
+    """
+    base_url, root = server
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SPHEREX_SPHINX_CACHE_DIR", "cache")
+    monkeypatch.delenv("SPHEREX_SPHINX_OFFLINE", raising=False)
+    projects = {
+        "demo": f"{base_url}/demo/",
+        "missing": f"{base_url}/missing/",
+    }
+
+    mapping = _apply(tmp_path, projects, max_age=1)
+    # Inventories that can't be fetched are omitted
+    assert list(mapping) == ["demo"]
+    url, path = mapping["demo"]
+    assert url == f"{base_url}/demo/"
+    assert path is not None
+    assert Path(path).read_bytes() == INVENTORY
+    assert Path(path).is_relative_to(tmp_path / "cache" / "intersphinx")
+    assert ("/demo/objects.inv", 200) in _Handler.requests
+
+    # A changed inventory is written to the same file
+    inventory_path = root / "demo" / "objects.inv"
+    for delay, content in ((10, INVENTORY + b"\n"), (20, INVENTORY)):
+        inventory_path.write_bytes(content)
+        mtime = time.time() + delay
+        os.utime(inventory_path, (mtime, mtime))
+        assert _apply(tmp_path, projects, max_age=0)["demo"] == (url, path)
+        assert Path(path).read_bytes() == content
+
+    # A fresh cache entry is used without a request
+    _Handler.requests.clear()
+    assert _apply(tmp_path, projects, max_age=1)["demo"] == (url, path)
+    assert ("/demo/objects.inv", 200) not in _Handler.requests
+
+    # A stale cache entry is revalidated with a conditional request
+    _Handler.requests.clear()
+    assert _apply(tmp_path, projects, max_age=0)["demo"] == (url, path)
+    assert ("/demo/objects.inv", 304) in _Handler.requests
+
+    # Offline builds only use the cache
+    (root / "demo" / "objects.inv").unlink()
+    _Handler.requests.clear()
+    monkeypatch.setenv("SPHEREX_SPHINX_OFFLINE", "1")
+    assert _apply(tmp_path, projects, max_age=0) == {"demo": (url, path)}
+    assert _Handler.requests == []
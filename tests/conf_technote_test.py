@@ -0,0 +1,32 @@
+"""Test the support module of the technote configuration."""
+
+from __future__ import annotations
+
+import pickle
+from pathlib import Path
+
+from technote.metadata.model import Status, TechnoteMetadata, TechnoteState
+
+from spherexsphinx.conf._technote import StableJinjaContext
+
+
+def _make_context(title: str = "") -> StableJinjaContext:
+    metadata = TechnoteMetadata(
+        title=title, status=Status(state=TechnoteState.stable, note=None)
+    )
+    return StableJinjaContext(metadata, Path("/tmp/technote/index.rst"))
+
+
+def test_stable_jinja_context() -> None:
+    """Test that contexts of builds with the same metadata are equal, even
+    after the title is set from the content.
+    """
+    context = _make_context()
+    previous = pickle.loads(pickle.dumps(context))
+    assert previous == _make_context()
+    assert repr(previous) == repr(_make_context())
+    assert " at 0x" not in repr(context)
+
+    context.set_content_title("From the content")
+    assert context == _make_context()
+    assert _make_context("Title") != _make_context()
@@ -2,10 +2,24 @@
 
 from __future__ import annotations
 
+import pickle
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
 import pytest
 from sphinx.errors import ConfigError
 
-from spherexsphinx.conf._utils import get_asset_path
+from spherexsphinx.conf._utils import (
+    ConfigRoot,
+    GitRepository,
+    SpherexConfig,
+    get_asset_path,
+    get_build_date,
+    get_build_year,
+    get_cache_dir,
+    get_static_asset_path,
+)
 
 
 @pytest.mark.parametrize(
@@ -23,3 +37,226 @@ def test_get_asset_path_nonexistant() -> None:
     """
     with pytest.raises(ConfigError):
         get_asset_path("nonexistant.txt")
+
+
+def test_get_static_asset_path(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that `get_static_asset_path` copies the asset to the cache
+    directory, with a path relative to the project directory.
+    """
+    monkeypatch.delenv("SPHEREX_SPHINX_CACHE_DIR", raising=False)
+    name = "spherex-favicon.png"
+    path = get_static_asset_path(name, tmp_path)
+    assert path == f"_build/.spherex-cache/assets/{name}"
+    data = Path(get_asset_path(name)).read_bytes()
+    assert (tmp_path / path).read_bytes() == data
+
+    # An outdated or partial copy is replaced.
+    (tmp_path / path).write_bytes(data[:10])
+    assert get_static_asset_path(name, tmp_path) == path
+    assert (tmp_path / path).read_bytes() == data
+    assert [p.name for p in (tmp_path / path).parent.iterdir()] == [name]
+
+    cache_dir = tmp_path.parent / "shared-cache"
+    monkeypatch.setenv("SPHEREX_SPHINX_CACHE_DIR", str(cache_dir))
+    assert get_static_asset_path(name, tmp_path) == str(
+        cache_dir.resolve() / "assets" / name
+    )
+
+
+def test_get_build_year(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the build year follows ``SOURCE_DATE_EPOCH``."""
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1600000000")
+    assert get_build_year() == 2020
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "invalid")
+    assert get_build_year() == datetime.now(tz=timezone.utc).year
+
+
+def test_get_build_date(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the build date is stable within a day."""
+    monkeypatch.delenv("SOURCE_DATE_EPOCH", raising=False)
+    date = get_build_date()
+    assert date == date.replace(hour=0, minute=0, second=0, microsecond=0)
+    assert date.date() == datetime.now(tz=timezone.utc).date()
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "1600000000")
+    assert get_build_date() == datetime(
+        2020, 9, 13, 12, 26, 40, tzinfo=timezone.utc
+    )
+
+
+def test_spherex_config_cache(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that `SpherexConfig.load` reuses the validated configuration
+    from the cache while spherex.toml is unchanged.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SPHEREX_SPHINX_CACHE_DIR", raising=False)
+    toml_path = tmp_path / "spherex.toml"
+    toml_path.write_text(
+        '[project]\ntitle = "Cached"\n\n[sphinx.intersphinx]\n'
+    )
+    assert SpherexConfig.load().config.project.title == "Cached"
+    assert get_cache_dir() == tmp_path / "_build" / ".spherex-cache"
+    cache_paths = list(get_cache_dir().glob("spherex-config-*.pickle"))
+    assert len(cache_paths) == 1
+
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("spherex.toml was validated again")
+
+    with monkeypatch.context() as m:
+        m.setattr(ConfigRoot, "model_validate", fail)
+        assert SpherexConfig.load().config.project.title == "Cached"
+
+    # Changing spherex.toml invalidates the cache
+    toml_path.write_text(
+        '[project]\ntitle = "Changed"\n\n[sphinx.intersphinx]\n'
+    )
+    assert SpherexConfig.load().config.project.title == "Changed"
+
+
+def test_spherex_config_cache_outdated(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that a cached configuration that misses fields of the current
+    models, like one written by an older editable install, isn't used.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("SPHEREX_SPHINX_CACHE_DIR", raising=False)
+    (tmp_path / "spherex.toml").write_text(
+        '[project]\ntitle = "Cached"\n\n[sphinx.intersphinx]\n'
+    )
+    SpherexConfig.load()
+    (cache_path,) = get_cache_dir().glob("spherex-config-*.pickle")
+    with cache_path.open("rb") as f:
+        key, config = pickle.load(f)
+    del config.sphinx.__dict__["profile"]
+    with cache_path.open("wb") as f:
+        pickle.dump((key, config), f)
+
+    config = SpherexConfig.load().config
+    assert config.sphinx.profile.enabled is False
+
+
+def test_spherex_config_cache_per_project(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Test that projects sharing a cache directory have their own cache
+    files.
+    """
+    monkeypatch.setenv("SPHEREX_SPHINX_CACHE_DIR", str(tmp_path / "cache"))
+    for title in ("One", "Two"):
+        project_dir = tmp_path / title
+        project_dir.mkdir()
+        (project_dir / "spherex.toml").write_text(
+            f'[project]\ntitle = "{title}"\n\n[sphinx.intersphinx]\n'
+        )
+        monkeypatch.chdir(project_dir)
+        SpherexConfig.load()
+    assert len(list((tmp_path / "cache").glob("spherex-config-*"))) == 2
+
+
+def _make_git_dir(git_dir: Path, head: str) -> None:
+    """Create a minimal Git directory with the given HEAD content."""
+    git_dir.mkdir(parents=True)
+    (git_dir / "HEAD").write_text(f"{head}\n")
+
+
+def test_git_repository(tmp_path: Path) -> None:
+    """Test finding a Git repository and its HEAD commit from a
+    subdirectory of the working tree.
+    """
+    git_dir = tmp_path / "repo" / ".git"
+    _make_git_dir(git_dir, "ref: refs/heads/main")
+    docs_dir = tmp_path / "repo" / "docs"
+    docs_dir.mkdir()
+
+    repo = GitRepository(docs_dir)
+    assert repo.working_tree_dir == tmp_path.resolve() / "repo"
+    assert repo.git_dir == git_dir.resolve()
+    assert repo.common_dir == git_dir.resolve()
+    # Unborn branch
+    assert GitRepository(docs_dir).head_commit is None
+
+    # Packed reference
+    (git_dir / "packed-refs").write_text(
+        "# pack-refs with: peeled fully-peeled sorted\n"
+        f"{'a' * 40} refs/heads/main\n"
+        f"^{'b' * 40}\n"
+    )
+    assert repo.head_commit == "a" * 40
+
+    # A loose reference takes precedence over a packed reference
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "refs" / "heads" / "main").write_text(f"{'c' * 40}\n")
+    assert repo.head_commit == "c" * 40
+
+
+def test_git_repository_remote_url(tmp_path: Path) -> None:
+    """Test reading the URL of a remote from the Git configuration."""
+    git_dir = tmp_path / "repo" / ".git"
+    _make_git_dir(git_dir, "ref: refs/heads/main")
+    repo = GitRepository(tmp_path / "repo")
+    assert repo.get_remote_url() is None
+
+    (git_dir / "config").write_text(
+        "[core]\n"
+        "\tbare = false\n"
+        '[remote "upstream"]\n'
+        "\turl = https://github.com/example/upstream.git\n"
+        '[remote "origin"]\n'
+        "\turl = git@github.com:SPHEREx/docs.git\n"
+        "\tfetch = +refs/heads/*:refs/remotes/origin/*\n"
+    )
+    assert repo.get_remote_url() == "git@github.com:SPHEREx/docs.git"
+    assert (
+        repo.get_remote_url("upstream")
+        == "https://github.com/example/upstream.git"
+    )
+    assert repo.get_remote_url("fork") is None
+
+
+def test_git_repository_worktree(tmp_path: Path) -> None:
+    """Test finding a linked worktree, which has a ``.git`` file instead of
+    a directory.
+    """
+    main_git_dir = tmp_path / "main" / ".git"
+    _make_git_dir(main_git_dir, "ref: refs/heads/main")
+    (main_git_dir / "refs" / "heads").mkdir(parents=True)
+    (main_git_dir / "refs" / "heads" / "feature").write_text(f"{'d' * 40}\n")
+    worktree_git_dir = main_git_dir / "worktrees" / "feature"
+    _make_git_dir(worktree_git_dir, "ref: refs/heads/feature")
+    (worktree_git_dir / "commondir").write_text("../..\n")
+
+    worktree_dir = tmp_path / "feature"
+    worktree_dir.mkdir()
+    (worktree_dir / ".git").write_text(f"gitdir: {worktree_git_dir}\n")
+
+    repo = GitRepository(worktree_dir)
+    assert repo.working_tree_dir == worktree_dir.resolve()
+    assert repo.git_dir == worktree_git_dir.resolve()
+    assert repo.common_dir == main_git_dir.resolve()
+    assert repo.head_commit == "d" * 40
+
+
+def test_git_repository_relative_gitdir(tmp_path: Path) -> None:
+    """Test a ``.git`` file with a relative ``gitdir`` path, as used by
+    submodules, and a detached HEAD.
+    """
+    module_git_dir = tmp_path / "super" / ".git" / "modules" / "sub"
+    _make_git_dir(module_git_dir, "e" * 40)
+    sub_dir = tmp_path / "super" / "sub"
+    sub_dir.mkdir()
+    (sub_dir / ".git").write_text("gitdir: ../.git/modules/sub\n")
+
+    repo = GitRepository(sub_dir)
+    assert repo.working_tree_dir == sub_dir.resolve()
+    assert repo.git_dir == module_git_dir.resolve()
+    assert repo.head_commit == "e" * 40
+
+
+def test_git_repository_missing(tmp_path: Path) -> None:
+    """Test that a directory outside a Git repository is a ConfigError."""
+    with pytest.raises(ConfigError):
+        GitRepository(tmp_path)
@@ -1,5 +1,8 @@
 """Pytest configuration and fixtures."""
 
+import sys
+from collections.abc import Iterator
+
 import pytest
 from sphinx.testing.path import path
 
@@ -19,3 +22,13 @@ def pytest_configure(config: pytest.Config) -> None:
 def rootdir() -> path:
     """Directory containing Sphinx projects for testing (`str`)."""
     return path(__file__).parent.abspath() / "roots"
+
+
+@pytest.fixture(autouse=True)
+def reset_conf_modules() -> Iterator[None]:
+    """Unload the spherexsphinx.conf modules so that each test project's
+    conf.py re-executes them with its own spherex.toml file.
+    """
+    yield
+    for name in ("spherexsphinx.conf.base", "spherexsphinx.conf.technote"):
+        sys.modules.pop(name, None)
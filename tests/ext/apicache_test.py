@@ -0,0 +1,57 @@
+"""Test the apicache extension."""
+
+from __future__ import annotations
+
+import sys
+from io import StringIO
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.apicache import get_apicache_stats, get_package_files
+
+
+@pytest.mark.sphinx("html", testroot="apicache")
+def test_apicache(
+    app: Sphinx,
+    status: StringIO,
+    make_app: Callable[..., Sphinx],
+) -> None:
+    """Test that the automodapi stubs are reused while the documented module
+    is unchanged, without importing it, and regenerated when it changes.
+    """
+    app.build()
+    srcdir = Path(app.srcdir)
+    assert "API cache: 0 hits, 1 misses (index.rst)" in status.getvalue()
+    assert (srcdir / "api" / "apicache_demo.greet.rst").is_file()
+
+    sys.modules.pop("apicache_demo", None)
+    status2 = StringIO()
+    app2 = make_app("html", srcdir=app.srcdir, status=status2)
+    assert "API cache: 1 hits, 0 misses (no imports)" in status2.getvalue()
+    stats = get_apicache_stats(app2)
+    assert stats is not None
+    assert stats.hits == ["index.rst"]
+    assert stats.misses == []
+    assert list(stats.packages) == ["apicache_demo"]
+    assert get_package_files("apicache_demo") == [
+        str(srcdir / "apicache_demo.py")
+    ]
+    app2.build()
+    assert "apicache_demo" not in sys.modules
+
+    module_path = srcdir / "apicache_demo.py"
+    module_path.write_text(
+        module_path.read_text().replace(
+            '__all__ = ["greet"]', '__all__ = ["greet", "wave"]'
+        )
+        + '\n\ndef wave() -> None:\n    """Wave at someone."""\n'
+    )
+    status3 = StringIO()
+    app3 = make_app("html", srcdir=app.srcdir, status=status3)
+    assert "API cache: 0 hits, 1 misses (index.rst)" in status3.getvalue()
+    assert (srcdir / "api" / "apicache_demo.wave.rst").is_file()
+    app3.build()
+    assert "wave" in (Path(app.outdir) / "index.html").read_text()
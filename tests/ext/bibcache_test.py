@@ -0,0 +1,70 @@
+"""Test the bibcache extension."""
+
+from __future__ import annotations
+
+from io import StringIO
+from pathlib import Path
+from typing import IO, Any, Callable
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.bibcache import BibDataCache
+
+
+@pytest.mark.sphinx("html", testroot="bibcache")
+def test_bibcache(
+    app: Sphinx,
+    status: StringIO,
+    warning: IO,
+    make_app: Callable[..., Sphinx],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that parsed bibliography data is reused by a build without a
+    saved environment, and invalidated when a bib file changes.
+    """
+    app.build()
+    cache_dir = Path(app.confdir) / "_build" / ".spherex-cache" / "bibtex"
+    assert len(list(cache_dir.glob("*.pickle"))) == 1
+    html = (Path(app.outdir) / "index.html").read_text()
+    assert "Cosmology with the spherex all-sky spectral survey" in html
+
+    # A fresh environment loads the bibliography from the cache
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("refs.bib was parsed again")
+
+    with monkeypatch.context() as m:
+        m.setattr("pybtex.database.input.bibtex.Parser.parse_file", fail)
+        status2 = StringIO()
+        app2 = make_app(
+            "html", srcdir=app.srcdir, freshenv=True, status=status2
+        )
+        app2.build()
+    assert "loaded 2 bibtex entries from the cache" in status2.getvalue()
+    html = (Path(app2.outdir) / "index.html").read_text()
+    assert "Cosmology with the spherex all-sky spectral survey" in html
+
+    # A changed bib file is parsed again
+    bib_path = Path(app.srcdir) / "refs.bib"
+    bib_path.write_text(bib_path.read_text().replace("SPHEREX", "SPHEREx"))
+    status3 = StringIO()
+    app3 = make_app("html", srcdir=app.srcdir, freshenv=True, status=status3)
+    app3.build()
+    assert "from the cache" not in status3.getvalue()
+    assert len(list(cache_dir.glob("*.pickle"))) == 2
+
+
+def test_bibcache_key(tmp_path: Path) -> None:
+    """Test that the cache key depends on the content of the bib files, and
+    not their paths.
+    """
+    cache = BibDataCache(tmp_path / "cache")
+    a = tmp_path / "a.bib"
+    b = tmp_path / "b.bib"
+    a.write_text("@misc{a, title={A}}\n")
+    b.write_text("@misc{a, title={A}}\n")
+    assert cache.make_key([a], "utf-8") == cache.make_key([b], "utf-8")
+    assert cache.make_key([a], "utf-8") != cache.make_key([a], "latin-1")
+    b.write_text("@misc{b, title={B}}\n")
+    assert cache.make_key([a], "utf-8") != cache.make_key([b], "utf-8")
+    assert cache.make_key([tmp_path / "missing.bib"], "utf-8") is None
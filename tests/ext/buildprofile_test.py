@@ -0,0 +1,83 @@
+"""Test the buildprofile extension."""
+
+from __future__ import annotations
+
+import csv
+import json
+from io import StringIO
+from pathlib import Path
+from typing import IO
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.buildprofile import get_document_profiles
+
+PHASES = ["startup", "read", "write", "total"]
+
+DOCNAMES = {"index", "page1", "page2", "page3", "page4", "page5", "page6"}
+
+
+@pytest.mark.sphinx("html", testroot="buildprofile")
+def test_build_profile(app: Sphinx, status: StringIO, warning: IO) -> None:
+    """Test the profile reports of a serial build."""
+    app.build()
+
+    profile_dir = Path(app.outdir).parent / "buildprofile"
+    data = json.loads((profile_dir / "buildprofile.json").read_text())
+    assert data["project"] == "Build profile"
+    assert {"startup", "read", "write", "total"} <= set(data["phases"])
+    for phase in data["phases"].values():
+        assert phase["seconds"] >= 0
+    if data["maxrss_kb"] is not None:
+        # The high-water mark at the end of each phase
+        maxrss = [data["phases"][name]["maxrss_kb"] for name in PHASES]
+        assert maxrss == sorted(maxrss)
+    documents = {d["docname"]: d for d in data["documents"]}
+    assert set(documents) == DOCNAMES
+    for document in documents.values():
+        assert document["read"] > 0
+        assert document["write"] > 0
+        if document["maxrss_kb"] is not None:
+            assert document["maxrss_delta_kb"] >= 0
+    # Sorted slowest first
+    totals = [d["total"] for d in data["documents"]]
+    assert totals == sorted(totals, reverse=True)
+
+    with (profile_dir / "buildprofile.csv").open() as f:
+        rows = list(csv.DictReader(f))
+    assert {row["docname"] for row in rows} == DOCNAMES
+
+    assert "build profile: 3 slowest pages" in status.getvalue()
+
+    # An incremental build with no changes reports no documents
+    app.build()
+    data = json.loads((profile_dir / "buildprofile.json").read_text())
+    assert data["documents"] == []
+
+
+@pytest.mark.sphinx(
+    "html",
+    testroot="buildprofile",
+    srcdir="buildprofile-parallel",
+    parallel=2,
+)
+def test_build_profile_parallel(app: Sphinx, status: IO, warning: IO) -> None:
+    """Test that the profiles of parallel readers and writers are
+    merged.
+    """
+    app.build()
+
+    assert set(get_document_profiles(app.env)) == DOCNAMES
+    profile_dir = Path(app.outdir).parent / "buildprofile"
+    data = json.loads((profile_dir / "buildprofile.json").read_text())
+    documents = {d["docname"]: d for d in data["documents"]}
+    assert set(documents) == DOCNAMES
+    for document in documents.values():
+        assert document["read"] > 0
+        assert document["write"] > 0
+    # The writer processes' records are removed after they're merged.
+    assert (
+        list((Path(app.doctreedir) / "buildprofile").glob("write-*.jsonl"))
+        == []
+    )
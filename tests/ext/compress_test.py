@@ -0,0 +1,66 @@
+"""Test the compress extension."""
+
+from __future__ import annotations
+
+import gzip
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.compress import minify_css, minify_html
+
+
+def test_minify_html() -> None:
+    """Test that HTML minification removes indentation and comments, and
+    preserves preformatted content.
+    """
+    html = (
+        "<html>\n  <body>\n    <!-- comment -->\n"
+        "    <pre>\n  keep   this\n    </pre>\n"
+        "    <script>\n      var a = 1;\n    </script>\n"
+        "    <p>Some <em>inline</em>\n      text</p>\n  </body>\n</html>\n"
+    )
+    assert minify_html(html) == (
+        "<html>\n<body>\n<pre>\n  keep   this\n    </pre>\n"
+        "<script>\n      var a = 1;\n    </script>\n"
+        "<p>Some <em>inline</em>\ntext</p>\n</body>\n</html>\n"
+    )
+
+
+def test_minify_css() -> None:
+    """Test that CSS minification removes comments and whitespace, and
+    preserves strings, license comments and descendant selectors.
+    """
+    css = (
+        "/*! license */\n/* comment */\n"
+        'a :hover , b > c {\n  content: "a , b ; }";\n  margin: 0;\n}\n'
+    )
+    assert minify_css(css) == (
+        '/*! license */ a :hover,b>c{content: "a , b ; }";margin: 0}\n'
+    )
+
+
+@pytest.mark.sphinx("html", testroot="compress")
+def test_compress(app: Sphinx, status: StringIO, warning: StringIO) -> None:
+    """Test that the HTML output is minified and precompressed, and that
+    unchanged files aren't compressed again.
+    """
+    app.build()
+    outdir = Path(app.outdir)
+    html = (outdir / "index.html").read_text()
+    assert "\n    <" not in html.split("<pre>")[0]
+    assert '</span>   <span class="s2">&quot;spaces   are   preserved' in html
+    gz_path = outdir / "index.html.gz"
+    assert gzip.decompress(gz_path.read_bytes()).decode() == html
+    css_gz_paths = list((outdir / "_static").glob("*.css.gz"))
+    assert css_gz_paths
+    assert not (outdir / "objects.inv.gz").exists()
+    assert (Path(app.doctreedir) / "compress.json").is_file()
+    assert "compressed" in status.getvalue()
+
+    mtimes = {p: p.stat().st_mtime_ns for p in [gz_path, *css_gz_paths]}
+    app.build()
+    assert {p: p.stat().st_mtime_ns for p in mtimes} == mtimes
+    assert warning.getvalue() == ""
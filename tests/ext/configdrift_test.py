@@ -0,0 +1,100 @@
+"""Test the configdrift extension."""
+
+from __future__ import annotations
+
+import shutil
+import sys
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+
+from spherexsphinx.ext.configdrift import (
+    KNOWN_CAUSES,
+    ConfigChange,
+    diff_configs,
+)
+
+
+def _make_config(**values: Any) -> Config:
+    config = Config(values)
+    config.add("drift_env", None, "env", ())
+    config.add("drift_html", None, "html", ())
+    config.add("drift_none", None, "", ())
+    return config
+
+
+def test_diff_configs() -> None:
+    """Test finding the changed values by equality."""
+    old = _make_config(copyright="2023 Caltech", drift_env=[1], drift_none="a")
+    new = _make_config(
+        copyright="2024 Caltech",
+        drift_env=[1],
+        drift_html=True,
+        drift_none="b",
+    )
+    changes = diff_configs(old, new)
+    assert changes == [
+        ConfigChange("copyright", "html", "'2023 Caltech'", "'2024 Caltech'"),
+        ConfigChange("drift_html", "html", "None", "True"),
+    ]
+    assert changes[0].cause == KNOWN_CAUSES["copyright"]
+    assert changes[1].cause is None
+    assert changes[1].format() == "drift_html (html): None -> True"
+    assert ConfigChange("x", "env", "'" + "a" * 100 + "'", None).format(
+        width=10
+    ) == ("x (env): 'aaaaaa... -> (unset)")
+
+    new.extensions = ["sphinx.ext.mathjax"]
+    assert diff_configs(old, new)[0] == ConfigChange(
+        "extensions", "env", "[]", "['sphinx.ext.mathjax']"
+    )
+
+
+def _build(make_app: Callable[..., Sphinx], srcdir: Path) -> str:
+    """Build the project as a new process would, and return the status
+    output.
+    """
+    # Extensions append to the lists of the conf.base module, so execute it
+    # again.
+    sys.modules.pop("spherexsphinx.conf.base", None)
+    status = StringIO()
+    app = make_app("html", srcdir=srcdir, status=status)
+    app.build()
+    return status.getvalue()
+
+
+def test_configdrift(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that a full rebuild lists the changed values and their causes."""
+    srcdir = tmp_path / "configdrift"
+    shutil.copytree(Path(rootdir) / "test-configdrift", srcdir)
+    _build(make_app, srcdir)
+
+    # The changes that extensions make to the configuration when the
+    # builder is initialized, like sphinx-design's static path, don't
+    # change the configuration for Sphinx.
+    output = _build(make_app, srcdir)
+    assert "configuration drift" not in output
+    assert "The configuration has changed" not in output
+
+    (srcdir / "_rst_epilog.rst").write_text(
+        ".. |mission| replace:: SPHEREx mission\n"
+    )
+    output = _build(make_app, srcdir)
+    assert (
+        "configuration drift: every document is read again because the "
+        "configuration changed:"
+    ) in output
+    assert (
+        "rst_epilog (env): '.. |mission| replace:: SPHEREx\\n' -> "
+        "'.. |mission| replace:: SPHEREx mission\\n'"
+    ) in output
+    assert KNOWN_CAUSES["rst_epilog"] in output
+    assert (
+        "SPHEREx mission"
+        in (srcdir / "_build" / "html" / "index.html").read_text()
+    )
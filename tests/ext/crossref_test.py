@@ -2,14 +2,40 @@
 
 from __future__ import annotations
 
+import zlib
+from io import StringIO
 from pathlib import Path
-from typing import IO
+from typing import IO, Any
 
 import pytest
 from bs4 import BeautifulSoup
 from sphinx.application import Sphinx
 from sphinx.util import logging
 
+from spherexsphinx.conf._intersphinx import InventoryCache
+from spherexsphinx.ext.crossref import (
+    InventoryIndex,
+    SpherexDocRegistry,
+    get_spherexdoc_references,
+    parse_inventory,
+)
+
+INVENTORY_OBJECTS = b"""\
+requirements std:label -1 reqs.html#requirements Requirements
+req-data std:label -1 reqs.html#req-data Data requirements
+user-guide/install std:doc -1 user-guide/install.html Installation
+genindex std:label -1 genindex.html Index
+spherex.Pipeline py:class 1 api.html#$ -
+"""
+
+INVENTORY_HEADER = b"""# Sphinx inventory version 2
+# Project: SSDC-MS-001
+# Version: latest
+# The remainder of this file is compressed using zlib.
+"""
+
+INVENTORY = INVENTORY_HEADER + zlib.compress(INVENTORY_OBJECTS)
+
 
 @pytest.mark.sphinx("html", testroot="crossref")
 def test_example_page_rendering(app: Sphinx, status: IO, warning: IO) -> None:
@@ -39,3 +65,174 @@ def test_example_page_rendering(app: Sphinx, status: IO, warning: IO) -> None:
         == "https://spherex-docs.ipac.caltech.edu/ssdc-ms-002"
     )
     assert custom_link.text == "Assemble Raw Data"
+
+
+@pytest.mark.sphinx("html", testroot="crossref")
+def test_spherexdoc_references(app: Sphinx, status: IO, warning: IO) -> None:
+    """Test that ``spherexdoc`` references are recorded in the build
+    environment.
+    """
+    app.builder.build_all()
+
+    assert get_spherexdoc_references(app.env) == {
+        "index": {"ssdc-ms-001", "ssdc-ms-002"}
+    }
+
+
+@pytest.mark.sphinx("html", testroot="crossref-parallel", parallel=2)
+def test_parallel_build(app: Sphinx, status: IO, warning: IO) -> None:
+    """Test that ``spherexdoc`` references collected by parallel readers
+    are merged into the main build environment.
+    """
+    assert app.is_parallel_allowed("read")
+    assert app.is_parallel_allowed("write")
+    app.builder.build_all()
+
+    references = get_spherexdoc_references(app.env)
+    assert references["index"] == {"ssdc-ms-001"}
+    for i in range(1, 7):
+        assert references[f"page{i}"] == {f"ssdc-ms-00{i}", "ssdc-ms-100"}
+
+    # Re-reading the documents replaces their recorded references
+    app.builder.build_all()
+    assert get_spherexdoc_references(app.env) == references
+
+
+@pytest.mark.sphinx("html", testroot="crossref-registry")
+def test_registry(app: Sphinx, status: IO, warning: StringIO) -> None:
+    """Test validating and titling ``spherexdoc`` references with the
+    document registry.
+    """
+    app.builder.build_all()
+
+    soup = BeautifulSoup((Path(app.outdir) / "index.html").read_text(), "lxml")
+
+    def get_link(section_id: str) -> Any:
+        section = soup.find(id=section_id)
+        assert section is not None
+        return section.select("a.external")[0]
+
+    title_link = get_link("title")
+    assert title_link.text == "Decompress Raw Data"
+    assert (
+        title_link["href"]
+        == "https://spherex-docs.ipac.caltech.edu/ssdc-ms-001"
+    )
+    assert get_link("custom-display").text == "Assembly"
+    assert get_link("unknown").text == "SSDC-MS-999"
+
+    warnings = warning.getvalue()
+    assert "Unknown SPHEREx document 'ssdc-ms-999'" in warnings
+    assert "Unknown edition '9.9' of SPHEREx document 'SSDC-MS-001'" in (
+        warnings
+    )
+    assert "'1.1'" not in warnings
+
+
+def test_registry_lookup() -> None:
+    """Test handle lookups in `SpherexDocRegistry`."""
+    registry = SpherexDocRegistry.parse(
+        b'{"documents": [{"handle": "SSDC-MS-001", "title": "Decompress"}]}'
+    )
+    assert len(registry) == 1
+    assert "ssdc-ms-001" in registry
+    document = registry.get("SSDC-ms-001")
+    assert document is not None
+    assert document.title == "Decompress"
+    assert registry.get("SSDC-MS-002") is None
+
+
+def test_inventory_index() -> None:
+    """Test parsing an inventory and looking up anchors."""
+    with pytest.raises(ValueError):
+        parse_inventory(b"not an inventory\n")
+    items = parse_inventory(INVENTORY)
+    assert items[-1].uri == "api.html#spherex.Pipeline"
+    assert items[-1].dispname == ""
+    index = InventoryIndex(items, "digest")
+
+    item = index.resolve("Requirements")
+    assert item is not None
+    assert item.uri == "reqs.html#requirements"
+    item = index.resolve("user-guide/install")
+    assert item is not None
+    assert item.dispname == "Installation"
+    assert index.resolve("spherex.Pipeline") is None
+    assert index.complete("req") == ["req-data", "requirements"]
+    assert index.suggest("requirments")[0] == "requirements"
+
+
+@pytest.mark.sphinx("html", testroot="crossref-anchors")
+def test_anchors(
+    app: Sphinx,
+    status: IO,
+    warning: StringIO,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test resolving and checking ``spherexdoc`` anchor references with a
+    cached inventory.
+    """
+    monkeypatch.setenv("SPHEREX_SPHINX_OFFLINE", "1")
+    cache = InventoryCache(
+        Path(app.confdir) / "_build" / ".spherex-cache" / "intersphinx"
+    )
+    cache.store(
+        "https://spherex-docs.ipac.caltech.edu/ssdc-ms-001/objects.inv",
+        INVENTORY,
+    )
+    app.build()
+
+    soup = BeautifulSoup((Path(app.outdir) / "index.html").read_text(), "lxml")
+
+    def get_link(section_id: str) -> Any:
+        section = soup.find(id=section_id)
+        assert section is not None
+        return section.select("a.external")[0]
+
+    base_url = "https://spherex-docs.ipac.caltech.edu"
+    label_link = get_link("label")
+    assert label_link["href"] == (
+        f"{base_url}/ssdc-ms-001/reqs.html#requirements"
+    )
+    assert label_link.text == "Requirements"
+    assert get_link("custom-display").text == "The requirements"
+    assert get_link("document")["href"] == (
+        f"{base_url}/ssdc-ms-001/user-guide/install.html"
+    )
+    assert get_link("edition")["href"] == (
+        f"{base_url}/ssdc-ms-001/reqs.html#requirements"
+    )
+    assert get_link("unknown")["href"] == f"{base_url}/ssdc-ms-001#requirments"
+    assert get_link("no-inventory")["href"] == (
+        f"{base_url}/ssdc-ms-002#overview"
+    )
+
+    warnings = warning.getvalue()
+    assert (
+        "Unknown anchor 'requirments' in SPHEREx document 'SSDC-MS-001' "
+        "(did you mean 'requirements'?)"
+    ) in warnings
+    assert "overview" not in warnings
+    assert get_spherexdoc_references(app.env)["index"] == {
+        "ssdc-ms-001#requirements",
+        "ssdc-ms-001#Requirements",
+        "ssdc-ms-001#user-guide/install",
+        "ssdc-ms-001/v/1.0#requirements",
+        "ssdc-ms-001#requirments",
+        "ssdc-ms-002#overview",
+    }
+
+    # Documents with anchor references are re-read when the inventory
+    # changes.
+    cache.store(
+        "https://spherex-docs.ipac.caltech.edu/ssdc-ms-001/objects.inv",
+        INVENTORY_HEADER
+        + zlib.compress(
+            INVENTORY_OBJECTS
+            + b"requirments std:label -1 reqs.html#typo Typo\n"
+        ),
+    )
+    warning.truncate(0)
+    warning.seek(0)
+    app.build()
+    assert "Unknown anchor" not in warning.getvalue()
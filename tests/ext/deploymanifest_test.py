@@ -0,0 +1,92 @@
+"""Test the deploymanifest extension."""
+
+from __future__ import annotations
+
+import json
+import shutil
+from io import StringIO
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.deploymanifest import (
+    MANIFEST_NAME,
+    diff_manifests,
+    get_manifest_url,
+    load_manifest,
+)
+
+
+def test_get_manifest_url() -> None:
+    """Test that URLs without a ``.json`` path are sites."""
+    manifest_url = f"https://example.org/site/{MANIFEST_NAME}"
+    assert get_manifest_url("https://example.org/site") == manifest_url
+    assert get_manifest_url("https://example.org/site/") == manifest_url
+    assert get_manifest_url(manifest_url) == manifest_url
+    assert get_manifest_url("https://example.org/m.json?v=1") == (
+        "https://example.org/m.json?v=1"
+    )
+    assert get_manifest_url("https://example.org") == (
+        f"https://example.org/{MANIFEST_NAME}"
+    )
+
+
+def test_diff_manifests() -> None:
+    """Test comparing manifests."""
+    previous = {
+        "a.html": {"sha256": "1", "size": 1},
+        "b.html": {"sha256": "2", "size": 1},
+        "c.html": {"sha256": "3", "size": 1},
+    }
+    current = {
+        "a.html": {"sha256": "1", "size": 1},
+        "b.html": {"sha256": "4", "size": 1},
+        "d.html": {"sha256": "5", "size": 1},
+    }
+    diff = diff_manifests(previous, current)
+    assert diff.added == ["d.html"]
+    assert diff.changed == ["b.html"]
+    assert diff.removed == ["c.html"]
+    assert diff.unchanged == 1
+    assert diff.upload == ["b.html", "d.html"]
+
+
+@pytest.mark.sphinx("html", testroot="deploymanifest")
+def test_deploymanifest(
+    app: Sphinx,
+    status: StringIO,
+    make_app: Callable[..., Sphinx],
+    tmp_path: Path,
+) -> None:
+    """Test that the manifest lists the output files, and that only changed
+    files are listed after an incremental build.
+    """
+    app.build()
+    outdir = Path(app.outdir)
+    data = json.loads((outdir / MANIFEST_NAME).read_text())
+    files = data["files"]
+    assert data["version"] == 1
+    assert "index.html" in files
+    assert "other.html" in files
+    assert MANIFEST_NAME not in files
+    assert ".buildinfo" not in files
+    assert not any(name.startswith("_sources/") for name in files)
+    index_size = (outdir / "index.html").stat().st_size
+    assert files["index.html"]["size"] == index_size
+    assert "wrote the deploy manifest" in status.getvalue()
+
+    previous_path = tmp_path / MANIFEST_NAME
+    shutil.copy(outdir / MANIFEST_NAME, previous_path)
+    other_path = Path(app.srcdir) / "other.rst"
+    other_path.write_text(other_path.read_text() + "\nA new paragraph.\n")
+    app2 = make_app("html", srcdir=app.srcdir, status=StringIO())
+    app2.build()
+    diff = diff_manifests(
+        load_manifest(str(previous_path)), load_manifest(str(outdir))
+    )
+    assert "other.html" in diff.changed
+    assert "index.html" not in diff.changed
+    assert diff.added == []
+    assert diff.removed == []
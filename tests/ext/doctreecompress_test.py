@@ -0,0 +1,61 @@
+"""Test the doctreecompress extension."""
+
+from __future__ import annotations
+
+import pickle
+from io import StringIO
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.doctreecompress import (
+    MAGIC,
+    compress_pickle,
+    decompress_pickle,
+    get_storage_stats,
+    read_header,
+)
+
+
+@pytest.mark.parametrize("method", ["zlib", "lzma"])
+def test_compress_pickle(method: str) -> None:
+    """Test compressing and decompressing pickled data."""
+    data = pickle.dumps(["doctree"] * 100)
+    compressed = compress_pickle(data, method, None)
+    assert compressed.startswith(MAGIC)
+    assert read_header(compressed) == (method, len(data))
+    assert len(compressed) < len(data)
+    assert decompress_pickle(compressed) == data
+    assert read_header(data) is None
+    assert decompress_pickle(data) == data
+
+
+@pytest.mark.sphinx("html", testroot="doctreecompress")
+def test_doctreecompress(
+    app: Sphinx,
+    status: StringIO,
+    make_app: Callable[..., Sphinx],
+) -> None:
+    """Test that doctrees and the environment are stored compressed, and
+    that incremental builds read them.
+    """
+    app.build()
+    doctreedir = Path(app.doctreedir)
+    for name in ("index.doctree", "other.doctree", "environment.pickle"):
+        assert (doctreedir / name).read_bytes().startswith(MAGIC)
+    stats = get_storage_stats(doctreedir)
+    assert stats.files == stats.compressed_files == 3
+    assert stats.stored_bytes < stats.raw_bytes
+    assert "doctree storage:" in status.getvalue()
+
+    other_path = Path(app.srcdir) / "other.rst"
+    other_path.write_text(other_path.read_text() + "\nA new paragraph.\n")
+    status2 = StringIO()
+    app2 = make_app("html", srcdir=app.srcdir, status=status2)
+    app2.build()
+    assert "0 added, 1 changed, 0 removed" in status2.getvalue()
+    assert "A new paragraph." in (Path(app.outdir) / "other.html").read_text()
+    # The unchanged doctree is read back for the toctree of other.html
+    assert "decompressed" in status2.getvalue()
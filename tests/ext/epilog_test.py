@@ -0,0 +1,115 @@
+"""Test the epilog extension."""
+
+from __future__ import annotations
+
+import shutil
+import sys
+from io import StringIO
+from pathlib import Path
+from typing import Callable, Dict
+
+from sphinx.application import Sphinx
+
+
+def _build(make_app: Callable[..., Sphinx], srcdir: Path) -> str:
+    """Build the project as a new process would, and return the status
+    output.
+    """
+    sys.modules.pop("spherexsphinx.conf.base", None)
+    status = StringIO()
+    app = make_app("html", srcdir=srcdir, status=status)
+    app.build()
+    return status.getvalue()
+
+
+def _doctree_times(srcdir: Path) -> Dict[str, int]:
+    return {
+        path.stem: path.stat().st_mtime_ns
+        for path in (srcdir / "_build" / "doctrees").glob("*.doctree")
+    }
+
+
+def test_epilog(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that the epilog's definitions are shared with reStructuredText
+    and MyST documents, and that changing a definition only re-reads the
+    documents that use it.
+    """
+    srcdir = tmp_path / "epilog"
+    shutil.copytree(Path(rootdir) / "test-epilog", srcdir)
+    _build(make_app, srcdir)
+    html_dir = srcdir / "_build" / "html"
+    index_html = (html_dir / "index.html").read_text()
+    assert "The SPHEREx mission" in index_html
+    assert 'href="https://spherex.caltech.edu">the mission site</a>' in (
+        index_html
+    )
+    assert 'href="other.html"><span class="doc">the other page' in (index_html)
+    other_html = (html_dir / "other.html").read_text()
+    assert "Funded by <em>NASA</em>" in other_html
+    assert 'href="https://spherex.caltech.edu">the mission site</a>' in (
+        other_html
+    )
+    myst_html = (html_dir / "myst.html").read_text()
+    assert "The SPHEREx mission, funded by <em>NASA</em>." in myst_html
+
+    times = _doctree_times(srcdir)
+    epilog_path = srcdir / "_rst_epilog.rst"
+    epilog_path.write_text(
+        epilog_path.read_text().replace("*NASA*", "*NASA* and JPL")
+    )
+    output = _build(make_app, srcdir)
+    assert "epilog: 1 changed definitions (|agency|), used by 2 documents" in (
+        output
+    )
+    new_times = _doctree_times(srcdir)
+    assert {name for name in times if new_times[name] != times[name]} == {
+        "other",
+        "myst",
+    }
+    assert (
+        "Funded by <em>NASA</em> and JPL"
+        in (html_dir / "other.html").read_text()
+    )
+    assert (
+        "funded by <em>NASA</em> and JPL."
+        in (html_dir / "myst.html").read_text()
+    )
+
+    # Changing a target re-reads the documents that link to it, directly or
+    # through a substitution.
+    epilog_path.write_text(
+        epilog_path.read_text().replace(
+            "https://spherex.caltech.edu", "https://spherex.jpl.nasa.gov"
+        )
+    )
+    output = _build(make_app, srcdir)
+    assert "used by 2 documents" in output
+    assert (
+        'href="https://spherex.jpl.nasa.gov"'
+        in (html_dir / "other.html").read_text()
+    )
+
+
+def test_epilog_other_content(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that content other than definitions is reported."""
+    srcdir = tmp_path / "epilog"
+    shutil.copytree(Path(rootdir) / "test-epilog", srcdir)
+    epilog_path = srcdir / "_rst_epilog.rst"
+    epilog_path.write_text(epilog_path.read_text() + "\nA paragraph.\n")
+    sys.modules.pop("spherexsphinx.conf.base", None)
+    warning = StringIO()
+    app = make_app("html", srcdir=srcdir, status=StringIO(), warning=warning)
+    app.build()
+    assert (
+        "_rst_epilog.rst has content other than substitution definitions "
+        "and external hyperlink targets, which isn't added to the "
+        "documents: line 10: paragraph"
+    ) in warning.getvalue()
+    assert (
+        "The SPHEREx mission"
+        in (srcdir / "_build" / "html" / "index.html").read_text()
+    )
@@ -0,0 +1,54 @@
+"""Test the fingerprint extension."""
+
+from __future__ import annotations
+
+import json
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.fingerprint import rewrite_references
+
+
+def test_rewrite_references() -> None:
+    """Test rewriting asset names in nested configuration values."""
+    names = {"logo.png": "logo.0123456789.png"}
+    value = {
+        "logo": {"image_light": "logo.png", "text": "logo.png title"},
+        "favicons": [{"href": "logo.png", "sizes": "64x64"}],
+        "css": [("logo.png", {"media": "print"})],
+    }
+    assert rewrite_references(value, names) == {
+        "logo": {
+            "image_light": "logo.0123456789.png",
+            "text": "logo.png title",
+        },
+        "favicons": [{"href": "logo.0123456789.png", "sizes": "64x64"}],
+        "css": [("logo.0123456789.png", {"media": "print"})],
+    }
+
+
+@pytest.mark.sphinx("html", testroot="fingerprint")
+def test_fingerprint(app: Sphinx, status: StringIO, warning: StringIO) -> None:
+    """Test that the spherex-sphinx assets are copied with fingerprinted
+    names, referenced from the pages, and listed in the manifest.
+    """
+    app.build()
+    outdir = Path(app.outdir)
+    manifest = json.loads((outdir / "asset-manifest.json").read_text())
+    assert set(manifest) == {
+        "_static/spherex-favicon.png",
+        "_static/spherex-logo-color-dark.png",
+        "_static/spherex-logo-color-light.png",
+    }
+    html = (outdir / "index.html").read_text()
+    for original, fingerprinted in manifest.items():
+        assert fingerprinted.startswith(original[: -len(".png")] + ".")
+        assert (outdir / fingerprinted).read_bytes() == (
+            outdir / original
+        ).read_bytes()
+        assert fingerprinted in html
+        assert f'"{original}' not in html
+    assert warning.getvalue() == ""
@@ -0,0 +1,55 @@
+"""Test the handlerprofile extension."""
+
+from __future__ import annotations
+
+import json
+from io import StringIO
+from pathlib import Path
+from typing import IO
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.handlerprofile import get_document_handler_stats
+
+
+@pytest.mark.sphinx("html", testroot="handlerprofile")
+def test_handler_profile(app: Sphinx, status: StringIO, warning: IO) -> None:
+    """Test that handler, role and directive timings are attributed to
+    extensions.
+    """
+    assert app.config.extensions[0] == "spherexsphinx.ext.handlerprofile"
+    app.build()
+
+    profile_dir = Path(app.outdir).parent / "buildprofile"
+    data = json.loads((profile_dir / "handlerprofile.json").read_text())
+    handlers = {
+        (row["extension"], row["event"]): row for row in data["handlers"]
+    }
+
+    role = handlers[("spherexsphinx.ext.crossref", "role:spherexdoc")]
+    assert role["calls"] == 2
+    assert role["seconds"] > 0
+    assert (
+        handlers[("sphinxcontrib.mermaid", "directive:mermaid")]["calls"] == 1
+    )
+    # Event handlers of the crossref extension (the registry and the
+    # inventory handlers)
+    assert (
+        handlers[("spherexsphinx.ext.crossref", "env-get-outdated")]["calls"]
+        == 2
+    )
+    # Event handlers of extensions loaded before the handlerprofile extension
+    assert any(extension.startswith("sphinx.") for extension, _ in handlers)
+
+    # Handlers of the write phase are only counted in the totals.
+    assert any(event == "missing-reference" for _, event in handlers)
+    for stats in get_document_handler_stats(app.env).values():
+        events = {event for _, event in stats}
+        assert "missing-reference" not in events
+        assert "doctree-resolved" not in events
+        assert "env-updated" not in events
+
+    assert "spherexsphinx.ext.crossref" in data["extensions"]
+    assert (profile_dir / "handlerprofile.csv").is_file()
+    assert "handler profile: 10 slowest extensions" in status.getvalue()
@@ -0,0 +1,159 @@
+"""Test the lastmodified extension."""
+
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+from io import StringIO
+from pathlib import Path
+from typing import Callable
+
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.lastmodified import LastModified, read_git_log
+
+
+def _git(repo_dir: Path, *args: str, timestamp: int = 0) -> str:
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_DATE=f"@{timestamp} +0000",
+        GIT_COMMITTER_DATE=f"@{timestamp} +0000",
+    )
+    return subprocess.run(
+        [
+            "git",
+            "-c",
+            "user.name=Test",
+            "-c",
+            "user.email=test@example.com",
+            *args,
+        ],
+        cwd=repo_dir,
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout.strip()
+
+
+def _commit(repo_dir: Path, message: str, timestamp: int) -> str:
+    _git(repo_dir, "add", "-A")
+    _git(repo_dir, "commit", "-q", "-m", message, timestamp=timestamp)
+    return _git(repo_dir, "rev-parse", "HEAD")
+
+
+def _make_repo(tmp_path: Path, rootdir: Path) -> Path:
+    repo_dir = tmp_path / "repo"
+    docs_dir = repo_dir / "docs"
+    shutil.copytree(rootdir / "test-lastmodified", docs_dir)
+    (repo_dir / ".gitignore").write_text("_build/\n")
+    _git(repo_dir, "init", "-q", "-b", "main")
+    return docs_dir
+
+
+def test_read_git_log(tmp_path: Path, rootdir: Path) -> None:
+    """Test finding the last commit of each file in one traversal."""
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    repo_dir = docs_dir.parent
+    first = _commit(repo_dir, "First", 1_600_000_000)
+    (docs_dir / "other.rst").write_text("Changed\n")
+    second = _commit(repo_dir, "Second", 1_700_000_000)
+
+    paths = read_git_log(repo_dir, "docs")
+    assert paths["docs/index.rst"] == LastModified(first, 1_600_000_000)
+    assert paths["docs/other.rst"] == LastModified(second, 1_700_000_000)
+    assert ".gitignore" not in paths
+    assert read_git_log(repo_dir, "docs", f"{first}..{second}") == {
+        "docs/other.rst": LastModified(second, 1_700_000_000)
+    }
+
+
+def test_lastmodified(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that pages show the date and commit of their last change, and
+    that new commits are read incrementally.
+    """
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    repo_dir = docs_dir.parent
+    first = _commit(repo_dir, "First", 1_600_000_000)
+    (docs_dir / "other.rst").write_text(
+        (docs_dir / "other.rst").read_text() + "\nMore text.\n"
+    )
+    second = _commit(repo_dir, "Second", 1_700_000_000)
+
+    status = StringIO()
+    app = make_app("html", srcdir=docs_dir, status=status)
+    app.build()
+    assert "last-modified dates: 4 files (read the whole history)" in (
+        status.getvalue()
+    )
+    index_html = (docs_dir / "_build" / "html" / "index.html").read_text()
+    assert "Sep 13, 2020" in index_html
+    assert f"https://github.com/SPHEREx/example/commit/{first}" in index_html
+    assert f"<code>{first[:7]}</code>" in index_html
+    other_html = (docs_dir / "_build" / "html" / "other.html").read_text()
+    assert "Nov 14, 2023" in other_html
+    assert f"<code>{second[:7]}</code>" in other_html
+    # Pages without sources don't have a date.
+    genindex_html = (
+        docs_dir / "_build" / "html" / "genindex.html"
+    ).read_text()
+    assert "spherex-last-modified" not in genindex_html
+
+    (docs_dir / "index.rst").write_text(
+        (docs_dir / "index.rst").read_text() + "\nMore text.\n"
+    )
+    third = _commit(repo_dir, "Third", 1_710_000_000)
+    status2 = StringIO()
+    app2 = make_app("html", srcdir=docs_dir, status=status2)
+    app2.build()
+    assert "last-modified dates: 4 files (1 updated from new commits)" in (
+        status2.getvalue()
+    )
+    index_html = (docs_dir / "_build" / "html" / "index.html").read_text()
+    assert f"<code>{third[:7]}</code>" in index_html
+
+
+def test_lastmodified_shallow(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that pages last changed before the history of a shallow clone
+    don't have a date.
+    """
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    repo_dir = docs_dir.parent
+    _commit(repo_dir, "First", 1_600_000_000)
+    (docs_dir / "index.rst").write_text(
+        (docs_dir / "index.rst").read_text() + "\nMore text.\n"
+    )
+    _commit(repo_dir, "Second", 1_700_000_000)
+    (docs_dir / "other.rst").write_text(
+        (docs_dir / "other.rst").read_text() + "\nMore text.\n"
+    )
+    third = _commit(repo_dir, "Third", 1_710_000_000)
+    clone_dir = tmp_path / "clone"
+    _git(tmp_path, "clone", "-q", "--depth", "2", repo_dir.as_uri(), "clone")
+    clone_docs_dir = clone_dir / "docs"
+
+    status = StringIO()
+    app = make_app("html", srcdir=clone_docs_dir, status=status)
+    app.build()
+    assert (
+        "the repository is a shallow clone, so 3 files last changed before "
+        "the fetched history have no date"
+    ) in status.getvalue()
+    outdir = clone_docs_dir / "_build" / "html"
+    # index.rst was last changed in the boundary commit, which lists every
+    # file as added.
+    assert "spherex-last-modified" not in (outdir / "index.html").read_text()
+    assert f"<code>{third[:7]}</code>" in (outdir / "other.html").read_text()
+
+    # Fetching the whole history gives the boundary files their dates.
+    _git(clone_dir, "fetch", "-q", "--unshallow")
+    status2 = StringIO()
+    app2 = make_app("html", srcdir=clone_docs_dir, status=status2)
+    app2.build()
+    assert "shallow clone" not in status2.getvalue()
+    assert "Nov 14, 2023" in (outdir / "index.html").read_text()
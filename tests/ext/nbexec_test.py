@@ -0,0 +1,95 @@
+"""Test the nbexec extension."""
+
+from __future__ import annotations
+
+import json
+import shutil
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext import nbexec
+
+
+def _edit_notebook(path: Path, cell: int, source: str) -> None:
+    notebook = json.loads(path.read_text())
+    notebook["cells"][cell]["source"] = [source]
+    path.write_text(json.dumps(notebook))
+
+
+@pytest.mark.sphinx("html", testroot="nbexec")
+def test_nbexec(app: Sphinx, status: StringIO, warning: StringIO) -> None:
+    """Test that outdated notebooks are executed in parallel into the
+    execution cache, and only notebooks with changed code cells are
+    executed again.
+    """
+    app.build()
+    assert "executing 2 outdated notebook(s) in 2 process(es)" in (
+        status.getvalue()
+    )
+    # myst-nb uses the cached notebooks instead of executing them again
+    assert "Executing notebook" not in status.getvalue()
+    assert "Using cached notebook" in status.getvalue()
+    assert "42" in (Path(app.outdir) / "first.html").read_text()
+    assert "SPHEREX" in (Path(app.outdir) / "second.html").read_text()
+    assert warning.getvalue() == ""
+
+    # Changing a markdown cell doesn't execute the notebook again
+    status.truncate(0)
+    status.seek(0)
+    _edit_notebook(Path(app.srcdir) / "first.ipynb", 0, "# First, edited")
+    app.build()
+    assert "executing" not in status.getvalue()
+    html = (Path(app.outdir) / "first.html").read_text()
+    assert "First, edited" in html
+    assert "42" in html
+
+    # Changing a code cell executes only that notebook
+    status.truncate(0)
+    status.seek(0)
+    _edit_notebook(Path(app.srcdir) / "second.ipynb", 1, "'nbexec'.upper()")
+    app.build()
+    assert "executing 1 outdated notebook(s) in 1 process(es)" in (
+        status.getvalue()
+    )
+    assert "NBEXEC" in (Path(app.outdir) / "second.html").read_text()
+
+
+def test_nbexec_kernel_failure(
+    tmp_path: Path,
+    rootdir: Path,
+    make_app: Callable[..., Sphinx],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that a notebook whose kernel fails to start is executed again
+    before myst-nb reads it.
+    """
+    srcdir = tmp_path / "nbexec"
+    shutil.copytree(Path(rootdir) / "test-nbexec", srcdir)
+    execute = nbexec.single_nb_execution
+    calls = []
+
+    def fail_first(*args: Any, **kwargs: Any) -> Any:
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("Kernel didn't respond in 60 seconds")
+        return execute(*args, **kwargs)
+
+    monkeypatch.setattr(nbexec, "single_nb_execution", fail_first)
+    status = StringIO()
+    warning = StringIO()
+    app = make_app(
+        "html",
+        srcdir=srcdir,
+        status=status,
+        warning=warning,
+        confoverrides={"nbexec_parallel": 1},
+    )
+    app.build()
+    assert len(calls) == 3
+    assert "Executing notebook" not in status.getvalue()
+    assert "42" in (Path(app.outdir) / "first.html").read_text()
+    assert warning.getvalue() == ""
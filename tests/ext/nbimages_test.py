@@ -0,0 +1,173 @@
+"""Test the nbimages extension."""
+
+from __future__ import annotations
+
+import base64
+import io
+import json
+import shutil
+from io import StringIO
+from pathlib import Path
+from typing import Callable, List
+
+import pytest
+from sphinx.application import Sphinx
+
+from spherexsphinx.ext.nbimages import ImageLimits, recompress_image
+
+# A 1x1 PNG image
+PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwAD"
+    "hgGAWjR9awAAAABJRU5ErkJggg=="
+)
+
+
+def _make_png(width: int, height: int) -> bytes:
+    """Make a PNG image with noise, which doesn't compress well."""
+    image_module = pytest.importorskip("PIL.Image")
+    image = image_module.effect_noise((width, height), 64).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+def _write_notebook(path: Path, images: List[bytes]) -> None:
+    """Write a notebook with a code cell that outputs each image."""
+    cells = [
+        {
+            "cell_type": "code",
+            "execution_count": index + 1,
+            "id": f"cell{index}",
+            "metadata": {},
+            "source": ["plot()"],
+            "outputs": [
+                {
+                    "output_type": "display_data",
+                    "metadata": {},
+                    "data": {
+                        "image/png": base64.b64encode(image).decode(),
+                        "text/plain": ["<Figure>"],
+                    },
+                }
+            ],
+        }
+        for index, image in enumerate(images)
+    ]
+    cells.insert(
+        0,
+        {
+            "cell_type": "markdown",
+            "id": "title",
+            "metadata": {},
+            "source": [f"# {path.stem.title()}"],
+        },
+    )
+    notebook = {
+        "cells": cells,
+        "metadata": {
+            "kernelspec": {
+                "display_name": "Python 3",
+                "language": "python",
+                "name": "python3",
+            }
+        },
+        "nbformat": 4,
+        "nbformat_minor": 5,
+    }
+    path.write_text(json.dumps(notebook))
+
+
+def _make_project(tmp_path: Path, rootdir: Path) -> Path:
+    srcdir = tmp_path / "nbimages"
+    shutil.copytree(rootdir / "test-nbimages", srcdir)
+    return srcdir
+
+
+def test_nbimages(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that the same output image of several notebooks is stored and
+    copied once, and that the savings are reported per notebook.
+    """
+    srcdir = _make_project(tmp_path, Path(rootdir))
+    _write_notebook(srcdir / "first.ipynb", [PIXEL_PNG])
+    _write_notebook(srcdir / "second.ipynb", [PIXEL_PNG, PIXEL_PNG])
+    status = StringIO()
+    app = make_app("html", srcdir=srcdir, status=status)
+    app.build()
+    output = status.getvalue()
+    size = len(PIXEL_PNG)
+    assert (
+        f"notebook images: first: 1 images (1 unique), {size}.0 B -> "
+        f"{size}.0 B (saved 0.0 B)"
+    ) in output
+    assert (
+        f"notebook images: second: 2 images (1 unique), {2 * size}.0 B -> "
+        f"0.0 B (saved {2 * size}.0 B)"
+    ) in output
+    assert "3 images (1 unique) in 2 notebooks" in output
+
+    images = list((srcdir / "_build" / "html" / "_images").iterdir())
+    assert len(images) == 1
+    assert images[0].read_bytes() == PIXEL_PNG
+    for name in ("first", "second"):
+        html = (srcdir / "_build" / "html" / f"{name}.html").read_text()
+        assert f"_images/{images[0].name}" in html
+
+    # Missing stored images are stored again.
+    shutil.rmtree(srcdir / "_build" / ".spherex-cache" / "nbimages")
+    status = StringIO()
+    app2 = make_app("html", srcdir=srcdir, status=status)
+    app2.build()
+    assert "notebook images: first: 1 images" in status.getvalue()
+    assert list(
+        (srcdir / "_build" / ".spherex-cache" / "nbimages").rglob("*.png")
+    )
+
+
+def test_nbimages_limits(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that oversized images are downsampled."""
+    image_module = pytest.importorskip("PIL.Image")
+    large_png = _make_png(800, 400)
+    srcdir = _make_project(tmp_path, Path(rootdir))
+    _write_notebook(srcdir / "first.ipynb", [large_png])
+    _write_notebook(srcdir / "second.ipynb", [PIXEL_PNG])
+    app = make_app(
+        "html",
+        srcdir=srcdir,
+        status=StringIO(),
+        confoverrides={"nbimages_max_width": 200},
+    )
+    app.build()
+    images = {
+        path.read_bytes()
+        for path in (srcdir / "_build" / "html" / "_images").iterdir()
+    }
+    assert PIXEL_PNG in images
+    images.remove(PIXEL_PNG)
+    with image_module.open(io.BytesIO(images.pop())) as image:
+        assert image.size == (200, 100)
+
+
+def test_recompress_image() -> None:
+    """Test that images within the limits aren't changed."""
+    pytest.importorskip("PIL.Image")
+    large_png = _make_png(300, 300)
+    assert recompress_image(large_png, ".png", ImageLimits()) == large_png
+    assert (
+        recompress_image(large_png, ".png", ImageLimits(max_width=300))
+        == large_png
+    )
+    assert recompress_image(b"<svg/>", ".svg", ImageLimits(max_width=1)) == (
+        b"<svg/>"
+    )
+    # Recompressed images are only kept if they're smaller.
+    assert len(
+        recompress_image(large_png, ".png", ImageLimits(max_bytes=1))
+    ) <= len(large_png)
+    jpeg = recompress_image(
+        large_png, ".jpeg", ImageLimits(max_width=100, jpeg_quality=50)
+    )
+    assert jpeg.startswith(b"\xff\xd8")
@@ -0,0 +1,220 @@
+"""Test the searchshards extension."""
+
+from __future__ import annotations
+
+import json
+import re
+import shutil
+import subprocess
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import pytest
+from sphinx.application import Sphinx
+from sphinx.search import js_index
+
+from spherexsphinx.ext.searchshards import (
+    get_ngrams,
+    get_shard_key,
+    shard_ngram_index,
+    shard_search_index,
+    write_sharded_index,
+)
+
+SEARCH_HARNESS = """
+const fs = require("fs");
+const path = require("path");
+const outdir = process.argv[1];
+
+// A stand-in for Sphinx's searchtools.js, with its exact and partial
+// matching of terms.
+global.Search = {
+  _index: null,
+  setIndex: (index) => { Search._index = index; },
+  _parseQuery: (query) => {
+    const terms = new Set(query.split(" ").filter((term) => term));
+    return [query, terms, new Set(), [], new Set()];
+  },
+  query: (query) => {
+    const { terms, titleterms } = Search._index;
+    const found = new Set();
+    const add = (docs) => [docs].flat().forEach((doc) => found.add(doc));
+    Search._parseQuery(query)[1].forEach((word) => {
+      const matches = [terms, titleterms].filter((t) => word in t);
+      if (matches.length === 0 && word.length > 2) {
+        [terms, titleterms].forEach((t) => Object.keys(t)
+          .filter((term) => term.includes(word))
+          .forEach((term) => add(t[term])));
+      }
+      matches.forEach((t) => add(t[word]));
+    });
+    return [...found].sort().map((doc) => Search._index.docnames[doc]);
+  },
+};
+
+// Scripts are evaluated when they're added to the page.
+global.document = {
+  currentScript: { src: "searchindex.js" },
+  createElement: () => ({}),
+  head: {
+    appendChild: (script) => {
+      const file = path.join(outdir, script.src.split("?")[0]);
+      (0, eval)(fs.readFileSync(file, "utf-8"));
+      script.onload();
+    },
+  },
+};
+
+(0, eval)(fs.readFileSync(path.join(outdir, "searchindex.js"), "utf-8"));
+(async () => {
+  const results = {};
+  for (const query of process.argv.slice(2)) {
+    const docs = await Search.query(query);
+    results[query] = { docs, terms: Object.keys(Search._index.terms).sort() };
+  }
+  console.log(JSON.stringify(results));
+})();
+"""
+"""Node.js script that runs searches with the sharded index of a site."""
+
+
+def load_shards(outdir: Path) -> Dict[str, Any]:
+    """Merge the terms of the shards in an output directory."""
+    merged: Dict[str, Any] = {"terms": {}, "titleterms": {}}
+    for path in (outdir / "_static" / "searchindex").glob("*.js"):
+        match = re.fullmatch(
+            r'Search\.addShard\("(\w+)",(.*)\)\n', path.read_text()
+        )
+        assert match is not None
+        assert match.group(1) == path.stem
+        shard = json.loads(match.group(2))
+        for field in ("terms", "titleterms"):
+            for term in shard[field]:
+                assert get_shard_key(term, 2) == path.stem
+            merged[field].update(shard[field])
+    return merged
+
+
+def test_shard_search_index() -> None:
+    """Test splitting the terms of an index into shards."""
+    index: Dict[str, Any] = {
+        "docnames": ["a", "b"],
+        "terms": {"galaxi": 0, "gas": [0, 1], "ice": 1, "é": 1},
+        "titleterms": {"galaxi": 1},
+    }
+    base, shards = shard_search_index(index, 2)
+    assert base == {"docnames": ["a", "b"], "terms": {}, "titleterms": {}}
+    assert shards == {
+        "6761": {
+            "terms": {"galaxi": 0, "gas": [0, 1]},
+            "titleterms": {"galaxi": 1},
+        },
+        "6963": {"terms": {"ice": 1}, "titleterms": {}},
+        "c3a9": {"terms": {"é": 1}, "titleterms": {}},
+    }
+    assert index["terms"]["gas"] == [0, 1]
+
+    # Shard indexes are in the sorted keys: 6761, 6963, c3a9.
+    assert shard_ngram_index(shards, 2) == {
+        "616c": {"ala": [0]},
+        "6178": {"axi": [0]},
+        "6761": {"gal": [0], "gas": [0]},
+        "6963": {"ice": [1]},
+        "6c61": {"lax": [0]},
+    }
+    assert get_ngrams("ice") == {"ice"}
+    assert get_ngrams("ic") == set()
+
+
+@pytest.mark.sphinx("html", testroot="searchshards")
+def test_searchshards(
+    app: Sphinx,
+    status: StringIO,
+    make_app: Callable[..., Sphinx],
+) -> None:
+    """Test that the search terms are written to shards, and that
+    incremental builds keep the terms of unchanged documents.
+    """
+    app.build()
+    outdir = Path(app.outdir)
+    content = (outdir / "searchindex.js").read_text()
+    assert content.startswith("/* Loads the shards")
+    base = js_index.loads(content[content.index("Search.setIndex(") :])
+    assert base["terms"] == {}
+    assert base["titleterms"] == {}
+    assert base["docnames"] == ["index", "other"]
+    assert base["shards"]["prefix"] == 2
+    assert set(base["shards"]["shards"]) == {
+        path.stem for path in (outdir / "_static" / "searchindex").glob("*.js")
+    }
+
+    merged = load_shards(outdir)
+    assert merged["terms"]["galaxi"] == 0
+    assert merged["terms"]["ic"] == 1
+    assert "other" in merged["titleterms"]
+    assert "sharded the search index" in status.getvalue()
+
+    other_path = Path(app.srcdir) / "other.rst"
+    other_path.write_text(other_path.read_text() + "\nDust grains.\n")
+    app2 = make_app("html", srcdir=app.srcdir, status=StringIO())
+    app2.build()
+    merged = load_shards(outdir)
+    assert merged["terms"]["galaxi"] == 0
+    assert merged["terms"]["grain"] == 1
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="Needs Node.js")
+@pytest.mark.sphinx("html", testroot="searchshards")
+def test_searchshards_query(app: Sphinx) -> None:
+    """Test searches in the browser with the shard loader, including
+    partial matches of terms in other shards.
+    """
+    app.build()
+    result = subprocess.run(
+        ["node", "-e", SEARCH_HARNESS, app.outdir, "galaxi", "laxi", "ic"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    results = json.loads(result.stdout)
+    assert results["galaxi"]["docs"] == ["index"]
+    # A partial match loads the shard of "galaxi" for the query.
+    assert results["laxi"]["docs"] == ["index"]
+    assert "galaxi" in results["laxi"]["terms"]
+    # Later queries only have the terms of their own shards.
+    assert results["ic"]["docs"] == ["other"]
+    assert "galaxi" not in results["ic"]["terms"]
+    assert all(
+        get_shard_key(term, 2) == get_shard_key("ic", 2)
+        for term in results["ic"]["terms"]
+    )
+
+
+def test_base_index_size(tmp_path: Path) -> None:
+    """Test that the size of the base index doesn't grow with the number
+    of terms.
+    """
+    letters = "abcdefghijklmnopqrstuvwxyz"
+
+    def get_base_size(term_count: int) -> int:
+        terms = {
+            "".join(letters[(i // 26**j + j) % 26] for j in range(8)): i % 3
+            for i in range(term_count)
+        }
+        index = {
+            "docnames": ["a", "b", "c"],
+            "terms": terms,
+            "titleterms": {},
+        }
+        outdir = tmp_path / str(term_count)
+        write_sharded_index(index, outdir, 2)
+        content = (outdir / "searchindex.js").read_text()
+        return len(content[content.index("Search.setIndex(") :])
+
+    small = get_base_size(2_000)
+    large = get_base_size(50_000)
+    # The base index has a digest for each shard and n-gram shard, and
+    # the number of 2-character prefixes is bounded.
+    assert large < 40_000
+    assert large < small * 2
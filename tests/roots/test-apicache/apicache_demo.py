@@ -0,0 +1,8 @@
+"""A module for testing the API cache."""
+
+__all__ = ["greet"]
+
+
+def greet(name: str) -> str:
+    """Greet someone."""
+    return f"Hello, {name}"
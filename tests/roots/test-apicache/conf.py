@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from spherexsphinx.conf.base import *  # noqa: E402 F401 F403
@@ -0,0 +1,3 @@
+project = "Bibliography cache"
+extensions = ["sphinxcontrib.bibtex", "spherexsphinx.ext.bibcache"]
+bibtex_bibfiles = ["refs.bib"]
@@ -0,0 +1,5 @@
+project = "Notebook execution"
+extensions = ["spherexsphinx.ext.nbexec"]
+nb_execution_mode = "cache"
+nbexec_parallel = 2
+exclude_patterns = ["_build"]
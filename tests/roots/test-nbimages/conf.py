@@ -0,0 +1,3 @@
+project = "Notebook images"
+extensions = ["myst_nb", "spherexsphinx.ext.nbimages"]
+nb_execution_mode = "off"
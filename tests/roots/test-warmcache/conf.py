@@ -0,0 +1 @@
+from spherexsphinx.conf.base import *  # noqa: F401 F403
@@ -0,0 +1,118 @@
+"""Test warm rebuilds and the preview server of spherexsphinx.serve."""
+
+from __future__ import annotations
+
+import shutil
+import threading
+import time
+import urllib.request
+from io import StringIO
+from pathlib import Path
+
+from spherexsphinx.serve import (
+    RELOAD_PATH,
+    WarmBuilder,
+    diff_snapshots,
+    get_config_files,
+    make_server,
+    take_snapshot,
+    watch,
+)
+
+ROOTS = Path(__file__).parent / "roots"
+
+
+def test_snapshots(tmp_path: Path) -> None:
+    """Test detecting changed files, ignoring build output."""
+    (tmp_path / "a.rst").write_text("a")
+    (tmp_path / "b.rst").write_text("b")
+    (tmp_path / "_build").mkdir()
+    (tmp_path / "_build" / "a.html").write_text("a")
+    before = take_snapshot(tmp_path, set())
+    assert set(before) == {"a.rst", "b.rst"}
+
+    (tmp_path / "a.rst").write_text("changed")
+    (tmp_path / "b.rst").unlink()
+    (tmp_path / "c.rst").write_text("c")
+    after = take_snapshot(tmp_path, set())
+    assert diff_snapshots(before, after) == {"a.rst", "b.rst", "c.rst"}
+
+
+def test_get_config_files(tmp_path: Path) -> None:
+    """Test that the epilog reloads the configuration unless the epilog
+    extension handles its changes.
+    """
+    assert "_rst_epilog.rst" in get_config_files(tmp_path)
+    toml_path = tmp_path / "spherex.toml"
+    toml_path.write_text("[sphinx.epilog]\nenabled = true\n")
+    assert get_config_files(tmp_path) == {
+        "conf.py",
+        "spherex.toml",
+        "technote.toml",
+    }
+
+
+def test_serve(tmp_path: Path) -> None:
+    """Test that the application is reused for rebuilds after a document
+    changes, and reloaded after the configuration changes, and that pages
+    are served with the reload script.
+    """
+    srcdir = tmp_path / "src"
+    shutil.copytree(ROOTS / "test-deploymanifest", srcdir)
+    builder = WarmBuilder(
+        srcdir,
+        srcdir / "_build" / "html",
+        srcdir / "_build" / "doctrees",
+        status=None,
+        warning=StringIO(),
+    )
+    stop = threading.Event()
+    builds: list[set[str]] = []
+    thread = threading.Thread(
+        target=watch,
+        args=(builder,),
+        kwargs={
+            "interval": 0.05,
+            "stop": stop,
+            "on_build": lambda changed, seconds, ok: builds.append(changed),
+        },
+    )
+    server = make_server(builder, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def wait_for_build(count: int) -> None:
+        deadline = time.monotonic() + 60
+        while builder.build_count < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert builder.build_count == count
+
+    thread.start()
+    try:
+        wait_for_build(1)
+        app = builder.app
+        html = urllib.request.urlopen(f"{url}/").read().decode()
+        assert RELOAD_PATH in html
+
+        other_path = srcdir / "other.rst"
+        other_path.write_text(other_path.read_text() + "\nEdited.\n")
+        wait_for_build(2)
+        assert builder.app is app
+        assert builds[-1] == {"other.rst"}
+        html = urllib.request.urlopen(f"{url}/other.html").read().decode()
+        assert "Edited." in html
+        count = urllib.request.urlopen(f"{url}{RELOAD_PATH}").read()
+        assert count == b"2"
+
+        toml_path = srcdir / "spherex.toml"
+        toml_path.write_text(
+            toml_path.read_text().replace("Deploy manifest", "Renamed")
+        )
+        wait_for_build(3)
+        assert builder.app is not app
+        html = (srcdir / "_build" / "html" / "other.html").read_text()
+        assert "Renamed" in html
+    finally:
+        stop.set()
+        thread.join()
+        server.shutdown()
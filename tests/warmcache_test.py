@@ -0,0 +1,284 @@
+"""Test saving and restoring the build state of projects."""
+
+from __future__ import annotations
+
+import errno
+import json
+import os
+import shutil
+import tarfile
+from io import StringIO
+from pathlib import Path
+from typing import Callable, List
+
+import pytest
+from click.testing import CliRunner
+from sphinx.application import Sphinx
+
+from spherexsphinx.cli import main
+from spherexsphinx.warmcache import (
+    META_NAME,
+    compute_fingerprint,
+    restore_cache,
+    save_cache,
+)
+
+
+def _make_repo(tmp_path: Path, rootdir: Path) -> Path:
+    """Copy the test-warmcache project to the docs directory of a minimal
+    Git repository.
+    """
+    git_dir = tmp_path / "repo" / ".git"
+    (git_dir / "refs" / "heads").mkdir(parents=True)
+    (git_dir / "HEAD").write_text("ref: refs/heads/main\n")
+    (git_dir / "refs" / "heads" / "main").write_text(f"{'a' * 40}\n")
+    (git_dir / "config").write_text(
+        '[remote "origin"]\n\turl = https://github.com/SPHEREx/docs.git\n'
+    )
+    docs_dir = tmp_path / "repo" / "docs"
+    shutil.copytree(rootdir / "test-warmcache", docs_dir)
+    return docs_dir
+
+
+def _touch_all(root: Path) -> None:
+    """Give all files a new modification time, like a fresh checkout."""
+    for path in root.rglob("*"):
+        if path.is_file():
+            stat = path.stat()
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**10))
+
+
+def test_fingerprint(tmp_path: Path, rootdir: Path) -> None:
+    """Test that the fingerprint covers the configuration files and the
+    repository, but not the commit.
+    """
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    fingerprint = compute_fingerprint(docs_dir)
+    assert fingerprint.commit == "a" * 40
+    assert fingerprint.key == fingerprint.prefix + "a" * 40
+    assert fingerprint.components["path"] == "docs"
+    assert (
+        fingerprint.components["repository"]
+        == "https://github.com/SPHEREx/docs.git"
+    )
+    assert fingerprint.components["package:spherex-sphinx"]
+    assert "spherex.toml" in fingerprint.components
+
+    refs_path = tmp_path / "repo" / ".git" / "refs" / "heads" / "main"
+    refs_path.write_text(f"{'b' * 40}\n")
+    (docs_dir / "index.rst").write_text("Changed\n")
+    assert compute_fingerprint(docs_dir).digest == fingerprint.digest
+
+    toml_path = docs_dir / "spherex.toml"
+    toml_path.write_text(toml_path.read_text() + "\n[sphinx.search]\n")
+    assert compute_fingerprint(docs_dir).digest != fingerprint.digest
+    fingerprint = compute_fingerprint(docs_dir)
+
+    # The epilog is configuration, unless spherexsphinx.ext.epilog handles
+    # its changes.
+    epilog_path = docs_dir / "_rst_epilog.rst"
+    epilog_path.write_text(".. |a| replace:: A\n")
+    assert compute_fingerprint(docs_dir).digest != fingerprint.digest
+    toml_path.write_text(
+        toml_path.read_text() + "\n[sphinx.epilog]\nenabled = true\n"
+    )
+    fingerprint = compute_fingerprint(docs_dir)
+    assert "_rst_epilog.rst" not in fingerprint.components
+    epilog_path.write_text(".. |a| replace:: B\n")
+    assert compute_fingerprint(docs_dir).digest == fingerprint.digest
+
+
+def test_save_restore(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that a restored build only reads the changed documents."""
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    (docs_dir / "example.py").write_text("print('example')\n")
+    with (docs_dir / "one.rst").open("a") as f:
+        f.write("\n.. literalinclude:: example.py\n")
+    (docs_dir / "data.csv").write_text("a,b\n")
+    (tmp_path / "repo" / "README.md").write_text("Repository\n")
+    app = make_app("html", srcdir=docs_dir, status=StringIO())
+    app.build()
+    archive = tmp_path / "cache.tar.gz"
+    fingerprint = save_cache(docs_dir, archive)
+    with tarfile.open(archive) as tar:
+        names = tar.getnames()
+        meta = json.load(tar.extractfile(META_NAME))  # type: ignore[arg-type]
+    assert names[0] == META_NAME
+    assert "doctrees/environment.pickle" in names
+    assert "doctrees/one.doctree" in names
+    # Only the files whose modification times Sphinx checks are recorded.
+    assert sorted(meta["sources"]) == [
+        "docs/example.py",
+        "docs/index.rst",
+        "docs/one.rst",
+        "docs/two.rst",
+    ]
+
+    # A fresh checkout of a new commit, with one changed page
+    shutil.rmtree(docs_dir / "_build")
+    _touch_all(tmp_path / "repo")
+    (docs_dir / "two.rst").write_text("###\nTwo\n###\n\nChanged.\n")
+
+    result = restore_cache(docs_dir, archive)
+    assert result.restored, result.reason
+    assert result.commit == fingerprint.commit
+    assert result.changed == ["docs/two.rst"]
+    assert (docs_dir / "_build" / "doctrees" / "environment.pickle").is_file()
+
+    status = StringIO()
+    app2 = make_app("html", srcdir=docs_dir, status=status)
+    app2.build()
+    assert "0 added, 1 changed, 0 removed" in status.getvalue()
+    assert (
+        "Changed." in (docs_dir / "_build" / "html" / "two.html").read_text()
+    )
+
+
+def test_restore_mismatch(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test that an archive with a different configuration, or a missing
+    archive, isn't restored.
+    """
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    app = make_app("html", srcdir=docs_dir, status=StringIO())
+    app.build()
+    archive = tmp_path / "cache.tar.gz"
+    save_cache(docs_dir, archive)
+    shutil.rmtree(docs_dir / "_build")
+
+    toml_path = docs_dir / "spherex.toml"
+    toml_path.write_text(toml_path.read_text() + "\n[sphinx.search]\n")
+    result = restore_cache(docs_dir, archive)
+    assert not result.restored
+    assert result.reason == "the configuration changed (spherex.toml)"
+    assert not (docs_dir / "_build").exists()
+
+    runner = CliRunner()
+    args = ["cache", "restore", str(tmp_path / "missing.tar.gz")]
+    result2 = runner.invoke(main, [*args, str(docs_dir)])
+    assert result2.exit_code == 0, result2.output
+    assert "Not restoring the build cache: no cache archive" in (
+        result2.output
+    )
+    result3 = runner.invoke(main, [*args, str(docs_dir), "--strict"])
+    assert result3.exit_code == 1
+
+
+def test_cache_cli(
+    tmp_path: Path, rootdir: Path, make_app: Callable[..., Sphinx]
+) -> None:
+    """Test the cache key, save and restore commands."""
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    runner = CliRunner()
+    archive = tmp_path / "cache.tar.gz"
+
+    result = runner.invoke(
+        main, ["cache", "save", str(archive), str(docs_dir)]
+    )
+    assert result.exit_code == 1
+    assert "build the project first" in result.output
+
+    app = make_app("html", srcdir=docs_dir, status=StringIO())
+    app.build()
+    fingerprint = compute_fingerprint(docs_dir)
+    result = runner.invoke(main, ["cache", "key", str(docs_dir)])
+    assert result.output == f"{fingerprint.key}\n"
+    result = runner.invoke(main, ["cache", "key", "--prefix", str(docs_dir)])
+    assert result.output == f"{fingerprint.prefix}\n"
+
+    result = runner.invoke(
+        main, ["cache", "save", str(archive), str(docs_dir)]
+    )
+    assert result.exit_code == 0, result.output
+    assert fingerprint.key in result.output
+    result = runner.invoke(
+        main, ["cache", "restore", str(archive), str(docs_dir)]
+    )
+    assert result.exit_code == 0, result.output
+    assert f"Restored the build state of commit {'a' * 12}" in result.output
+
+
+def test_shared_cache_dir(
+    tmp_path: Path,
+    rootdir: Path,
+    make_app: Callable[..., Sphinx],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that saving a shared cache directory only archives the
+    project's entries, and that restoring merges them into the directory.
+    """
+    cache_dir = tmp_path / "shared-cache"
+    monkeypatch.setenv("SPHEREX_SPHINX_CACHE_DIR", str(cache_dir))
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    app = make_app("html", srcdir=docs_dir, status=StringIO())
+    app.build()
+    other = cache_dir / "apicache" / f"{'0' * 16}.json"
+    other.parent.mkdir(parents=True, exist_ok=True)
+    other.write_text("{}")
+    shared = cache_dir / "intersphinx" / "shared.inv"
+    shared.parent.mkdir(parents=True, exist_ok=True)
+    shared.write_text("inventory")
+
+    archive = tmp_path / "cache.tar.gz"
+    save_cache(docs_dir, archive)
+    with tarfile.open(archive) as tar:
+        names = tar.getnames()
+    assert "cache/intersphinx/shared.inv" in names
+    assert f"cache/apicache/{'0' * 16}.json" not in names
+
+    shared.write_text("newer inventory")
+    (cache_dir / "bibtex").mkdir()
+    result = restore_cache(docs_dir, archive)
+    assert result.restored, result.reason
+    assert other.is_file()
+    assert (cache_dir / "bibtex").is_dir()
+    assert shared.read_text() == "inventory"
+    assert not list(cache_dir.glob(".spherex*"))
+
+
+def test_restore_failure(
+    tmp_path: Path,
+    rootdir: Path,
+    make_app: Callable[..., Sphinx],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test that the archive is copied when it's extracted on another
+    filesystem, and that a failed restore leaves the previous state.
+    """
+    docs_dir = _make_repo(tmp_path, Path(rootdir))
+    app = make_app("html", srcdir=docs_dir, status=StringIO())
+    app.build()
+    archive = tmp_path / "cache.tar.gz"
+    save_cache(docs_dir, archive)
+    doctrees_dir = docs_dir / "_build" / "doctrees"
+    (doctrees_dir / "previous.txt").write_text("previous")
+    cache_dir = docs_dir / "_build" / ".spherex-cache"
+    assert list((cache_dir / "assets").iterdir())
+
+    original_replace = Path.replace
+    staging_moves: List[Path] = []
+
+    def cross_device_replace(self: Path, target: Path) -> Path:
+        if ".restore" in Path(target).name and not staging_moves:
+            staging_moves.append(self)
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        if Path(target).parent == cache_dir / "assets":
+            raise OSError(errno.EIO, "Input/output error")
+        return original_replace(self, target)
+
+    monkeypatch.setattr(Path, "replace", cross_device_replace)
+    result = restore_cache(docs_dir, archive)
+    assert not result.restored
+    assert "Input/output error" in result.reason
+    assert staging_moves
+    assert (doctrees_dir / "previous.txt").read_text() == "previous"
+    assert not list(doctrees_dir.parent.glob(".*.restore*"))
+    assert not list(cache_dir.glob("**/*.restore*"))
+
+    monkeypatch.setattr(Path, "replace", original_replace)
+    result = restore_cache(docs_dir, archive)
+    assert result.restored, result.reason
+    assert not (doctrees_dir / "previous.txt").exists()